@@ -13,6 +13,8 @@ class ALUOpcode(str, Enum):
 	DEC_B = "dec_b"
 	ADD = "add"
 	EQ = "eq"
+	MUL = "mul"
+	MOD = "mod"
 
 	def __str__(self) -> str:
 		return str(self.value)
@@ -26,8 +28,27 @@ class ALU:
 		ALUOpcode.DEC_B,
 		ALUOpcode.ADD,
 		ALUOpcode.EQ,
+		ALUOpcode.MUL,
+		ALUOpcode.MOD,
 	]
 
+	# Python expressions over the A/B operands, used by the block compiler
+	expressions: typing.ClassVar[dict[ALUOpcode, str]] = {
+		ALUOpcode.INC_A: "{a} + 1",
+		ALUOpcode.INC_B: "{b} + 1",
+		ALUOpcode.DEC_A: "{a} - 1",
+		ALUOpcode.DEC_B: "{b} - 1",
+		ALUOpcode.ADD: "{a} + {b}",
+		ALUOpcode.EQ: "int({a} == {b})",
+		ALUOpcode.MUL: "{a} * {b}",
+		# A is the top of the stack: "a b mod" is the second cell modulo the top
+		ALUOpcode.MOD: "{b} % {a}",
+	}
+	# conditions the operands must meet, checked before the expression
+	checks: typing.ClassVar[dict[ALUOpcode, tuple[str, str]]] = {
+		ALUOpcode.MOD: ("{a} != 0", "Division by zero"),
+	}
+
 	def __init__(self):
 		self.result = 0
 		self.src_a = None
@@ -48,6 +69,11 @@ class ALU:
 				self.result = self.src_a + self.src_b
 			case ALUOpcode.EQ:
 				self.result = int(self.src_a == self.src_b)
+			case ALUOpcode.MUL:
+				self.result = self.src_a * self.src_b
+			case ALUOpcode.MOD:
+				assert self.src_a != 0, "Division by zero"
+				self.result = self.src_b % self.src_a
 
 	def set_details(self, src_a, src_b, operation: ALUOpcode) -> None:
 		self.src_a = src_a
@@ -55,8 +81,20 @@ class ALU:
 		self.operation = operation
 
 
+alu_opcode_mapping = {
+	OpcodeType.ADD: ALUOpcode.ADD,
+	OpcodeType.EQ: ALUOpcode.EQ,
+	OpcodeType.MUL: ALUOpcode.MUL,
+	OpcodeType.MOD: ALUOpcode.MOD,
+}
+
+
+# superinstructions taking the B operand from the instruction argument
+alu_immediate_opcode_mapping = {
+	OpcodeType.ADDI: ALUOpcode.ADD,
+	OpcodeType.EQI: ALUOpcode.EQ,
+}
+
+
 def opcode_to_alu_opcode(opcode_type: OpcodeType):
-	return {
-		OpcodeType.ADD: ALUOpcode.ADD,
-		OpcodeType.EQ: ALUOpcode.EQ,
-	}.get(opcode_type)
+	return alu_opcode_mapping.get(opcode_type)
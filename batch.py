@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from isa import read_code
+from journal import TraceLevel, Tracer
+from machine import RunMode, boot, read_tokens, simulate
+
+
+def read_manifest(manifest_path: str) -> list[dict]:
+	# list of {"name", "code", "memory", "input"}; relative paths are taken from the manifest directory
+	base = Path(manifest_path).parent
+	with open(manifest_path, encoding="utf-8") as file:
+		jobs = json.load(file)
+	for number, job in enumerate(jobs):
+		job.setdefault("name", f"job{number}")
+		for key in ("code", "memory", "input"):
+			if job.get(key) is not None:
+				job[key] = str(base / job[key])
+	return jobs
+
+
+def run_job(job: dict, mode: RunMode, limit: int, out_dir: str) -> dict:
+	control_unit, error = None, None
+	# a failing job, loading included, is reported in its result and must not stop the rest of the batch
+	try:
+		control_unit = boot(
+			read_code(job["code"]),
+			read_code(job["memory"]),
+			read_tokens(job.get("input")),
+			mode,
+			Tracer(TraceLevel.OFF, []),
+		)
+		simulate(control_unit, limit)
+	except Exception as exc:
+		error = f"{type(exc).__name__}: {exc}"
+	result = {"name": job["name"], "ticks": None, "instructions": None, "halted": False, "output": "", "error": error}
+	if control_unit is not None:
+		# same convention as the "Number of ticks" journal header
+		result["ticks"] = control_unit.tick_number - 1
+		result["instructions"] = control_unit.instruction_number
+		result["halted"] = control_unit.halted
+		result["output"] = control_unit.out_buffer
+	with open(Path(out_dir) / f"{job['name']}.json", "w", encoding="utf-8") as file:
+		json.dump(result, file)
+	return result
+
+
+def run_batch(jobs: list[dict], out_dir: str, workers: int | None = None, mode=RunMode.BLOCK, limit=1000) -> list:
+	Path(out_dir).mkdir(parents=True, exist_ok=True)
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = [executor.submit(run_job, job, mode, limit, out_dir) for job in jobs]
+		results = [future.result() for future in futures]
+	with open(Path(out_dir) / "summary.json", "w", encoding="utf-8") as file:
+		json.dump(results, file, indent=1)
+	return results
+
+
+def format_summary(results: list[dict]) -> str:
+	lines = [f"| {'name':20} | {'ticks':>10} | {'instr.':>10} | output"]
+	for result in results:
+		output = result["error"] or json.dumps(result["output"])
+		# a job that failed to load has no counters
+		ticks, instructions = ("-" if value is None else value for value in [result["ticks"], result["instructions"]])
+		lines.append(f"| {result['name']:20} | {ticks:>10} | {instructions:>10} | {output}")
+	return "\n".join(lines)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run many program/input pairs in a process pool")
+	parser.add_argument("manifest")
+	parser.add_argument("--out-dir", default="batch_results")
+	parser.add_argument("--workers", type=int, default=os.cpu_count())
+	parser.add_argument("--mode", type=RunMode, choices=[RunMode.INSTRUCTION, RunMode.BLOCK], default=RunMode.BLOCK)
+	parser.add_argument("--limit", type=int, default=1000)
+	args = parser.parse_args()
+	results = run_batch(read_manifest(args.manifest), args.out_dir, args.workers, args.mode, args.limit)
+	print(format_summary(results))
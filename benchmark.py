@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import typing
+from pathlib import Path
+
+from journal import TraceLevel, Tracer
+from machine import ControlUnit, RunMode, boot, simulate
+from translator import translate
+
+BENCHMARK_DIR = Path(__file__).parent / "benchmarks"
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+INSTRUCTION_LIMIT = 10**7
+
+
+def interrupt_stream(count: int = 400, spacing: int = 60) -> list[tuple]:
+	# one character every `spacing` ticks, then the NUL that stops cat
+	tokens = [(100 + spacing * i, chr(ord("a") + i % 26)) for i in range(count)]
+	return [*tokens, (100 + spacing * count, "\0")]
+
+
+class Workload(typing.NamedTuple):
+	name: str
+	source: str
+	tokens: list[tuple]
+	# address -> value the program must leave in data memory
+	memory: dict[int, int]
+	output_length: int
+
+	def read_source(self) -> str:
+		return (BENCHMARK_DIR / self.source).read_text(encoding="utf-8")
+
+
+workloads = [
+	# sum of even Fibonacci numbers below four million (variant prob2)
+	Workload("prob2", "prob2.fth", [], {2: 4613732}, 0),
+	Workload("strings", "strings.fth", [], {}, 64 * 92),
+	Workload("interrupts", "interrupts.fth", interrupt_stream(), {0: 1}, 401),
+	Workload("calls", "calls.fth", [], {0: 200 * 32}, 0),
+]
+
+
+def execute(workload: Workload, code: list, memory: list, mode: RunMode) -> ControlUnit:
+	control_unit = boot(code, memory, list(workload.tokens), mode, Tracer(TraceLevel.OFF, []))
+	# HALT prints "end"; keep it out of the report
+	with contextlib.redirect_stdout(io.StringIO()):
+		simulate(control_unit, INSTRUCTION_LIMIT)
+	return control_unit
+
+
+def check(workload: Workload, control_unit: ControlUnit) -> None:
+	assert control_unit.halted, f"{workload.name}: did not halt"
+	assert len(control_unit.out_buffer) == workload.output_length, f"{workload.name}: unexpected output"
+	for address, value in workload.memory.items():
+		assert control_unit.data_path.memory[address] == value, f"{workload.name}: memory[{address}] != {value}"
+
+
+def best_time(function: typing.Callable, min_time: float, repeat: int) -> float:
+	# like timeit: loops until a round takes min_time, keeps the fastest round per call
+	best = float("inf")
+	for _ in range(repeat):
+		calls, start = 0, time.perf_counter()
+		while True:
+			function()
+			calls += 1
+			elapsed = time.perf_counter() - start
+			if elapsed >= min_time:
+				break
+		best = min(best, elapsed / calls)
+	return best
+
+
+def peak_memory(function: typing.Callable) -> int:
+	tracemalloc.start()
+	try:
+		function()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def measure(workload: Workload, modes: list[RunMode], min_time: float, repeat: int) -> dict[str, float]:
+	source = workload.read_source()
+	words = len(source.split())
+	code, memory = translate(source)
+	metrics = {
+		f"{workload.name}.translate.words_per_sec": words / best_time(lambda: translate(source), min_time, repeat),
+		f"{workload.name}.translate.peak_kib": peak_memory(lambda: translate(source)) / 1024,
+	}
+	for mode in modes:
+		control_unit = execute(workload, code, memory, mode)
+		check(workload, control_unit)
+		seconds = best_time(lambda mode=mode: execute(workload, code, memory, mode), min_time, repeat)
+		prefix = f"{workload.name}.{mode.value}"
+		metrics[f"{prefix}.instructions_per_sec"] = control_unit.instruction_number / seconds
+		metrics[f"{prefix}.ticks_per_sec"] = control_unit.tick_number / seconds
+		metrics[f"{prefix}.peak_kib"] = peak_memory(lambda mode=mode: execute(workload, code, memory, mode)) / 1024
+	return metrics
+
+
+def compare(metrics: dict[str, float], baseline: dict, threshold: float, memory_threshold: float) -> list[str]:
+	# throughput may drop by `threshold`, peak memory may grow by `memory_threshold` (fractions)
+	regressions = []
+	for name, reference in baseline["metrics"].items():
+		if name not in metrics:
+			continue
+		value = metrics[name]
+		if name.endswith("_per_sec") and value < reference * (1 - threshold):
+			regressions.append(f"{name}: {value:.0f} < {reference:.0f} (-{100 * (1 - value / reference):.1f}%)")
+		if name.endswith("peak_kib") and value > reference * (1 + memory_threshold):
+			regressions.append(f"{name}: {value:.1f} > {reference:.1f} (+{100 * (value / reference - 1):.1f}%)")
+	return regressions
+
+
+def format_metrics(metrics: dict[str, float], baseline: dict | None) -> str:
+	reference = {} if baseline is None else baseline["metrics"]
+	lines = [f"{'metric':<44} {'value':>14} {'baseline':>14} {'change':>8}"]
+	for name, value in metrics.items():
+		if name in reference:
+			change = f"{100 * (value / reference[name] - 1):+.1f}%"
+			lines.append(f"{name:<44} {value:>14.1f} {reference[name]:>14.1f} {change:>8}")
+		else:
+			lines.append(f"{name:<44} {value:>14.1f} {'-':>14} {'-':>8}")
+	return "\n".join(lines)
+
+
+def main(
+	output: str,
+	baseline_path: str,
+	names: list[str] | None = None,
+	modes: list[RunMode] | None = None,
+	threshold: float = 0.25,
+	memory_threshold: float = 0.25,
+	min_time: float = 0.2,
+	repeat: int = 3,
+	update_baseline: bool = False,
+) -> int:
+	selected = [workload for workload in workloads if names is None or workload.name in names]
+	modes = list(RunMode) if modes is None else modes
+	metrics = {}
+	for workload in selected:
+		metrics.update(measure(workload, modes, min_time, repeat))
+	result = {"python": platform.python_version(), "machine": platform.machine(), "metrics": metrics}
+	with open(output, "w", encoding="utf-8") as file:
+		json.dump(result, file, indent=1)
+
+	baseline = None
+	if Path(baseline_path).exists():
+		with open(baseline_path, encoding="utf-8") as file:
+			baseline = json.load(file)
+	print(format_metrics(metrics, baseline))
+	if update_baseline:
+		with open(baseline_path, "w", encoding="utf-8") as file:
+			json.dump(result, file, indent=1)
+		return 0
+	if baseline is None:
+		return 0
+	regressions = compare(metrics, baseline, threshold, memory_threshold)
+	for regression in regressions:
+		print(f"REGRESSION {regression}", file=sys.stderr)
+	return int(bool(regressions))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Translator and emulator throughput benchmarks")
+	parser.add_argument("--output", default="benchmark.json", help="machine-readable results")
+	parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+	parser.add_argument("--workload", action="append", choices=[workload.name for workload in workloads])
+	parser.add_argument("--mode", action="append", type=RunMode, choices=list(RunMode))
+	parser.add_argument("--threshold", type=float, default=0.25, help="allowed throughput drop, fraction")
+	parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed peak memory growth, fraction")
+	parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round")
+	parser.add_argument("--repeat", type=int, default=3, help="timing rounds, the fastest is kept")
+	parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+	args = parser.parse_args()
+	sys.exit(
+		main(
+			args.output,
+			args.baseline,
+			args.workload,
+			args.mode,
+			args.threshold,
+			args.memory_threshold,
+			args.min_time,
+			args.repeat,
+			args.update_baseline,
+		)
+	)
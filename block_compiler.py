@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import typing
+
+from alu import ALU, ALUOpcode, alu_immediate_opcode_mapping, alu_opcode_mapping
+from isa import OpcodeType, code_opcodes
+
+MAX_BLOCK_SIZE = 64
+
+# never compiled: they touch PS or stop the machine, so the interpreter runs them
+interpreted_opcodes = {OpcodeType.EI, OpcodeType.DI, OpcodeType.HALT}
+branch_opcodes = {OpcodeType.JMP, OpcodeType.ZJMP, OpcodeType.NZJMP, OpcodeType.CALL, OpcodeType.RET}
+conditional_opcodes = {OpcodeType.ZJMP, OpcodeType.NZJMP}
+
+instruction_ticks = {
+	OpcodeType.NOP: 0,
+	OpcodeType.PUSH: 4,
+	OpcodeType.OMIT: 6,
+	OpcodeType.READ: 6,
+	OpcodeType.STORE: 6,
+	OpcodeType.SWAP: 3,
+	OpcodeType.DUP: 3,
+	OpcodeType.DROP: 3,
+	OpcodeType.OVER: 5,
+	OpcodeType.ROT: 6,
+	OpcodeType.LOAD: 1,
+	OpcodeType.ZJMP: 3,
+	OpcodeType.NZJMP: 3,
+	OpcodeType.JMP: 1,
+	OpcodeType.CALL: 3,
+	OpcodeType.RET: 2,
+	**{opcode_type: 4 for opcode_type in alu_opcode_mapping},
+	**{opcode_type: 2 for opcode_type in alu_immediate_opcode_mapping},
+}
+
+POP = [
+	"sp -= 1",
+	'assert 0 <= sp < dsz, "Address out of bounds"',
+	"nxt = ds[sp]",
+]
+PUSH_NEXT = [
+	'assert 0 <= sp < dsz, "Data stack overflow"',
+	"ds[sp] = nxt",
+	"sp += 1",
+]
+MEM_CHECK = 'assert 0 <= top < msz, "Address out of bounds"'
+RETURN_PUSH_CHECK = 'assert 0 <= rsp < rsz, "Return stack overflow"'
+# stack pointer checks left out for programs with proven stack bounds; memory checks
+# depend on values and always stay
+STACK_CHECKS = {POP[1], PUSH_NEXT[0], RETURN_PUSH_CHECK}
+
+templates = {
+	OpcodeType.NOP: [],
+	OpcodeType.PUSH: [*PUSH_NEXT, "nxt = top", "top = {arg}"],
+	OpcodeType.OMIT: ["cu.bus.write(top, nxt)", "top = nxt", *POP, "top = nxt", *POP],
+	OpcodeType.READ: ["port = top", "top = nxt", "sp -= 1", *PUSH_NEXT, "nxt = top", "top = cu.bus.read(port)"],
+	OpcodeType.STORE: [MEM_CHECK, "mem[top] = nxt", *POP, "top = nxt", *POP],
+	OpcodeType.SWAP: ["tmp = top", "top = nxt", "nxt = tmp"],
+	OpcodeType.DUP: [*PUSH_NEXT, "nxt = top"],
+	OpcodeType.DROP: ["top = nxt", *POP],
+	OpcodeType.OVER: [*PUSH_NEXT, "tmp = top", "top = nxt", "nxt = tmp"],
+	OpcodeType.ROT: ["sp -= 1", POP[1], "tmp = ds[sp]", "ds[sp] = nxt", "sp += 1", "nxt = top", "top = tmp"],
+	OpcodeType.LOAD: [MEM_CHECK, "top = mem[top]"],
+	OpcodeType.JMP: ["next_pc = {arg}"],
+	OpcodeType.ZJMP: [
+		"taken = top == 0",
+		"top = nxt",
+		*POP,
+		"next_pc = {arg} if taken else {pc} + 1",
+		"cu.tick_number += taken",
+	],
+	OpcodeType.NZJMP: [
+		"taken = top != 0",
+		"top = nxt",
+		*POP,
+		"next_pc = {arg} if taken else {pc} + 1",
+		"cu.tick_number += taken",
+	],
+	OpcodeType.CALL: [
+		RETURN_PUSH_CHECK,
+		"rs[rsp] = {pc}",
+		"rsp += 1",
+		"next_pc = {arg}",
+	],
+	OpcodeType.RET: ["rsp -= 1", "next_pc = rs[rsp] + 1"],
+}
+
+PROLOGUE = [
+	"ds = dp.data_stack",
+	"rs = dp.return_stack",
+	"mem = dp.memory",
+	"dsz = dp.data_stack_size",
+	"rsz = dp.return_stack_size",
+	"msz = dp.memory_size",
+	"top = dp.top",
+	"nxt = dp.next",
+	"tmp = dp.temp",
+	"sp = dp.sp",
+	"rsp = dp.rsp",
+]
+EPILOGUE = [
+	"dp.top = top",
+	"dp.next = nxt",
+	"dp.temp = tmp",
+	"dp.sp = sp",
+	"dp.rsp = rsp",
+	"dp.pc = next_pc",
+	"cu.tick_number += {ticks}",
+	"cu.instruction_number += {size}",
+]
+
+
+class Block(typing.NamedTuple):
+	entry: int
+	size: int
+	max_ticks: int
+	function: typing.Callable
+	source: str
+
+
+def alu_template(operation: ALUOpcode, immediate: bool = False) -> list[str]:
+	expression = ALU.expressions[operation].format(a="alu_a", b="alu_b")
+	checks = []
+	if operation in ALU.checks:
+		condition, message = ALU.checks[operation]
+		checks.append(f"assert {condition.format(a='alu_a', b='alu_b')}, {message!r}")
+	return [
+		"alu_a = top",
+		"alu_b = {arg}" if immediate else "alu_b = nxt",
+		*checks,
+		f"alu_op = ALUOpcode.{operation.name}",
+		f"alu_r = {expression}",
+		"top = alu_r",
+		*([] if immediate else POP),
+	]
+
+
+class BlockCompiler:
+	"""Translates straight-line runs of the predecoded program into Python functions.
+
+	A block starts at any entry PC and ends at a branch, before a leader (branch target
+	or return site), or before an instruction that must be interpreted. Generated code
+	keeps the datapath registers in locals and writes them back once per block.
+	"""
+
+	def __init__(self, opcodes: typing.Sequence[int], args: typing.Sequence[int], checked: bool = True):
+		self.opcodes = opcodes
+		self.args = args
+		self.checked = checked
+		self.leaders = self.find_leaders()
+		self.cache: dict[int, Block | None] = {}
+
+	def find_leaders(self) -> set[int]:
+		leaders = {0, 1}
+		for pc, code in enumerate(self.opcodes):
+			opcode_type = code_opcodes[code]
+			if opcode_type in branch_opcodes and opcode_type is not OpcodeType.RET:
+				leaders.add(self.args[pc])
+			if opcode_type in branch_opcodes or opcode_type in interpreted_opcodes:
+				leaders.add(pc + 1)
+		return leaders
+
+	def block_at(self, pc: int) -> Block | None:
+		if pc not in self.cache:
+			self.cache[pc] = self.compile(pc)
+		return self.cache[pc]
+
+	def compile(self, entry: int) -> Block | None:
+		lines = []
+		ticks = 0
+		pc = entry
+		uses_alu = False
+		while pc < len(self.opcodes) and pc - entry < MAX_BLOCK_SIZE:
+			opcode_type = code_opcodes[self.opcodes[pc]]
+			if opcode_type in interpreted_opcodes or opcode_type not in instruction_ticks:
+				break
+			if pc != entry and pc in self.leaders:
+				break
+			if opcode_type in alu_opcode_mapping:
+				uses_alu = True
+				template = alu_template(alu_opcode_mapping[opcode_type])
+			elif opcode_type in alu_immediate_opcode_mapping:
+				uses_alu = True
+				template = alu_template(alu_immediate_opcode_mapping[opcode_type], immediate=True)
+			else:
+				template = templates[opcode_type]
+			if not self.checked:
+				template = [line for line in template if line not in STACK_CHECKS]
+			lines += [line.format(arg=self.args[pc], pc=pc) for line in template]
+			ticks += instruction_ticks[opcode_type]
+			pc += 1
+			if opcode_type in branch_opcodes:
+				break
+
+		size = pc - entry
+		if size == 0:
+			return None
+		if code_opcodes[self.opcodes[pc - 1]] not in branch_opcodes:
+			lines.append(f"next_pc = {pc}")
+		if uses_alu:
+			lines.append("alu = dp.alu")
+			lines.append("alu.src_a, alu.src_b, alu.result, alu.operation = alu_a, alu_b, alu_r, alu_op")
+		lines += [line.format(ticks=ticks, size=size) for line in EPILOGUE]
+
+		name = f"block_{entry}"
+		source = f"def {name}(cu, dp):\n" + "".join(f"\t{line}\n" for line in [*PROLOGUE, *lines])
+		namespace = {"ALUOpcode": ALUOpcode}
+		exec(compile(source, f"<{name}>", "exec"), namespace)
+		max_ticks = ticks + int(code_opcodes[self.opcodes[pc - 1]] in conditional_opcodes)
+		return Block(entry, size, max_ticks, namespace[name], source)
+
+
+class BlockEngine:
+	def __init__(self, control_unit, limit: int, tick_limit: int | None = None):
+		self.control_unit = control_unit
+		self.limit = limit
+		self.tick_limit = tick_limit
+		self.compiler = BlockCompiler(control_unit.opcodes, control_unit.args, control_unit.checked)
+
+	def step(self) -> None:
+		control_unit = self.control_unit
+		block = self.compiler.block_at(control_unit.data_path.pc)
+		if block is None or not self.fits(block):
+			control_unit.fetch_single_command()
+		else:
+			block.function(control_unit, control_unit.data_path)
+
+	def fits(self, block: Block) -> bool:
+		# a block runs only if no interrupt, instruction limit or tick limit can land inside it
+		control_unit = self.control_unit
+		end_tick = control_unit.tick_number + block.max_ticks
+		if control_unit.instruction_number + block.size > self.limit:
+			return False
+		if self.tick_limit is not None and end_tick >= self.tick_limit:
+			return False
+		return not control_unit.interrupt_possible(end_tick)
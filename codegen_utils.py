@@ -1,82 +1,96 @@
 from __future__ import annotations
 
 from isa import Opcode, OpcodeParam, OpcodeParamType, OpcodeType, TermType
+from runtime_library import routine_call
 
 
 class Terminal:
-	def __init__(self, word_number: int, term_type: TermType | None, word: str):
+	# one per source word, all alive until linking: no per-instance __dict__
+	__slots__ = ("column", "converted", "line", "term_type", "word", "word_number")
+
+	def __init__(
+		self,
+		word_number: int,
+		term_type: TermType | None,
+		word: str,
+		line: int | None = None,
+		column: int | None = None,
+	):
 		self.converted = False
-		self.operand = None
 		self.word_number = word_number
 		self.term_type = term_type
 		self.word = word
+		self.line = line
+		self.column = column
 
 
-def codegen_print(term: Terminal, string_current_address, data_memory) -> (list[Opcode], int):
-	if term.converted:
-		opcodes = []
-	elif term.term_type is not TermType.STRING:
-		opcodes = [Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, term.word)])]
-	else:
-		opcodes = []
-		start_string = string_current_address
-		content = term.word[2:-1]
-		for i in range(len(content)):
-			data_memory[string_current_address] = ord(content[i])
-			string_current_address += 1
-		data_memory[string_current_address] = 0
-		string_current_address += 1
-
-		opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, start_string)]))
-		opcodes.append(Opcode(OpcodeType.DUP, []))
-		opcodes.append(Opcode(OpcodeType.LOAD, []))
-		opcodes.append(Opcode(OpcodeType.DUP, []))
-		opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]))
-		opcodes.append(Opcode(OpcodeType.OMIT, []))
-		opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]))
-		opcodes.append(Opcode(OpcodeType.EQ, []))
-		opcodes.append(Opcode(OpcodeType.SWAP, []))
-		opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 1)]))
-		opcodes.append(Opcode(OpcodeType.ADD, []))
-		opcodes.append(Opcode(OpcodeType.SWAP, []))
-		opcodes.append(Opcode(OpcodeType.ZJMP, [OpcodeParam(OpcodeParamType.ADDR_REL, -11)]))
+term_opcode_types = {
+	TermType.ADD: [OpcodeType.ADD],
+	TermType.DI: [OpcodeType.DI],
+	TermType.EI: [OpcodeType.EI],
+	TermType.DUP: [OpcodeType.DUP],
+	TermType.DROP: [OpcodeType.DROP],
+	TermType.OVER: [OpcodeType.OVER],
+	TermType.ROT: [OpcodeType.ROT],
+	TermType.SWAP: [OpcodeType.SWAP],
+	TermType.MUL: [OpcodeType.MUL],
+	TermType.MOD: [OpcodeType.MOD],
+	TermType.OMIT: [OpcodeType.OMIT],
+	TermType.EQ: [OpcodeType.EQ],
+	TermType.READ: [OpcodeType.READ],
+	TermType.VARIABLE: [],
+	TermType.ALLOT: [],
+	TermType.STORE: [OpcodeType.STORE],
+	TermType.LOAD: [OpcodeType.LOAD],
+	TermType.IF: [OpcodeType.ZJMP],
+	TermType.ELSE: [OpcodeType.JMP],
+	TermType.THEN: [],
+	TermType.DEF: [OpcodeType.JMP],
+	TermType.RET: [OpcodeType.RET],
+	TermType.DEF_INTR: [],
+	TermType.WHILE: [],
+	TermType.ENDWHILE: [OpcodeType.ZJMP],
+	TermType.CALL: [OpcodeType.CALL],
+	TermType.ENTRYPOINT: [OpcodeType.JMP],
+}
+# terms whose opcode takes a code address, filled in by a fixup once the target is known
+addressed_terms = {TermType.IF, TermType.ELSE, TermType.DEF, TermType.ENDWHILE, TermType.CALL, TermType.ENTRYPOINT}
 
-	return opcodes, string_current_address
 
+def codegen_string(start_string: int | None, shared_print: bool = False) -> list[Opcode]:
+	opcodes = [Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, start_string)])]
+	if shared_print:
+		opcodes.append(routine_call("print_cstr"))
+		return opcodes
+	opcodes.append(Opcode(OpcodeType.DUP, []))
+	opcodes.append(Opcode(OpcodeType.LOAD, []))
+	opcodes.append(Opcode(OpcodeType.DUP, []))
+	opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]))
+	opcodes.append(Opcode(OpcodeType.OMIT, []))
+	opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]))
+	opcodes.append(Opcode(OpcodeType.EQ, []))
+	opcodes.append(Opcode(OpcodeType.SWAP, []))
+	opcodes.append(Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 1)]))
+	opcodes.append(Opcode(OpcodeType.ADD, []))
+	opcodes.append(Opcode(OpcodeType.SWAP, []))
+	opcodes.append(Opcode(OpcodeType.ZJMP, [OpcodeParam(OpcodeParamType.ADDR_REL, -11)]))
+	return opcodes
 
-def codegen_opcodes(term: Terminal, string_current_address: int, data_memory: list) -> (list[Opcode], int):
-	opcodes = {
-		TermType.ADD: [Opcode(OpcodeType.ADD, [])],
-		TermType.DI: [Opcode(OpcodeType.DI, [])],
-		TermType.EI: [Opcode(OpcodeType.EI, [])],
-		TermType.DUP: [Opcode(OpcodeType.DUP, [])],
-		TermType.OMIT: [Opcode(OpcodeType.OMIT, [])],
-		TermType.EQ: [Opcode(OpcodeType.EQ, [])],
-		TermType.READ: [Opcode(OpcodeType.READ, [])],
-		TermType.VARIABLE: [],
-		TermType.ALLOT: [],
-		TermType.STORE: [Opcode(OpcodeType.STORE, [])],
-		TermType.LOAD: [Opcode(OpcodeType.LOAD, [])],
-		TermType.IF: [Opcode(OpcodeType.ZJMP, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-		TermType.ELSE: [Opcode(OpcodeType.JMP, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-		TermType.THEN: [],
-		TermType.DEF: [Opcode(OpcodeType.JMP, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-		TermType.RET: [Opcode(OpcodeType.RET, [])],
-		TermType.DEF_INTR: [],
-		TermType.WHILE: [],
-		TermType.ENDWHILE: [Opcode(OpcodeType.ZJMP, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-		TermType.CALL: [Opcode(OpcodeType.CALL, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-		TermType.ENTRYPOINT: [Opcode(OpcodeType.JMP, [OpcodeParam(OpcodeParamType.UNDEFINED, None)])],
-	}.get(term.term_type)
 
-	if term.operand and opcodes is not None:
-		for opcode in opcodes:
-			for param_num, param in enumerate(opcode.params):
-				if param.param_type is OpcodeParamType.UNDEFINED:
-					opcode.params[param_num].param_type = OpcodeParamType.ADDR
-					opcode.params[param_num].value = term.operand
+def store_string(term: Terminal, string_current_address: int, data_memory: list) -> int:
+	# writes the literal as a zero-terminated string, returns the next free address
+	content = term.word[2:-1]
+	for char in content:
+		data_memory[string_current_address] = ord(char)
+		string_current_address += 1
+	data_memory[string_current_address] = 0
+	return string_current_address + 1
 
-	if opcodes is None:
-		opcodes, string_current_address = codegen_print(term, string_current_address, data_memory)
 
-	return opcodes, string_current_address
+def codegen_opcodes(term: Terminal) -> list[Opcode]:
+	# string literals and bare words are code-generated by the translator itself
+	opcodes = []
+	for opcode_type in term_opcode_types[term.term_type]:
+		params = [OpcodeParam(OpcodeParamType.UNDEFINED, None)] if term.term_type in addressed_terms else []
+		opcodes.append(Opcode(opcode_type, params))
+	return opcodes
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from pathlib import Path
+
+CACHE_MAGIC = b"TCC1"
+DEFAULT_CACHE_SIZE = 64 << 20
+ENTRY_SUFFIX = ".tcc"
+# everything that decides what the translator emits for a given source
+TRANSLATOR_MODULES = [
+	"translator.py",
+	"tokenizer.py",
+	"codegen_utils.py",
+	"inliner.py",
+	"optimizer.py",
+	"runtime_library.py",
+	"stack_analysis.py",
+	"isa.py",
+]
+
+
+@functools.cache
+def translator_version() -> str:
+	digest = hashlib.sha256()
+	for module in TRANSLATOR_MODULES:
+		digest.update((Path(__file__).parent / module).read_bytes())
+	return digest.hexdigest()
+
+
+class CompileCache:
+	"""On-disk translator output keyed by source text, translator version and options.
+
+	Entries are written atomically, so parallel translators may share a directory. A hit
+	refreshes the entry's mtime; when the directory grows past max_bytes the entries
+	used least recently are removed.
+	"""
+
+	def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_CACHE_SIZE):
+		self.directory = Path(directory)
+		self.directory.mkdir(parents=True, exist_ok=True)
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+
+	def key(self, source: bytes, options: dict) -> str:
+		digest = hashlib.sha256(translator_version().encode("ascii"))
+		digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+		digest.update(source)
+		return digest.hexdigest()
+
+	def path(self, key: str) -> Path:
+		return self.directory / f"{key}{ENTRY_SUFFIX}"
+
+	def get(self, key: str) -> tuple[list[dict], list, list[dict]] | None:
+		path = self.path(key)
+		try:
+			with open(path, "rb") as file:
+				payload = file.read()
+			os.utime(path)
+		except FileNotFoundError:
+			self.misses += 1
+			return None
+		result = None
+		if payload[: len(CACHE_MAGIC)] == CACHE_MAGIC:
+			try:
+				entry = json.loads(zlib.decompress(payload[len(CACHE_MAGIC) :]).decode("utf-8"))
+				result = entry["code"], entry["memory"], entry["source_map"]
+			except (zlib.error, ValueError, KeyError):
+				result = None
+		if result is None:
+			# truncated or corrupt: removed, so the translation that follows the miss rebuilds it
+			path.unlink(missing_ok=True)
+			self.misses += 1
+			return None
+		self.hits += 1
+		return result
+
+	def put(self, key: str, code: list[dict], memory: list, source_map: list[dict]) -> None:
+		entry = {"code": code, "memory": memory, "source_map": source_map}
+		payload = CACHE_MAGIC + zlib.compress(json.dumps(entry, separators=(",", ":")).encode("utf-8"))
+		fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+		with os.fdopen(fd, "wb") as file:
+			file.write(payload)
+		Path(temp_path).replace(self.path(key))
+		self.evict()
+
+	def evict(self) -> None:
+		entries = []
+		for path in self.directory.glob(f"*{ENTRY_SUFFIX}"):
+			try:
+				stat = path.stat()
+			except FileNotFoundError:
+				continue
+			entries.append((stat.st_mtime_ns, stat.st_size, path))
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			path.unlink(missing_ok=True)
+			total -= size
@@ -1,7 +1,11 @@
+from __future__ import annotations
+
+import typing
+from array import array
 from enum import Enum
 
 import pytest as pytest
-from alu import ALU
+from alu import ALU, ALUOpcode
 
 
 class Selector(str, Enum):
@@ -15,6 +19,7 @@ class Selector(str, Enum):
 	TEMP_NEXT = "temp-> next"
 	TEMP_TOP = "temp -> top"
 	TEMP_RETURN = "return to temp"
+	TEMP_MEM = "stack -> temp"
 	TOP_TEMP = "top ->temp"
 	TOP_NEXT = "top -> next"
 	TOP_ALU = "top -> alu"
@@ -30,16 +35,94 @@ class Selector(str, Enum):
 		return str(self.value)
 
 
+class Storage(str, Enum):
+	LIST = "list"
+	ARRAY = "array"
+	PAGED = "paged"
+
+	def __str__(self) -> str:
+		return str(self.value)
+
+
 # Constants
 DATA_MEMORY_DEF_VALUE = 0
 DATA_STACK_DEF_VALUE = 0
 RETURN_STACK_DEF_VALUE = 0
 TOP_INPUT_DEF_VALUE = 0
 STACK_PTR_OFFSET = 4
+PAGE_SIZE = 4096
+
+
+class PagedMemory:
+	"""Sparse data memory: pages of int64 cells are allocated on first write.
+
+	>>> memory = PagedMemory(1 << 40, [7, 0, 5])
+	>>> memory[2], memory[(1 << 40) - 1], len(memory.pages)
+	(5, 0, 1)
+	>>> memory[1 << 32] = 9
+	>>> memory[1 << 32], len(memory.pages)
+	(9, 2)
+	"""
+
+	def __init__(self, size: int, initial: typing.Iterable[int] = (), page_size: int = PAGE_SIZE):
+		self.size = size
+		self.page_size = page_size
+		self.pages: dict[int, array] = {}
+		for address, value in enumerate(initial):
+			if value:
+				self[address] = value
+
+	def __len__(self) -> int:
+		return self.size
+
+	def __getitem__(self, address: int) -> int:
+		if not 0 <= address < self.size:
+			raise IndexError(address)
+		page = self.pages.get(address // self.page_size)
+		return DATA_MEMORY_DEF_VALUE if page is None else page[address % self.page_size]
+
+	def __setitem__(self, address: int, value: int) -> None:
+		if not 0 <= address < self.size:
+			raise IndexError(address)
+		page = self.pages.get(address // self.page_size)
+		if page is None:
+			page = self.pages[address // self.page_size] = array("q", [DATA_MEMORY_DEF_VALUE]) * self.page_size
+		page[address % self.page_size] = value
+
+
+def make_memory(storage: Storage, size: int, initial: typing.Sequence[int]) -> typing.MutableSequence[int]:
+	assert len(initial) <= size, "Memory image larger than memory size"
+	match storage:
+		case Storage.PAGED:
+			return PagedMemory(size, initial)
+		case Storage.ARRAY:
+			if isinstance(initial, memoryview) and len(initial) == size:
+				return initial
+			memory = array("q", initial)
+		case _:
+			if isinstance(initial, list) and len(initial) == size:
+				return initial
+			memory = list(initial)
+	memory.extend([DATA_MEMORY_DEF_VALUE] * (size - len(memory)))
+	return memory
+
+
+def make_stack(storage: Storage, size: int, value: int) -> typing.MutableSequence[int]:
+	# stacks are small and hot, so paged storage keeps them flat
+	if storage is Storage.LIST:
+		return [value] * size
+	return array("q", [value]) * size
 
 
 class DataPath:
-	def __init__(self, memory_size: int, memory: list, data_stack_size: int, return_stack_size: int):
+	def __init__(
+		self,
+		memory_size: int,
+		memory: typing.Sequence[int],
+		data_stack_size: int,
+		return_stack_size: int,
+		storage: Storage = Storage.LIST,
+	):
 		assert all(
 			size > 0 for size in [memory_size, data_stack_size, return_stack_size]
 		), "Sizes must be greater than zero"
@@ -55,12 +138,13 @@ class DataPath:
 		self.data_stack_size = data_stack_size
 		self.return_stack_size = return_stack_size
 
-		self.memory = memory
-		self.data_stack = [DATA_STACK_DEF_VALUE] * data_stack_size
-		self.return_stack = [RETURN_STACK_DEF_VALUE] * return_stack_size
+		self.storage = storage
+		self.memory = make_memory(storage, memory_size, memory)
+		self.data_stack = make_stack(storage, data_stack_size, DATA_STACK_DEF_VALUE)
+		self.return_stack = make_stack(storage, return_stack_size, RETURN_STACK_DEF_VALUE)
 
-	def signal_alu_operation(self, operation) -> None:
-		self.alu.set_details(self.top, self.next, operation)
+	def signal_alu_operation(self, operation, immediate=None) -> None:
+		self.alu.set_details(self.top, self.next if immediate is None else immediate, operation)
 		self.alu.calc()
 
 	def signal_latch_sp(self, selector: Selector) -> None:
@@ -83,6 +167,9 @@ class DataPath:
 			assert self.rsp >= 0, "Address below 0"
 			assert self.rsp < self.return_stack_size, "Return stack overflow"
 			self.temp = self.return_stack[self.rsp]
+		elif selector is Selector.TEMP_MEM:
+			assert 0 <= self.sp < self.data_stack_size, "Address out of bounds"
+			self.temp = self.data_stack[self.sp]
 		elif selector is Selector.TEMP_TOP:
 			self.temp = self.top
 		elif selector is Selector.TEMP_NEXT:
@@ -118,3 +205,37 @@ class DataPath:
 		assert self.rsp < self.return_stack_size, "Return stack overflow"
 		if selector is Selector.RET_STACK_PC:
 			self.return_stack[self.rsp] = self.pc
+
+	def snapshot(self) -> dict:
+		if isinstance(self.memory, PagedMemory):
+			memory = {"page_size": self.memory.page_size, "pages": {i: list(p) for i, p in self.memory.pages.items()}}
+		else:
+			memory = list(self.memory)
+		return {
+			"sizes": [self.memory_size, self.data_stack_size, self.return_stack_size],
+			"storage": self.storage.value,
+			"registers": [self.pc, self.sp, self.rsp, self.top, self.next, self.temp],
+			"alu": [self.alu.result, self.alu.src_a, self.alu.src_b, self.alu.operation],
+			"memory": memory,
+			"data_stack": list(self.data_stack),
+			"return_stack": list(self.return_stack),
+		}
+
+	@classmethod
+	def from_snapshot(cls, state: dict) -> DataPath:
+		memory_size, data_stack_size, return_stack_size = state["sizes"]
+		storage = Storage(state.get("storage", Storage.LIST))
+		memory = state["memory"]
+		if storage is Storage.PAGED:
+			data_path = cls(memory_size, [], data_stack_size, return_stack_size, storage)
+			data_path.memory.page_size = memory["page_size"]
+			data_path.memory.pages = {int(i): array("q", page) for i, page in memory["pages"].items()}
+		else:
+			data_path = cls(memory_size, memory, data_stack_size, return_stack_size, storage)
+		data_path.pc, data_path.sp, data_path.rsp, data_path.top, data_path.next, data_path.temp = state["registers"]
+		data_path.alu.result, data_path.alu.src_a, data_path.alu.src_b, operation = state["alu"]
+		data_path.alu.operation = None if operation is None else ALUOpcode(operation)
+		stack_storage = Storage.LIST if storage is Storage.LIST else Storage.ARRAY
+		data_path.data_stack = make_memory(stack_storage, data_stack_size, state["data_stack"])
+		data_path.return_stack = make_memory(stack_storage, return_stack_size, state["return_stack"])
+		return data_path
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import collections
+import typing
+from pathlib import Path
+
+# the input latch before the first interrupt, as the original model had it
+DEFAULT_INPUT = "h"
+STREAM_BUFFER_SIZE = 1 << 16
+# a polled source with no tokens left reads as NUL, the end-of-input mark of the examples
+END_OF_INPUT = "\0"
+
+
+def encode_char(buffer: bytearray, value: int) -> None:
+	# OMIT writes one character code; chr() rejects the same values it did before
+	if 0 <= value < 0x80:
+		buffer.append(value)
+	else:
+		buffer += chr(value).encode("utf-8", "surrogatepass")
+
+
+class BufferSink:
+	"""Output port kept in memory as UTF-8 bytes.
+
+	>>> sink = BufferSink("ab")
+	>>> for value in [99, 1078]:
+	...     sink.write(value)
+	>>> sink.text()
+	'abcж'
+	"""
+
+	def __init__(self, text: str = ""):
+		self.buffer = bytearray(text.encode("utf-8", "surrogatepass"))
+
+	def write(self, value: int) -> None:
+		encode_char(self.buffer, value)
+
+	def text(self) -> str:
+		return self.buffer.decode("utf-8", "surrogatepass")
+
+	def close(self) -> None:
+		pass
+
+
+class StreamSink:
+	"""Output port streamed to a file in blocks of buffer_size bytes.
+
+	A sink restored at an offset drops whatever the file holds past it, so a
+	resumed snapshot continues the output it was taken with.
+	"""
+
+	def __init__(self, path: str | Path, buffer_size: int = STREAM_BUFFER_SIZE, offset: int | None = None):
+		self.path = Path(path)
+		self.buffer_size = buffer_size
+		self.pending = bytearray()
+		if offset is None:
+			self.file = open(self.path, "wb")
+		else:
+			self.file = open(self.path, "r+b")
+			self.file.truncate(offset)
+			self.file.seek(offset)
+
+	def write(self, value: int) -> None:
+		encode_char(self.pending, value)
+		if len(self.pending) >= self.buffer_size:
+			self.flush()
+
+	def flush(self) -> None:
+		if not self.file.closed:
+			self.file.write(self.pending)
+			self.file.flush()
+			self.pending.clear()
+
+	def offset(self) -> int:
+		# bytes of output so far, the unflushed ones included
+		self.flush()
+		return self.file.tell()
+
+	def text(self) -> str:
+		self.flush()
+		return self.path.read_bytes().decode("utf-8", "surrogatepass")
+
+	def close(self) -> None:
+		self.flush()
+		self.file.close()
+
+
+class InputLatch:
+	"""Input port holding the character delivered by the last interrupt."""
+
+	def __init__(self, value: str = DEFAULT_INPUT):
+		self.value = value
+
+	def deliver(self, value: str) -> None:
+		self.value = value
+
+	def read(self) -> int:
+		return ord(self.value)
+
+	def close(self) -> None:
+		pass
+
+
+class TokenSource:
+	"""Polled input port: each read takes the next queued token.
+
+	>>> source = TokenSource("ab")
+	>>> [source.read() for _ in range(3)]
+	[97, 98, 0]
+	"""
+
+	def __init__(self, tokens: typing.Iterable[str] = ()):
+		self.tokens = collections.deque(tokens)
+
+	def deliver(self, value: str) -> None:
+		self.tokens.append(value)
+
+	@property
+	def value(self) -> str:
+		return self.tokens[0] if self.tokens else END_OF_INPUT
+
+	def read(self) -> int:
+		return ord(self.tokens.popleft() if self.tokens else END_OF_INPUT)
+
+	def close(self) -> None:
+		pass
+
+
+class DeviceBus:
+	"""Port-mapped devices of the machine.
+
+	OMIT writes the second stack cell to the port on top of the stack and READ
+	replaces the port number with the value read. Ports without a device of their
+	own go to the default output sink and to the input latch that interrupts feed;
+	a TokenSource as the latch queues interrupt tokens instead of keeping the last.
+	"""
+
+	def __init__(
+		self,
+		ports: dict[int, typing.Any] | None = None,
+		output: BufferSink | StreamSink | None = None,
+		latch: InputLatch | TokenSource | None = None,
+	):
+		self.ports = {} if ports is None else dict(ports)
+		self.output = BufferSink() if output is None else output
+		self.latch = InputLatch() if latch is None else latch
+
+	def write(self, port: int, value: int) -> None:
+		device = self.ports.get(port, self.output)
+		assert hasattr(device, "write"), f"Port {port} is read-only"
+		device.write(value)
+
+	def read(self, port: int) -> int:
+		device = self.ports.get(port, self.latch)
+		assert hasattr(device, "read"), f"Port {port} is write-only"
+		return device.read()
+
+	def close(self) -> None:
+		for device in [self.output, self.latch, *self.ports.values()]:
+			device.close()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import typing
+
+from alu import alu_immediate_opcode_mapping, alu_opcode_mapping
+from block_compiler import conditional_opcodes, instruction_ticks
+from isa import OpcodeType, code_opcodes
+
+# data stack depth change of the opcodes an idle loop body may contain: none of them
+# writes memory, does I/O, touches PS or the return stack
+stack_effects = {
+	OpcodeType.NOP: 0,
+	OpcodeType.PUSH: 1,
+	OpcodeType.DUP: 1,
+	OpcodeType.DROP: -1,
+	OpcodeType.OVER: 1,
+	OpcodeType.ROT: 0,
+	OpcodeType.SWAP: 0,
+	OpcodeType.LOAD: 0,
+	**{opcode_type: -1 for opcode_type in alu_opcode_mapping},
+	**{opcode_type: 0 for opcode_type in alu_immediate_opcode_mapping},
+}
+
+
+class IdleLoop(typing.NamedTuple):
+	head: int
+	size: int
+	# ticks of one iteration, the taken backward branch included
+	ticks: int
+	# lowest data stack depth reached in the body, relative to the head
+	depth: int
+
+
+def find_idle_loops(opcodes: typing.Sequence[int], args: typing.Sequence[int]) -> dict[int, IdleLoop]:
+	"""Straight-line loops closed by a backward ZJMP/NZJMP whose body has no side effects.
+
+	Such a loop only reads registers, the data stack and memory, and memory can only
+	change when an interrupt handler runs, so an iteration that ends in the state it
+	started from repeats unchanged until the next interrupt.
+	"""
+	loops = {}
+	for pc, code in enumerate(opcodes):
+		head = args[pc]
+		if code_opcodes[code] not in conditional_opcodes or not 0 <= head < pc:
+			continue
+		body = [code_opcodes[opcodes[address]] for address in range(head, pc)]
+		if any(opcode_type not in stack_effects for opcode_type in body):
+			continue
+		depth = lowest = 0
+		for opcode_type in body:
+			if stack_effects[opcode_type] < 0 or opcode_type is OpcodeType.ROT:
+				# a pop reads the cell it leaves the stack pointer at, ROT the same cell
+				lowest = min(lowest, depth - 1)
+			depth += stack_effects[opcode_type]
+		# the branch pops too: an iteration must leave the depth as it found it
+		if depth != 1:
+			continue
+		ticks = sum(instruction_ticks[opcode_type] for opcode_type in [*body, code_opcodes[code]]) + 1
+		loops[head] = IdleLoop(head, pc - head + 1, ticks, lowest)
+	return loops
+
+
+class FastForward:
+	"""Skips the iterations of an idle loop that would run before anything can change.
+
+	An iteration is only skipped after one was seen to run in full: arriving at the loop
+	head in the same registers and stack cells one iteration's ticks and instructions
+	after the previous arrival. Then the counters jump ahead by whole iterations, up to
+	the last one that ends before the next interrupt arrival, the tick limit or the
+	instruction limit, and the wrapped step takes over again.
+
+	With live input no arrival is known in advance: an idle loop with nothing scheduled
+	sets `waiting` instead, so the caller can wait for input before stepping on.
+	"""
+
+	def __init__(
+		self,
+		control_unit,
+		step: typing.Callable,
+		limit: int,
+		tick_limit: int | None = None,
+		live: bool = False,
+	):
+		self.control_unit = control_unit
+		self.wrapped = step
+		self.limit = limit
+		self.tick_limit = tick_limit
+		self.live = live
+		self.waiting = False
+		self.loops = find_idle_loops(control_unit.opcodes, control_unit.args)
+		self.expected_visit = None
+
+	def state(self, loop: IdleLoop) -> tuple:
+		data_path = self.control_unit.data_path
+		sp = data_path.sp
+		cells = tuple(data_path.data_stack[max(sp + loop.depth, 0) : sp])
+		return data_path.top, data_path.next, data_path.temp, sp, data_path.rsp, cells
+
+	def step(self) -> None:
+		control_unit = self.control_unit
+		self.waiting = False
+		loop = self.loops.get(control_unit.data_path.pc)
+		if loop is None:
+			self.wrapped()
+			return
+		state = self.state(loop)
+		if (loop.head, state, control_unit.tick_number, control_unit.instruction_number) == self.expected_visit:
+			# back at the head with nothing executed: the caller checks its limits again
+			skipped = self.skip(loop)
+		else:
+			skipped = False
+		# after one more iteration the loop is back at the head with the same state
+		self.expected_visit = (
+			loop.head,
+			state,
+			control_unit.tick_number + loop.ticks,
+			control_unit.instruction_number + loop.size,
+		)
+		if not skipped:
+			self.wrapped()
+
+	def iterations(self, loop: IdleLoop) -> int:
+		control_unit = self.control_unit
+		tick = control_unit.tick_number
+		count = (self.limit - control_unit.instruction_number) // loop.size
+		if self.tick_limit is not None:
+			count = min(count, (self.tick_limit - tick - 1) // loop.ticks)
+		if control_unit.interrupt_possible(tick):
+			return 0
+		arrival = control_unit.interrupts.next_arrival()
+		if arrival is None and self.live:
+			self.waiting = True
+			return 0
+		if arrival is not None and control_unit.interrupt_possible(arrival):
+			# the last skipped iteration ends before the arrival tick
+			count = min(count, (arrival - tick - 1) // loop.ticks)
+		return max(count, 0)
+
+	def skip(self, loop: IdleLoop) -> bool:
+		# every skipped iteration ends at the head in the state it started from
+		count = self.iterations(loop)
+		self.control_unit.tick_number += count * loop.ticks
+		self.control_unit.instruction_number += count * loop.size
+		return count > 0
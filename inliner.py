@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import typing
+
+from codegen_utils import Terminal
+from isa import Opcode, OpcodeParam, OpcodeParamType, OpcodeType, TermType
+
+# a word whose expansion is at most this many opcodes is inlined at every call site
+INLINE_SIZE = 6
+# a word called once is inlined up to this size and its definition dropped
+SINGLE_USE_SIZE = 256
+
+# identity of a term in the rewritten program: (index,) for an original term, the call
+# site key extended by the body index for a copy of an inlined body
+Key = tuple[int, ...]
+# second key part of the ":" marker moved out with its definition
+DEFINITION_MARKER = -1
+
+
+class Word(typing.NamedTuple):
+	# ":" term with the jump over the body, the name term calls land on, the ";" term
+	start: int
+	name: int
+	end: int
+
+	def body(self) -> range:
+		return range(self.name + 1, self.end)
+
+
+def address_param(opcode: Opcode) -> OpcodeParam | None:
+	for param in opcode.params:
+		if param.param_type is OpcodeParamType.ADDR:
+			return param
+	return None
+
+
+def call_target(opcode: Opcode) -> int | None:
+	param = address_param(opcode)
+	return param.value if opcode.opcode_type is OpcodeType.CALL and param is not None else None
+
+
+def find_words(terms: list[Terminal], main_start: int) -> dict[int, Word]:
+	# top-level ":" definitions of the main stream, by name term; none if any is nested
+	words = {}
+	start = None
+	for index in range(main_start, len(terms)):
+		match terms[index].term_type:
+			case TermType.DEF:
+				if start is not None:
+					return {}
+				start = index
+			case TermType.RET if start is not None:
+				words[start + 1] = Word(start, start + 1, index)
+				start = None
+	return words
+
+
+class Inliner:
+	"""Expands calls of small and single-use words, then turns `call X; ret` into `jmp X`.
+
+	Works on linked terms, before the peephole pass and address assignment. Definitions
+	are moved out of the main program, between the interrupt handlers and the code the
+	entry jump lands on, so their skip-over jumps are dropped. Definitions nothing
+	reachable from the entry point or the interrupt handlers calls, those whose every
+	call was expanded among them, are dropped. A word is inlined only if its body branches
+	within itself and has no ";" of its own; a call back into a word being expanded
+	stays a call.
+	"""
+
+	def __init__(self, terms: list[Terminal], term_opcodes: list[list[Opcode]], main_start: int):
+		self.terms = terms
+		self.term_opcodes = term_opcodes
+		self.main_start = main_start
+		self.words = find_words(terms, main_start)
+		self.owners = {index: word.name for word in self.words.values() for index in range(word.name, word.end + 1)}
+		self.calls: dict[int, int] = {}
+		for opcodes in term_opcodes:
+			for opcode in opcodes:
+				if (target := call_target(opcode)) is not None:
+					self.calls[target] = self.calls.get(target, 0) + 1
+		self.costs: dict[int, int | None] = {}
+		self.expanding: set[int] = set()
+
+	def self_contained(self, word: Word) -> bool:
+		for index in word.body():
+			for opcode in self.term_opcodes[index]:
+				target = address_param(opcode)
+				if opcode.opcode_type is OpcodeType.RET:
+					return False
+				if opcode.opcode_type is OpcodeType.CALL:
+					if target is not None and target.value == word.name:
+						return False
+				elif target is not None and not word.name < target.value <= word.end:
+					return False
+		return True
+
+	def cost(self, name: int) -> int | None:
+		# opcodes a call of the word expands to, None if the call stays
+		if name in self.costs:
+			return self.costs[name]
+		# a call back into a word that is being sized stays a call
+		self.costs[name] = None
+		word = self.words[name]
+		if not self.self_contained(word):
+			return None
+		size = 0
+		for index in word.body():
+			for opcode in self.term_opcodes[index]:
+				callee = call_target(opcode)
+				callee_cost = self.cost(callee) if callee in self.words else None
+				size += 1 if callee_cost is None else callee_cost
+		limit = SINGLE_USE_SIZE if self.calls.get(name) == 1 else INLINE_SIZE
+		self.costs[name] = size if size <= limit else None
+		return self.costs[name]
+
+	def inlined(self, opcodes: list[Opcode]) -> Word | None:
+		if len(opcodes) != 1:
+			return None
+		callee = call_target(opcodes[0])
+		if callee not in self.words or callee in self.expanding or self.cost(callee) is None:
+			return None
+		return self.words[callee]
+
+	def relocate(self, opcode: Opcode, prefix: Key) -> Opcode:
+		params = []
+		for param in opcode.params:
+			value = param.value
+			if param.param_type is OpcodeParamType.ADDR:
+				# calls go to definitions, branches stay within the copy they belong to
+				value = (value,) if opcode.opcode_type is OpcodeType.CALL else (*prefix, value)
+			params.append(OpcodeParam(param.param_type, value))
+		return Opcode(opcode.opcode_type, params)
+
+	def expand(self, index: int, key: Key, output: list) -> None:
+		opcodes = self.term_opcodes[index]
+		word = self.inlined(opcodes)
+		if word is None:
+			output.append((key, self.terms[index], [self.relocate(opcode, key[:-1]) for opcode in opcodes]))
+			return
+		# the call term stays as the landing point of branches to the call
+		output.append((key, self.terms[index], []))
+		self.expanding.add(word.name)
+		for body_index in word.body():
+			self.expand(body_index, (*key, body_index), output)
+		self.expanding.discard(word.name)
+		end = self.terms[word.end]
+		output.append(((*key, word.end), Terminal(end.word_number, None, end.word, end.line, end.column), []))
+
+	def layout(self) -> tuple[list[Terminal], list[list[Opcode]]]:
+		handlers, main, blocks = [], [], {}
+		self.expand(0, (0,), handlers)
+		for index in range(1, self.main_start):
+			self.expand(index, (index,), handlers)
+		starts = {word.start: word for word in self.words.values()}
+		aliases = {}
+		index = self.main_start
+		while index < len(self.terms):
+			if index not in starts:
+				self.expand(index, (index,), main)
+				index += 1
+				continue
+			word = starts[index]
+			# falling into or branching to the ":" continues after the definition
+			aliases[(word.start,)] = (word.end + 1,)
+			block = [((word.start, DEFINITION_MARKER), self.terms[word.start], [])]
+			for block_index in range(word.name, word.end + 1):
+				self.expand(block_index, (block_index,), block)
+			blocks[word.name] = block
+			index = word.end + 1
+
+		# a definition is kept if it is reachable from the entry point or the handlers
+		kept = set()
+		pending = self.referenced(handlers + main)
+		while pending:
+			name = pending.pop()
+			kept.add(name)
+			pending += [callee for callee in self.referenced(blocks[name]) if callee not in kept]
+		output = handlers + [entry for name in self.words if name in kept for entry in blocks[name]] + main
+		self.eliminate_tail_calls(output)
+
+		positions = {key: position for position, (key, _, _) in enumerate(output)}
+
+		def position(key: Key) -> int:
+			while key in aliases:
+				key = aliases[key]
+			return positions.get(key, len(output))
+
+		for _, _, opcodes in output:
+			for opcode in opcodes:
+				for param in opcode.params:
+					if param.param_type is OpcodeParamType.ADDR:
+						param.value = position(param.value)
+		return [term for _, term, _ in output], [opcodes for _, _, opcodes in output]
+
+	def referenced(self, entries: list) -> list[int]:
+		# definitions relocated opcodes call or branch into; copies are never targets from outside
+		keys = [
+			param.value
+			for _, _, opcodes in entries
+			for opcode in opcodes
+			for param in opcode.params
+			if param.param_type is OpcodeParamType.ADDR
+		]
+		return [self.owners[key[0]] for key in keys if len(key) == 1 and key[0] in self.owners]
+
+	def eliminate_tail_calls(self, output: list) -> None:
+		targets = {
+			param.value
+			for _, _, opcodes in output
+			for opcode in opcodes
+			for param in opcode.params
+			if param.param_type is OpcodeParamType.ADDR
+		}
+		for position, (_, _, opcodes) in enumerate(output):
+			if not opcodes or opcodes[-1].opcode_type is not OpcodeType.CALL:
+				continue
+			following = position + 1
+			while following < len(output) and not output[following][2]:
+				following += 1
+			if following == len(output) or output[following][2][0].opcode_type is not OpcodeType.RET:
+				continue
+			# the callee returns straight to our caller
+			opcodes[-1].opcode_type = OpcodeType.JMP
+			landings = [key for key, _, _ in output[position + 1 : following + 1]]
+			if len(output[following][2]) == 1 and not any(key in targets for key in landings):
+				output[following][2].clear()
+
+
+def inline_words(
+	terms: list[Terminal], term_opcodes: list[list[Opcode]], main_start: int
+) -> tuple[list[Terminal], list[list[Opcode]]]:
+	return Inliner(terms, term_opcodes, main_start).layout()
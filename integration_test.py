@@ -1,6 +1,24 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+import benchmark
+import lanes
 import pytest
-from machine import run
-from translator import translate
+from block_compiler import instruction_ticks
+from compile_cache import CompileCache
+from datapath import Storage
+from devices import BufferSink, DeviceBus, StreamSink, TokenSource
+from isa import ObjectImage, OpcodeType, read_code, write_code, write_memory, write_object
+from journal import TraceLevel, Tracer
+from live import LiveSession, run_session
+from machine import ControlUnit, MachineConfig, RunMode, boot, microcode_report, resume, run, simulate
+from profiler import Profiler
+from snapshot import read_snapshot, write_snapshot
+from translator import Translator, translate, translate_cached, translate_program
+from translator import main as translator_main
 
 
 @pytest.mark.golden_test("./golden/*.yaml")
@@ -21,3 +39,443 @@ def test_golden_emulator(golden) -> None:
 	journal.insert(0, f"Number of ticks: {ticks - 1}")
 
 	assert journal == golden.out["journal"]
+
+
+@pytest.mark.parametrize("mode", [RunMode.INSTRUCTION, RunMode.BLOCK])
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_fast_modes(golden, mode) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+
+	output, ticks, _ = run(
+		code,
+		data_memory,
+		limit=999,
+		input_tokens=input_tokens,
+		mode=mode,
+	)
+
+	assert f"Number of ticks: {ticks - 1}" == golden.out["journal"][0]
+	assert f"Output buffer: {output}" == golden.out["journal"][1]
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_snapshot_resume(golden, tmp_path) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+	snapshot = str(tmp_path / "machine.snap")
+
+	_, _, head = run(code, data_memory, limit=999, input_tokens=input_tokens, tick_limit=200, snapshot_path=snapshot)
+	output, ticks, tail = resume(snapshot, limit=999)
+
+	assert f"Number of ticks: {ticks - 1}" == golden.out["journal"][0]
+	assert f"Output buffer: {output}" == golden.out["journal"][1]
+	assert head + tail == golden.out["journal"][2:]
+
+
+def test_snapshot_interrupt_ticks(tmp_path) -> None:
+	workload = benchmark.workloads[2]
+	code, data_memory = translate(workload.read_source())
+	snapshot = str(tmp_path / "machine.snap")
+	tracer = Tracer(TraceLevel.OFF, [])
+	control_unit = boot(code, data_memory, list(workload.tokens), RunMode.INSTRUCTION, tracer)
+	simulate(control_unit, 10**6, tick_limit=5000)
+	write_snapshot(snapshot, control_unit.snapshot())
+	state = read_snapshot(snapshot)
+	assert state["counters"][2] == control_unit.interrupt_ticks > 0
+
+	assert ControlUnit.from_snapshot(state).interrupt_ticks == control_unit.interrupt_ticks
+	state["counters"] = state["counters"][:2]
+	assert ControlUnit.from_snapshot(state).interrupt_ticks == 0
+
+
+@pytest.mark.parametrize("options", [{"optimized": True}, {"shared_print": True}])
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_translator_options(golden, options) -> None:
+	code, data_memory = translate(str(golden["code"]), **options)
+	input_tokens = eval(str(golden["input"]))
+
+	output, ticks, _ = run(code, data_memory, limit=999, input_tokens=input_tokens, mode=RunMode.INSTRUCTION)
+
+	assert f"Output buffer: {output}" == golden.out["journal"][1]
+	if options.get("optimized"):
+		assert ticks - 1 <= int(golden.out["journal"][0].removeprefix("Number of ticks: "))
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_object_image(golden, tmp_path) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	write_object(str(tmp_path / "program.spo"), code, data_memory)
+	input_tokens = eval(str(golden["input"]))
+
+	output, ticks, journal = run(ObjectImage(str(tmp_path / "program.spo")), None, 999, input_tokens)
+
+	assert [f"Number of ticks: {ticks - 1}", f"Output buffer: {output}", *journal] == golden.out["journal"]
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_profiler(golden) -> None:
+	code, data_memory, source_map = translate_program(str(golden["code"]), shared_print=True)
+	input_tokens = eval(str(golden["input"]))
+	profiler = Profiler(source_map)
+
+	output, ticks, _ = run(code, data_memory, 999, input_tokens, RunMode.BLOCK, profiler=profiler)
+
+	assert output == golden.out["journal"][1].removeprefix("Output buffer: ")
+	assert len(source_map) == len(code)
+	assert profiler.total_ticks == ticks
+	assert sum(int(line.rsplit(" ", 1)[1]) for line in profiler.collapsed()) == ticks
+	assert all(line.startswith("<main>") for line in profiler.collapsed())
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_translator_reentrant(golden) -> None:
+	sources = [str(golden["code"]), benchmark.workloads[0].read_source()] * 8
+	with ThreadPoolExecutor(max_workers=4) as executor:
+		results = list(executor.map(lambda source: Translator().translate(source), sources))
+
+	assert results[0][0] == golden.out["instructions"]
+	assert results[0][1] == golden.out["data_memory"]
+	assert all(result == results[index % 2] for index, result in enumerate(results))
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_compile_cache(golden, tmp_path) -> None:
+	cache = CompileCache(tmp_path)
+	source = str(golden["code"]).encode("utf-8")
+
+	first = translate_cached(source, cache)
+	second = translate_cached(source, cache)
+	translate_cached(source, cache, optimized=True)
+
+	assert first == second
+	assert second[0] == golden.out["instructions"]
+	assert second[1] == golden.out["data_memory"]
+	assert (cache.hits, cache.misses) == (1, 2)
+
+	# a truncated entry is a miss and is written again
+	plain = cache.path(cache.key(source, {"optimized": False, "memory_size": 1024, "shared_print": False}))
+	plain.write_bytes(plain.read_bytes()[:-8])
+	assert translate_cached(source, cache) == first
+	assert translate_cached(source, cache) == first
+	assert (cache.hits, cache.misses) == (2, 3)
+
+	# a limit below two entries keeps only the most recently used one
+	os.utime(plain, ns=(0, 0))
+	entries = list(tmp_path.glob("*.tcc"))
+	CompileCache(tmp_path, max_bytes=max(path.stat().st_size for path in entries)).evict()
+	assert [path for path in tmp_path.glob("*.tcc")] == [path for path in entries if path != plain]
+
+
+@pytest.mark.parametrize("storage", list(Storage))
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_storage(golden, storage, tmp_path) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+	config = MachineConfig(data_stack_size=64, return_stack_size=64, storage=storage)
+	snapshot = str(tmp_path / "machine.snap")
+
+	_, _, head = run(code, data_memory, 999, input_tokens, tick_limit=100, snapshot_path=snapshot, config=config)
+	output, ticks, tail = resume(snapshot, limit=999)
+
+	assert [f"Number of ticks: {ticks - 1}", f"Output buffer: {output}", *head, *tail] == golden.out["journal"]
+
+
+@pytest.mark.parametrize("mode", list(RunMode))
+@pytest.mark.parametrize("storage", list(Storage))
+def test_storage_word_width(storage, mode) -> None:
+	source = "variable x 4611686018427387904 x ! x @ 4 * x ! x @ 1 + 0 = if 1 0 omit then"
+	config = MachineConfig(storage=storage)
+	control_unit = boot(*translate(source), [], mode, Tracer(TraceLevel.OFF, []), config)
+	if storage is Storage.LIST:
+		simulate(control_unit, 999)
+		assert control_unit.data_path.memory[0] == 2**64
+	else:
+		with pytest.raises(OverflowError):
+			simulate(control_unit, 999)
+	assert MachineConfig().storage is Storage.LIST
+
+
+@pytest.mark.parametrize("workload", benchmark.workloads, ids=lambda workload: workload.name)
+def test_benchmark_workloads(workload) -> None:
+	code, memory = translate(workload.read_source())
+	benchmark.check(workload, benchmark.execute(workload, code, memory, RunMode.BLOCK))
+
+
+def test_batch_job_failure(tmp_path) -> None:
+	# chr() rejects the character code of the second job with OverflowError
+	sources = {"good": '1 ." ok"', "bad": "4611686018427387904 0 omit"}
+	for name, source in sources.items():
+		code, data_memory = translate(source)
+		write_code(str(tmp_path / f"{name}.json"), code)
+		write_memory(str(tmp_path / f"{name}.mem"), data_memory)
+	# the third job has no code file
+	jobs = [{"name": name, "code": f"{name}.json", "memory": f"{name}.mem"} for name in [*sources, "missing"]]
+	manifest = tmp_path / "manifest.json"
+	manifest.write_text(json.dumps(jobs), encoding="utf-8")
+
+	results = batch.run_batch(batch.read_manifest(str(manifest)), str(tmp_path / "out"), workers=2)
+
+	summary = json.loads((tmp_path / "out" / "summary.json").read_text(encoding="utf-8"))
+	assert summary == results
+	assert [result["error"] for result in results[:2]] == [
+		None,
+		"OverflowError: Python int too large to convert to C int",
+	]
+	assert results[0]["output"] == "ok\0"
+	assert results[2]["error"].startswith("FileNotFoundError:")
+	assert [results[2]["ticks"], results[2]["instructions"], results[2]["output"]] == [None, None, ""]
+	assert batch.format_summary(results).splitlines()[3].startswith(f"| {'missing':20} | {'-':>10} | {'-':>10} |")
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_lanes(golden) -> None:
+	pytest.importorskip("numpy")
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+	# lanes diverge: shifted, truncated and reordered copies of the golden input
+	schedules = [input_tokens, [], input_tokens[:2], [(tick + 7, char) for tick, char in input_tokens]]
+	schedules.append(list(reversed(input_tokens)))
+
+	results = lanes.run_lanes(code, data_memory, schedules, limit=999)
+
+	assert f"Number of ticks: {results[0].ticks - 1}" == golden.out["journal"][0]
+	assert f"Output buffer: {results[0].output}" == golden.out["journal"][1]
+	for schedule, result in zip(schedules, results):
+		output, ticks, _ = run(code, data_memory, 999, list(schedule), RunMode.INSTRUCTION)
+		assert [result.output, result.ticks] == [output, ticks]
+
+
+@pytest.mark.parametrize(
+	("source", "overflows"),
+	[
+		("4611686018427387904 4 * 1 omit", True),
+		("9223372036854775807 1 + 1 omit", True),
+		("-9223372036854775808 -1 * 1 omit", True),
+		("-4611686018427387904 2 * -9223372036854775807 -1 + = 48 + 1 omit", False),
+	],
+)
+def test_lanes_int64_overflow(source, overflows) -> None:
+	pytest.importorskip("numpy")
+	code, data_memory = translate(source)
+	[result] = lanes.run_lanes(code, data_memory, [[]], limit=999)
+
+	if overflows:
+		assert result.error == "OverflowError: ALU result out of int64 range"
+	else:
+		output, ticks, _ = run(code, data_memory, 999, [], RunMode.INSTRUCTION)
+		assert [result.error, result.output, result.ticks] == [None, output, ticks] == [None, "1", ticks]
+
+
+@pytest.mark.parametrize("mode", list(RunMode))
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_fast_forward(golden, mode) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	# the golden input spread out: the idle loop spins for most of the run
+	input_tokens = [(tick * 1000, char) for tick, char in eval(str(golden["input"]))]
+	config = MachineConfig(fast_forward=False)
+	tracer = Tracer(TraceLevel.OFF, [])
+
+	expected = run(code, data_memory, 10**6, input_tokens, mode, tracer, config=config)[:2]
+	output, ticks, _ = run(code, data_memory, 10**6, input_tokens, mode, Tracer(TraceLevel.OFF, []))
+	assert [output, ticks] == expected
+
+	# tokens hours of ticks apart take no longer than dense ones
+	sparse_tokens = [(tick * 10**12, char) for tick, char in input_tokens]
+	output, ticks, _ = run(code, data_memory, 10**18, sparse_tokens, mode, Tracer(TraceLevel.OFF, []))
+	assert output == expected[0]
+	assert ticks > 10**12 or not input_tokens
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_stream_sink(golden, tmp_path) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+	path = tmp_path / "output.txt"
+	snapshot = str(tmp_path / "machine.snap")
+	bus = DeviceBus(output=StreamSink(path, buffer_size=4))
+
+	output, _, _ = run(code, data_memory, 999, input_tokens, RunMode.BLOCK, bus=bus)
+
+	assert output == f"<{path}>"
+	assert f"Output buffer: {path.read_text(encoding='utf-8')}" == golden.out["journal"][1]
+
+	# a snapshot refers to the output file, a resumed run appends to it
+	bus = DeviceBus(output=StreamSink(path, buffer_size=4))
+	run(code, data_memory, 999, input_tokens, RunMode.BLOCK, tick_limit=300, snapshot_path=snapshot, bus=bus)
+	head = path.read_bytes()
+	state = read_snapshot(snapshot)
+	assert "out_buffer" not in state
+	assert state["output_file"] == {"path": str(path), "offset": len(head)}
+	for _ in range(2):
+		output, _, _ = resume(snapshot, 999, RunMode.BLOCK)
+		assert output == f"<{path}>"
+		assert f"Output buffer: {path.read_text(encoding='utf-8')}" == golden.out["journal"][1]
+
+
+def test_device_bus_ports() -> None:
+	code, data_memory = translate("7 read 5 omit 7 read 0 omit 7 read 5 omit")
+	sink = BufferSink()
+	bus = DeviceBus({5: sink, 7: TokenSource("xy")})
+
+	output, _, _ = run(code, data_memory, 999, [], RunMode.INSTRUCTION, bus=bus)
+
+	assert [output, sink.text()] == ["y", "x\0"]
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_live_session(golden, capsys) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	chars = [char for _, char in eval(str(golden["input"]))]
+
+	async def tokens():
+		for char in chars:
+			await asyncio.sleep(0)
+			yield char
+
+	async def session() -> list[str]:
+		chunks = []
+
+		async def write(chunk: str) -> None:
+			chunks.append(chunk)
+
+		await run_session(LiveSession(code, data_memory, end_of_input=None), tokens(), write)
+		return chunks
+
+	output = "".join(asyncio.run(session()))
+	assert f"Output buffer: {output}" == golden.out["journal"][1]
+	# only the program output may reach stdout, serve_pipe writes it there
+	assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("mode", [RunMode.INSTRUCTION, RunMode.BLOCK])
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_verified_stack(golden, mode) -> None:
+	code, data_memory = translate(str(golden["code"]), verify_stack=True)
+	input_tokens = eval(str(golden["input"]))
+	assert not boot(code, data_memory, input_tokens, mode).checked
+	assert boot(code, data_memory, input_tokens, mode, config=MachineConfig(data_stack_size=5)).checked
+
+	output, ticks, _ = run(code, data_memory, limit=999, input_tokens=input_tokens, mode=mode)
+
+	assert f"Number of ticks: {ticks - 1}" == golden.out["journal"][0]
+	assert f"Output buffer: {output}" == golden.out["journal"][1]
+
+
+def test_verify_stack_rejects_underflow() -> None:
+	with pytest.raises(AssertionError, match="Data stack underflow"):
+		translate("1 + + + + + +", verify_stack=True)
+
+
+def test_inlined_words() -> None:
+	source = """
+	variable n
+	: double dup + ;
+	: quad double double ;
+	: down dup if -1 + down then ;
+	: emit 0 omit ;
+	n @ 0 = if 7 down n ! then
+	: late 66 emit ;
+	16 quad emit late
+	"""
+	plain = run(*translate(source), 999, [], RunMode.INSTRUCTION)
+	code, data_memory = translate(source, optimized=True)
+	optimized = run(code, data_memory, 999, [], RunMode.INSTRUCTION)
+
+	assert optimized[0] == plain[0] == "@B"
+	assert optimized[1] < plain[1]
+	# only the recursive word is still called; its self call became a jump
+	assert [command["command"] for command in code].count("CALL") == 1
+	assert [command["command"] for command in code].count("JMP") == 2
+
+
+def test_dead_code_elimination(tmp_path) -> None:
+	source = """
+	variable unused
+	variable buf 3 allot
+	variable n
+	: greet ." hi" ;
+	: never ." never" unused @ ;
+	: also-never never never ;
+	: store-n n ! ;
+	21 store-n greet n @ buf 2 + !
+	"""
+	(tmp_path / "lib.fth").write_text(source, encoding="utf-8")
+	translator_main(
+		str(tmp_path / "lib.fth"),
+		str(tmp_path / "code.json"),
+		str(tmp_path / "memory.json"),
+		optimized=True,
+		link_map_file=str(tmp_path / "link.map"),
+	)
+	code, data_memory = read_code(str(tmp_path / "code.json")), read_code(str(tmp_path / "memory.json"))
+
+	control_unit = boot(code, data_memory, [], RunMode.INSTRUCTION)
+	simulate(control_unit, 999)
+
+	assert control_unit.out_buffer == "hi\0"
+	assert list(control_unit.data_path.memory[:5]) == [0, 0, 21, 0, 21]
+	assert len(code) < len(translate(source)[0])
+	link_map = (tmp_path / "link.map").read_text(encoding="utf-8").splitlines()[1:]
+	assert [line.split()[0::3] for line in link_map] == [
+		["code", "<main>"],
+		["data", "buf"],
+		["data", "n"],
+		["data", '."hi"'],
+	]
+
+
+@pytest.mark.parametrize("mode", list(RunMode))
+def test_native_stack_words(mode) -> None:
+	# prob2 on the stack with rot and over, and Euclid's gcd with mod
+	source = """
+	variable sum
+	variable count
+	variable divisor
+	: gcd while swap over mod dup 0 = endwhile drop ;
+	9 count !
+	2 8 10
+	while
+		rot rot dup 4 * rot + rot over +
+		count @ -1 + dup count ! 0 =
+	endwhile
+	sum ! drop drop
+	1071 462 gcd divisor !
+	"""
+	code, data_memory = translate(source)
+	control_unit = boot(code, data_memory, [], mode, Tracer(TraceLevel.OFF, []))
+	simulate(control_unit, 999)
+
+	assert list(control_unit.data_path.memory[:3]) == [4613732, 0, 21]
+	assert control_unit.tick_number == 923
+	prob2 = benchmark.workloads[0]
+	assert control_unit.tick_number < benchmark.execute(prob2, *translate(prob2.read_source()), mode).tick_number
+
+	with pytest.raises(AssertionError, match="Division by zero"):
+		run(*translate("7 0 mod"), 999, [], mode, Tracer(TraceLevel.OFF, []))
+
+
+@pytest.mark.golden_test("./golden/*.yaml")
+def test_golden_parallel_signals(golden) -> None:
+	code, data_memory = translate(str(golden["code"]))
+	input_tokens = eval(str(golden["input"]))
+	control_units = []
+	for parallel in [False, True]:
+		config = MachineConfig(parallel_signals=parallel)
+		control_unit = boot(code, data_memory, list(input_tokens), tracer=Tracer(TraceLevel.OFF, []), config=config)
+		simulate(control_unit, 999)
+		control_units.append(control_unit)
+	serial, parallel = control_units
+
+	# inputs arrive by tick, so only the idle loops waiting for them run more often
+	assert parallel.out_buffer == serial.out_buffer
+	assert list(parallel.data_path.memory) == list(serial.data_path.memory)
+	assert parallel.data_path.snapshot()["registers"] == serial.data_path.snapshot()["registers"]
+	assert parallel.tick_number < serial.tick_number
+
+
+def test_microcode_report() -> None:
+	for name, serial, parallel in microcode_report():
+		opcode_type, *branch = name.split(" ", 1)
+		assert serial == instruction_ticks.get(OpcodeType(opcode_type), 1) + int(branch == ["taken"])
+		assert 1 <= parallel <= serial
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import heapq
+
+
+class InterruptScheduler:
+	"""Pending input interrupts ordered by arrival tick.
+
+	Tokens that have arrived are moved to a second heap ordered by their position in
+	the input schedule, so the token served is the first listed one among those due,
+	exactly as the original linear scan chose it.
+
+	>>> scheduler = InterruptScheduler([(10, "a"), (5, "b"), (20, "c")])
+	>>> scheduler.is_due(4), scheduler.is_due(5)
+	(False, True)
+	>>> scheduler.pop_due(12), scheduler.pop_due(12), scheduler.pop_due(12)
+	('a', 'b', None)
+	>>> scheduler.next_arrival()
+	20
+	"""
+
+	def __init__(self, tokens: list[tuple] | None = None):
+		self.arrivals: list[tuple[int, int, str]] = []
+		self.due: list[tuple[int, str]] = []
+		self.scheduled = 0
+		for tick, char in tokens or []:
+			self.schedule(tick, char)
+
+	def __len__(self) -> int:
+		return len(self.arrivals) + len(self.due)
+
+	def schedule(self, tick: int, char: str) -> None:
+		heapq.heappush(self.arrivals, (tick, self.scheduled, char))
+		self.scheduled += 1
+
+	def is_due(self, tick: int) -> bool:
+		return bool(self.due) or (bool(self.arrivals) and self.arrivals[0][0] <= tick)
+
+	def next_arrival(self) -> int | None:
+		return self.arrivals[0][0] if self.arrivals else None
+
+	def pop_due(self, tick: int) -> str | None:
+		arrivals = self.arrivals
+		while arrivals and arrivals[0][0] <= tick:
+			_, order, char = heapq.heappop(arrivals)
+			heapq.heappush(self.due, (order, char))
+		if not self.due:
+			return None
+		return heapq.heappop(self.due)[1]
+
+	def snapshot(self) -> dict:
+		return {"arrivals": self.arrivals, "due": self.due, "scheduled": self.scheduled}
+
+	@classmethod
+	def from_snapshot(cls, state: dict) -> InterruptScheduler:
+		scheduler = cls()
+		scheduler.arrivals = [tuple(entry) for entry in state["arrivals"]]
+		scheduler.due = [tuple(entry) for entry in state["due"]]
+		scheduler.scheduled = state["scheduled"]
+		return scheduler
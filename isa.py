@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import json
+import mmap
+import struct
 from enum import Enum
 
 
@@ -9,6 +11,7 @@ class OpcodeParamType(str, Enum):
 	ADDR = "addr"
 	UNDEFINED = "undefined"
 	ADDR_REL = "addr_rel"
+	ROUTINE = "routine"
 
 
 class OpcodeParam:
@@ -39,11 +42,23 @@ class OpcodeType(str, Enum):
 	CALL = "call"
 	RET = "ret"
 	HALT = "halt"
+	ADDI = "addi"
+	EQI = "eqi"
+	NZJMP = "nzjmp"
+	DROP = "drop"
+	OVER = "over"
+	ROT = "rot"
+	MUL = "mul"
 
 	def __str__(self):
 		return str(self.value)
 
 
+# codes are stored in binary objects: new opcodes must only be appended to OpcodeType
+opcode_codes = {opcode_type: code for code, opcode_type in enumerate(OpcodeType)}
+code_opcodes = list(OpcodeType)
+
+
 class Opcode:
 	def __init__(self, opcode_type: OpcodeType, params: list[OpcodeParam]):
 		self.opcode_type = opcode_type
@@ -78,14 +93,23 @@ class TermType(Enum):
 		CALL,
 		STRING,
 		ENTRYPOINT,
-	) = range(26)
+		MOD,
+		ROT,
+		MUL,
+	) = range(29)
 
 
 term_opcode_mapping = {
 	"di": TermType.DI,
 	"ei": TermType.EI,
 	"dup": TermType.DUP,
+	"drop": TermType.DROP,
+	"over": TermType.OVER,
+	"rot": TermType.ROT,
+	"swap": TermType.SWAP,
 	"+": TermType.ADD,
+	"*": TermType.MUL,
+	"mod": TermType.MOD,
 	"omit": TermType.OMIT,
 	"read": TermType.READ,
 	"=": TermType.EQ,
@@ -120,3 +144,94 @@ def write_memory(filename: str, memory: list):
 def read_code(source_path: str) -> list:
 	with open(source_path, encoding="utf-8") as file:
 		return json.loads(file.read())
+
+
+# pc -> {"index", "word_number", "word", "definition"}; stored as a file or an object section
+SOURCE_MAP_SECTION = "SMAP"
+
+
+# proven stack bounds of a program, see stack_analysis.StackBounds
+STACK_BOUNDS_SECTION = "STCK"
+
+
+def encode_source_map(source_map: list[dict]) -> bytes:
+	return json.dumps(source_map).encode("utf-8")
+
+
+def write_source_map(filename: str, source_map: list[dict]):
+	with open(filename, "w", encoding="utf-8") as file:
+		json.dump(source_map, file, indent=1)
+
+
+def write_link_map(filename: str, link_map: list[dict]):
+	with open(filename, "w", encoding="utf-8") as file:
+		file.write(f"{'section':<8}{'address':>8}{'size':>8}  name\n")
+		for entry in link_map:
+			file.write(f"{entry['section']:<8}{entry['address']:>8}{entry['size']:>8}  {entry['name']}\n")
+
+
+def read_source_map(filename: str) -> list[dict]:
+	with open(filename, encoding="utf-8") as file:
+		return json.load(file)
+
+
+# Binary object: header, opcode byte column, int64 argument column, int64 data segment,
+# then tagged optional sections. Every part starts on an 8-byte boundary.
+OBJECT_MAGIC = b"SPO1"
+OBJECT_VERSION = 1
+object_header = struct.Struct("<4sHHIII4x")
+section_header = struct.Struct("<4sI")
+WORD_SIZE = 8
+
+
+def aligned(size: int) -> int:
+	return (size + WORD_SIZE - 1) // WORD_SIZE * WORD_SIZE
+
+
+def write_object(filename: str, code: list[dict], memory: list, sections: dict[str, bytes] | None = None):
+	sections = sections or {}
+	size = max((int(instr["index"]) + 1 for instr in code), default=0)
+	opcodes = bytearray(aligned(size))
+	args = [0] * size
+	for instr in code:
+		index = int(instr["index"])
+		opcodes[index] = opcode_codes[OpcodeType(instr["command"].lower())]
+		args[index] = int(instr.get("arg", 0))
+	with open(filename, "wb") as file:
+		file.write(object_header.pack(OBJECT_MAGIC, OBJECT_VERSION, 0, size, len(memory), len(sections)))
+		file.write(opcodes)
+		file.write(struct.pack(f"<{size}q", *args))
+		file.write(struct.pack(f"<{len(memory)}q", *memory))
+		for tag, payload in sections.items():
+			file.write(section_header.pack(tag.encode("ascii"), len(payload)))
+			file.write(payload + bytes(aligned(len(payload)) - len(payload)))
+
+
+def is_object(filename: str) -> bool:
+	with open(filename, "rb") as file:
+		return file.read(len(OBJECT_MAGIC)) == OBJECT_MAGIC
+
+
+class ObjectImage:
+	"""Views over a memory-mapped object file; the data segment is copy-on-write."""
+
+	def __init__(self, filename: str):
+		with open(filename, "rb") as file:
+			self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+		view = memoryview(self.buffer)
+		magic, version, _, size, data_size, section_count = object_header.unpack_from(view)
+		assert magic == OBJECT_MAGIC, "Not a program object"
+		assert version == OBJECT_VERSION, "Unsupported object version"
+		offset = object_header.size
+		self.opcodes = view[offset : offset + size]
+		offset += aligned(size)
+		self.args = view[offset : offset + size * WORD_SIZE].cast("q")
+		offset += size * WORD_SIZE
+		self.memory = view[offset : offset + data_size * WORD_SIZE].cast("q")
+		offset += data_size * WORD_SIZE
+		self.sections = {}
+		for _ in range(section_count):
+			tag, length = section_header.unpack_from(view, offset)
+			offset += section_header.size
+			self.sections[tag.decode("ascii")] = view[offset : offset + length]
+			offset += aligned(length)
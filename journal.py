@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import json
+import logging
+import struct
+import typing
+from collections import deque
+from enum import Enum
+
+logger = logging.getLogger("machine_logger")
+logger.setLevel(logging.INFO)
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(message)s")
+console_handler.setFormatter(formatter)
+logger.addHandler(console_handler)
+
+
+class TraceLevel(str, Enum):
+	OFF = "off"
+	INSTRUCTION = "instruction"
+	TICK = "tick"
+
+	def __str__(self) -> str:
+		return str(self.value)
+
+
+class TraceFormat(str, Enum):
+	TEXT = "text"
+	JSONL = "jsonl"
+	BINARY = "binary"
+
+	def __str__(self) -> str:
+		return str(self.value)
+
+
+class State(typing.NamedTuple):
+	tick: int
+	pc: int
+	sp: int
+	rsp: int
+	irq_request: bool
+	irq_on: bool
+	stack_head: list
+	return_head: list
+	data_head: int | None
+
+
+def format_state(state: State) -> str:
+	return (
+		"TICK: {:4} | PC: {:4} | SP: {:3} | RSP: {:3} | IRQ_R {:2} | IRQ_ON: {:3} | "
+		"S_HEAD : {} | RS_HEAD : {} | DATA_HEAD {:3}"
+	).format(
+		state.tick,
+		state.pc,
+		state.sp,
+		state.rsp,
+		state.irq_request,
+		state.irq_on,
+		str(state.stack_head),
+		str(state.return_head),
+		"?" if state.data_head is None else state.data_head,
+	)
+
+
+BINARY_MAGIC = b"TRC1"
+HEAD_SIZE = 3
+binary_record = struct.Struct("<qqqq??B3qB3q?q")
+
+
+def pack_state(state: State) -> bytes:
+	stack_head = [*state.stack_head, 0, 0, 0][:HEAD_SIZE]
+	return_head = [*state.return_head, 0, 0, 0][:HEAD_SIZE]
+	return binary_record.pack(
+		state.tick,
+		state.pc,
+		state.sp,
+		state.rsp,
+		state.irq_request,
+		state.irq_on,
+		len(state.stack_head),
+		*stack_head,
+		len(state.return_head),
+		*return_head,
+		state.data_head is not None,
+		state.data_head or 0,
+	)
+
+
+def unpack_state(record: bytes) -> State:
+	fields = binary_record.unpack(record)
+	tick, pc, sp, rsp, irq_request, irq_on, stack_len = fields[:7]
+	stack_head = list(fields[7 : 7 + stack_len])
+	return_len = fields[10]
+	return_head = list(fields[11 : 11 + return_len])
+	has_data, data_head = fields[14:]
+	return State(tick, pc, sp, rsp, irq_request, irq_on, stack_head, return_head, data_head if has_data else None)
+
+
+def read_binary_trace(path: str) -> typing.Iterator[State]:
+	with open(path, "rb") as file:
+		assert file.read(len(BINARY_MAGIC)) == BINARY_MAGIC, "Not a binary trace"
+		while record := file.read(binary_record.size):
+			yield unpack_state(record)
+
+
+class ListSink:
+	def __init__(self):
+		self.lines = []
+
+	def write(self, state: State) -> None:
+		self.lines.append(format_state(state))
+
+	def close(self) -> None:
+		pass
+
+
+class LoggerSink:
+	def write(self, state: State) -> None:
+		logger.info(format_state(state))
+
+	def close(self) -> None:
+		pass
+
+
+class RingBufferSink:
+	def __init__(self, capacity: int):
+		assert capacity > 0, "Ring buffer capacity must be greater than zero"
+		self.states = deque(maxlen=capacity)
+
+	def write(self, state: State) -> None:
+		self.states.append(state)
+
+	def lines(self) -> list[str]:
+		return [format_state(state) for state in self.states]
+
+	def close(self) -> None:
+		pass
+
+
+class FileSink:
+	def __init__(self, path: str, trace_format: TraceFormat):
+		self.trace_format = trace_format
+		if trace_format is TraceFormat.BINARY:
+			self.file = open(path, "wb")
+			self.file.write(BINARY_MAGIC)
+		else:
+			self.file = open(path, "w", encoding="utf-8")
+
+	def write(self, state: State) -> None:
+		match self.trace_format:
+			case TraceFormat.BINARY:
+				self.file.write(pack_state(state))
+			case TraceFormat.JSONL:
+				self.file.write(json.dumps(state._asdict()) + "\n")
+			case TraceFormat.TEXT:
+				self.file.write(format_state(state) + "\n")
+
+	def close(self) -> None:
+		self.file.close()
+
+
+class Tracer:
+	def __init__(self, level: TraceLevel = TraceLevel.TICK, sinks: list | None = None):
+		self.level = level
+		self.sinks = [ListSink()] if sinks is None else sinks
+
+	@property
+	def per_tick(self) -> bool:
+		return self.level is TraceLevel.TICK and bool(self.sinks)
+
+	@property
+	def per_instruction(self) -> bool:
+		return self.level is TraceLevel.INSTRUCTION and bool(self.sinks)
+
+	@property
+	def journal(self) -> list[str]:
+		for sink in self.sinks:
+			if isinstance(sink, ListSink):
+				return sink.lines
+		return []
+
+	def record(self, state: State) -> None:
+		for sink in self.sinks:
+			sink.write(state)
+
+	def close(self) -> None:
+		for sink in self.sinks:
+			sink.close()
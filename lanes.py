@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import typing
+from functools import partial
+
+from alu import ALUOpcode, alu_immediate_opcode_mapping, alu_opcode_mapping
+from batch import format_summary
+from datapath import STACK_PTR_OFFSET
+from devices import DEFAULT_INPUT
+from interrupts import InterruptScheduler
+from isa import ObjectImage, OpcodeType, code_opcodes, is_object, opcode_codes, read_code
+from machine import ControlUnit, MachineConfig, read_tokens
+
+try:
+	import numpy as np
+except ImportError:  # optional: only lane-parallel runs need numpy
+	np = None
+
+# is_due() is true regardless of the tick once a token is waiting
+ALWAYS_DUE = -(1 << 63)
+NEVER_DUE = (1 << 63) - 1
+
+alu_functions = {
+	ALUOpcode.INC_A: lambda a, _b: a + 1,
+	ALUOpcode.INC_B: lambda _a, b: b + 1,
+	ALUOpcode.DEC_A: lambda a, _b: a - 1,
+	ALUOpcode.DEC_B: lambda _a, b: b - 1,
+	ALUOpcode.ADD: lambda a, b: a + b,
+	ALUOpcode.EQ: lambda a, b: (a == b).astype(np.int64),
+	ALUOpcode.MUL: lambda a, b: a * b,
+	ALUOpcode.MOD: lambda a, b: b % a,
+}
+
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def product_overflowed(a: np.ndarray, b: np.ndarray, result: np.ndarray) -> np.ndarray:
+	# a wrapped product is never an exact multiple of a, except min * -1 that wraps to min
+	divisor = np.where(a == 0, 1, a)
+	with np.errstate(over="ignore"):
+		inexact = (a != 0) & (result // divisor != b)
+	return inexact | ((a == -1) & (b == INT64_MIN))
+
+
+# results that wrapped around int64, where the scalar model keeps the exact integer
+alu_overflows = {
+	ALUOpcode.INC_A: lambda a, _b, _result: a == INT64_MAX,
+	ALUOpcode.INC_B: lambda _a, b, _result: b == INT64_MAX,
+	ALUOpcode.DEC_A: lambda a, _b, _result: a == INT64_MIN,
+	ALUOpcode.DEC_B: lambda _a, b, _result: b == INT64_MIN,
+	ALUOpcode.ADD: lambda a, b, result: ((a ^ result) & (b ^ result)) < 0,
+	ALUOpcode.MUL: product_overflowed,
+}
+
+
+class LaneResult(typing.NamedTuple):
+	output: str
+	# raw tick counter, as machine.run returns it
+	ticks: int
+	instructions: int
+	halted: bool
+	error: str | None
+
+
+class LaneMachine:
+	"""One program run over many input schedules at once, one lane per schedule.
+
+	Registers are int64 vectors and memories are (lanes, size) matrices. Each step
+	groups the running lanes by the opcode at their pc and applies every handler to
+	its group as one array operation, so lanes may diverge freely; halted and failed
+	lanes drop out of the running set. Handlers follow the instruction-accurate
+	exec_* handlers of ControlUnit, so output and tick counts match machine.run.
+	Values are int64, while the default list storage of the scalar model keeps
+	exact integers: a lane whose ALU result leaves the int64 range fails with
+	OverflowError instead of wrapping around.
+	"""
+
+	def __init__(
+		self,
+		code: list | ObjectImage,
+		memory: list | None,
+		schedules: list[list[tuple]],
+		config: MachineConfig | None = None,
+	):
+		assert np is not None, "Lane-parallel emulation needs numpy"
+		if config is None:
+			config = MachineConfig()
+		if isinstance(code, ObjectImage):
+			memory = code.memory
+			self.opcodes = np.asarray(code.opcodes, dtype=np.int64)
+			self.args = np.asarray(code.args, dtype=np.int64)
+		else:
+			self.opcodes, self.args = self.decode(code, config.program_memory_size)
+		lanes = self.lanes = len(schedules)
+		memory_size = config.memory_size or len(memory)
+		assert len(memory) <= memory_size, "Memory image larger than memory size"
+		self.memory = np.zeros((lanes, memory_size), dtype=np.int64)
+		self.memory[:, : len(memory)] = np.asarray(memory, dtype=np.int64)
+		self.data_stack = np.zeros((lanes, config.data_stack_size), dtype=np.int64)
+		self.return_stack = np.zeros((lanes, config.return_stack_size), dtype=np.int64)
+
+		def register(value: int = 0) -> np.ndarray:
+			return np.full(lanes, value, dtype=np.int64)
+
+		self.pc, self.top, self.next, self.temp = register(), register(), register(), register()
+		self.sp, self.rsp = register(STACK_PTR_OFFSET), register(STACK_PTR_OFFSET)
+		self.ticks, self.instructions = register(ControlUnit.tick_number), register(ControlUnit.instruction_number)
+		self.io = register(ord(DEFAULT_INPUT))
+		self.irq_on = np.ones(lanes, dtype=bool)
+		self.halted = np.zeros(lanes, dtype=bool)
+		self.failed = np.zeros(lanes, dtype=bool)
+		self.errors: list[str | None] = [None] * lanes
+		self.schedulers = [InterruptScheduler(tokens) for tokens in schedules]
+		self.due_tick = register(NEVER_DUE)
+		for lane in range(lanes):
+			self.update_due_tick(lane)
+		# OMIT appends (lanes, chars) pairs, joined into per-lane strings by outputs()
+		self.omitted: list[tuple[np.ndarray, np.ndarray]] = []
+		self.handlers = self.build_dispatch_table()
+
+	@staticmethod
+	def decode(code: list, program_memory_size: int) -> tuple[np.ndarray, np.ndarray]:
+		opcodes = np.full(program_memory_size, opcode_codes[OpcodeType.NOP], dtype=np.int64)
+		args = np.zeros(program_memory_size, dtype=np.int64)
+		for opcode in code:
+			mem_cell = int(opcode["index"])
+			assert 0 <= mem_cell < program_memory_size, "Program index out of memory size"
+			opcodes[mem_cell] = opcode_codes[OpcodeType(opcode["command"].lower())]
+			args[mem_cell] = int(opcode.get("arg", 0))
+		return opcodes, args
+
+	def build_dispatch_table(self) -> list[typing.Callable]:
+		handlers = {
+			OpcodeType.NOP: self.exec_nop,
+			OpcodeType.PUSH: self.exec_push,
+			OpcodeType.OMIT: self.exec_omit,
+			OpcodeType.READ: self.exec_read,
+			OpcodeType.SWAP: self.exec_swap,
+			OpcodeType.DUP: self.exec_dup,
+			OpcodeType.DROP: self.exec_drop,
+			OpcodeType.OVER: self.exec_over,
+			OpcodeType.ROT: self.exec_rot,
+			OpcodeType.LOAD: self.exec_load,
+			OpcodeType.STORE: self.exec_store,
+			OpcodeType.ZJMP: partial(self.exec_branch, np.equal),
+			OpcodeType.NZJMP: partial(self.exec_branch, np.not_equal),
+			OpcodeType.JMP: self.exec_jmp,
+			OpcodeType.CALL: self.exec_call,
+			OpcodeType.DI: self.exec_di,
+			OpcodeType.EI: self.exec_ei,
+			OpcodeType.RET: self.exec_ret,
+			OpcodeType.HALT: self.exec_halt,
+		}
+		for opcode_type, alu_opcode in alu_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.exec_alu, alu_opcode)
+		for opcode_type, alu_opcode in alu_immediate_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.exec_alu_immediate, alu_opcode)
+		return [handlers.get(opcode_type, self.exec_nop) for opcode_type in code_opcodes]
+
+	def update_due_tick(self, lane: int) -> None:
+		scheduler = self.schedulers[lane]
+		if scheduler.due:
+			self.due_tick[lane] = ALWAYS_DUE
+		else:
+			arrival = scheduler.next_arrival()
+			self.due_tick[lane] = NEVER_DUE if arrival is None else arrival
+
+	def fail(self, lanes: np.ndarray, bad: np.ndarray, message: str) -> np.ndarray:
+		# stops the lanes whose check failed, as the scalar model raises there; returns the rest
+		for lane in lanes[bad]:
+			self.errors[lane] = message
+		self.failed[lanes[bad]] = True
+		return lanes[~bad]
+
+	def step(self, lanes: np.ndarray) -> None:
+		self.instructions[lanes] += 1
+		codes = self.opcodes[self.pc[lanes]]
+		for code in np.unique(codes):
+			self.handlers[code](lanes[codes == code])
+		lanes = lanes[~(self.halted[lanes] | self.failed[lanes])]
+		self.handle_irq(lanes)
+		self.pc[lanes] += 1
+
+	def run(self, limit: int, tick_limit: int | None = None) -> list[LaneResult]:
+		# every lane stops as simulate() would stop the scalar model
+		while True:
+			running = ~(self.halted | self.failed) & (self.instructions < limit)
+			if tick_limit is not None:
+				running &= self.ticks < tick_limit
+			lanes = np.flatnonzero(running)
+			if not lanes.size:
+				break
+			self.step(lanes)
+		return self.results()
+
+	def outputs(self) -> list[str]:
+		if not self.omitted:
+			return [""] * self.lanes
+		lanes = np.concatenate([lanes for lanes, _ in self.omitted])
+		chars = np.concatenate([chars for _, chars in self.omitted])
+		order = np.argsort(lanes, kind="stable")
+		bounds = np.searchsorted(lanes[order], np.arange(self.lanes + 1))
+		chars = chars[order].tolist()
+		return ["".join(map(chr, chars[start:end])) for start, end in itertools.pairwise(bounds)]
+
+	def results(self) -> list[LaneResult]:
+		return [
+			LaneResult(output, int(ticks), int(instructions), bool(halted), error)
+			for output, ticks, instructions, halted, error in zip(
+				self.outputs(), self.ticks, self.instructions, self.halted, self.errors
+			)
+		]
+
+	def handle_irq(self, lanes: np.ndarray) -> None:
+		lanes = lanes[self.irq_on[lanes] & (self.due_tick[lanes] <= self.ticks[lanes])]
+		if not lanes.size:
+			return
+		for lane in lanes:
+			self.io[lane] = ord(self.schedulers[lane].pop_due(self.ticks[lane]))
+			self.update_due_tick(lane)
+		self.irq_on[lanes] = False
+		lanes = self.push_return_stack(lanes)
+		self.pc[lanes] = 0
+		self.ticks[lanes] += 3
+
+	def push_return_stack(self, lanes: np.ndarray) -> np.ndarray:
+		rsp = self.rsp[lanes]
+		lanes = self.fail(
+			lanes, (rsp < 0) | (rsp >= self.return_stack.shape[1]), "AssertionError: Return stack overflow"
+		)
+		self.return_stack[lanes, self.rsp[lanes]] = self.pc[lanes]
+		self.rsp[lanes] += 1
+		return lanes
+
+	def pop_data_stack(self, lanes: np.ndarray) -> np.ndarray:
+		self.sp[lanes] -= 1
+		sp = self.sp[lanes]
+		lanes = self.fail(lanes, (sp < 0) | (sp >= self.data_stack.shape[1]), "AssertionError: Address out of bounds")
+		self.next[lanes] = self.data_stack[lanes, self.sp[lanes]]
+		return lanes
+
+	def push_data_stack(self, lanes: np.ndarray) -> np.ndarray:
+		sp = self.sp[lanes]
+		lanes = self.fail(lanes, (sp < 0) | (sp >= self.data_stack.shape[1]), "AssertionError: Data stack overflow")
+		self.data_stack[lanes, self.sp[lanes]] = self.next[lanes]
+		self.sp[lanes] += 1
+		return lanes
+
+	def check_address(self, lanes: np.ndarray) -> np.ndarray:
+		top = self.top[lanes]
+		return self.fail(lanes, (top < 0) | (top >= self.memory.shape[1]), "AssertionError: Address out of bounds")
+
+	def exec_nop(self, _lanes: np.ndarray) -> None:
+		pass
+
+	def alu(self, operation: ALUOpcode, lanes: np.ndarray, b: np.ndarray) -> np.ndarray:
+		# latches the result into top for the lanes it fits in; returns them
+		a = self.top[lanes]
+		if operation is ALUOpcode.MOD:
+			bad = a == 0
+			lanes, a, b = self.fail(lanes, bad, "AssertionError: Division by zero"), a[~bad], b[~bad]
+		result = alu_functions[operation](a, b)
+		if operation in alu_overflows:
+			bad = alu_overflows[operation](a, b, result)
+			lanes, result = self.fail(lanes, bad, "OverflowError: ALU result out of int64 range"), result[~bad]
+		self.top[lanes] = result
+		return lanes
+
+	def exec_alu(self, operation: ALUOpcode, lanes: np.ndarray) -> None:
+		lanes = self.alu(operation, lanes, self.next[lanes])
+		lanes = self.pop_data_stack(lanes)
+		self.ticks[lanes] += 4
+
+	def exec_alu_immediate(self, operation: ALUOpcode, lanes: np.ndarray) -> None:
+		lanes = self.alu(operation, lanes, self.args[self.pc[lanes]])
+		self.ticks[lanes] += 2
+
+	def exec_push(self, lanes: np.ndarray) -> None:
+		lanes = self.push_data_stack(lanes)
+		self.next[lanes] = self.top[lanes]
+		self.top[lanes] = self.args[self.pc[lanes]]
+		self.ticks[lanes] += 4
+
+	def exec_omit(self, lanes: np.ndarray) -> None:
+		chars = self.next[lanes]
+		lanes = self.fail(lanes, (chars < 0) | (chars > 0x10FFFF), "ValueError: chr() arg not in range(0x110000)")
+		self.omitted.append((lanes, self.next[lanes]))
+		for _ in range(2):
+			self.top[lanes] = self.next[lanes]
+			lanes = self.pop_data_stack(lanes)
+		self.ticks[lanes] += 6
+
+	def exec_read(self, lanes: np.ndarray) -> None:
+		# net effect of exec_read: the second stack cell is written back, top takes the input
+		self.top[lanes] = self.next[lanes]
+		self.sp[lanes] -= 1
+		lanes = self.push_data_stack(lanes)
+		self.next[lanes] = self.top[lanes]
+		self.top[lanes] = self.io[lanes]
+		self.ticks[lanes] += 6
+
+	def exec_store(self, lanes: np.ndarray) -> None:
+		lanes = self.check_address(lanes)
+		self.memory[lanes, self.top[lanes]] = self.next[lanes]
+		lanes = self.pop_data_stack(lanes)
+		self.top[lanes] = self.next[lanes]
+		lanes = self.pop_data_stack(lanes)
+		self.ticks[lanes] += 6
+
+	def exec_swap(self, lanes: np.ndarray) -> None:
+		self.temp[lanes] = self.top[lanes]
+		self.top[lanes] = self.next[lanes]
+		self.next[lanes] = self.temp[lanes]
+		self.ticks[lanes] += 3
+
+	def exec_dup(self, lanes: np.ndarray) -> None:
+		lanes = self.push_data_stack(lanes)
+		self.next[lanes] = self.top[lanes]
+		self.ticks[lanes] += 3
+
+	def exec_drop(self, lanes: np.ndarray) -> None:
+		self.top[lanes] = self.next[lanes]
+		lanes = self.pop_data_stack(lanes)
+		self.ticks[lanes] += 3
+
+	def exec_over(self, lanes: np.ndarray) -> None:
+		lanes = self.push_data_stack(lanes)
+		self.temp[lanes] = self.top[lanes]
+		self.top[lanes] = self.next[lanes]
+		self.next[lanes] = self.temp[lanes]
+		self.ticks[lanes] += 5
+
+	def exec_rot(self, lanes: np.ndarray) -> None:
+		# the third cell goes to the top through temp, the second takes its place
+		self.temp[lanes] = self.next[lanes]
+		lanes = self.pop_data_stack(lanes)
+		self.temp[lanes], self.next[lanes] = self.next[lanes], self.temp[lanes]
+		lanes = self.push_data_stack(lanes)
+		self.next[lanes] = self.top[lanes]
+		self.top[lanes] = self.temp[lanes]
+		self.ticks[lanes] += 6
+
+	def exec_load(self, lanes: np.ndarray) -> None:
+		lanes = self.check_address(lanes)
+		self.top[lanes] = self.memory[lanes, self.top[lanes]]
+		self.ticks[lanes] += 1
+
+	def exec_branch(self, condition: np.ufunc, lanes: np.ndarray) -> None:
+		# ZJMP and NZJMP: the lanes that take the branch pay one more tick
+		taken = lanes[condition(self.top[lanes], 0)]
+		self.pc[taken] = self.args[self.pc[taken]] - 1
+		self.ticks[taken] += 1
+		self.top[lanes] = self.next[lanes]
+		lanes = self.pop_data_stack(lanes)
+		self.ticks[lanes] += 3
+
+	def exec_jmp(self, lanes: np.ndarray) -> None:
+		self.pc[lanes] = self.args[self.pc[lanes]] - 1
+		self.ticks[lanes] += 1
+
+	def exec_call(self, lanes: np.ndarray) -> None:
+		lanes = self.push_return_stack(lanes)
+		self.pc[lanes] = self.args[self.pc[lanes]] - 1
+		self.ticks[lanes] += 3
+
+	def exec_di(self, lanes: np.ndarray) -> None:
+		self.ticks[lanes] += 1
+		self.irq_on[lanes] = False
+
+	def exec_ei(self, lanes: np.ndarray) -> None:
+		# as signal_latch_ps: a pending interrupt is taken at once, returning to this EI
+		self.ticks[lanes] += 1
+		self.irq_on[lanes] = True
+		self.handle_irq(lanes)
+
+	def exec_ret(self, lanes: np.ndarray) -> None:
+		self.rsp[lanes] -= 1
+		self.pc[lanes] = self.return_stack[lanes, self.rsp[lanes]]
+		self.ticks[lanes] += 2
+
+	def exec_halt(self, lanes: np.ndarray) -> None:
+		self.halted[lanes] = True
+
+
+def run_lanes(
+	code: list | ObjectImage,
+	memory: list | None,
+	schedules: list[list[tuple]],
+	limit: int,
+	tick_limit: int | None = None,
+	config: MachineConfig | None = None,
+) -> list[LaneResult]:
+	return LaneMachine(code, memory, schedules, config).run(limit, tick_limit)
+
+
+def main(code_path: str, memory_path: str | None, token_paths: list[str], limit: int, output_path: str) -> list[dict]:
+	if is_object(code_path):
+		code, memory = ObjectImage(code_path), None
+	else:
+		code, memory = read_code(code_path), read_code(memory_path)
+	schedules = [read_tokens(path) for path in token_paths]
+	results = [
+		{
+			"name": path,
+			# same convention as the batch summary and the "Number of ticks" journal header
+			"ticks": result.ticks - 1,
+			"instructions": result.instructions,
+			"halted": result.halted,
+			"output": result.output,
+			"error": result.error,
+		}
+		for path, result in zip(token_paths, run_lanes(code, memory, schedules, limit))
+	]
+	with open(output_path, "w", encoding="utf-8") as file:
+		json.dump(results, file, indent=1)
+	return results
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run one program over many input schedules in numpy lanes")
+	parser.add_argument("code_file")
+	parser.add_argument("memory_file", nargs="?", default=None, help="omitted for object files")
+	parser.add_argument("--input", action="append", required=True, help="input schedule, one lane per file")
+	parser.add_argument("--limit", type=int, default=1000)
+	parser.add_argument("--output", default="lanes.json", help="per-lane results")
+	args = parser.parse_args()
+	print(format_summary(main(args.code_file, args.memory_file, args.input, args.limit, args.output)))
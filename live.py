@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import codecs
+import contextlib
+import sys
+import typing
+from pathlib import Path
+
+from block_compiler import BlockEngine
+from devices import END_OF_INPUT, BufferSink, DeviceBus
+from fast_forward import FastForward
+from isa import ObjectImage, is_object, read_code
+from journal import TraceLevel, Tracer
+from machine import ControlUnit, MachineConfig, RunMode, boot
+
+# instructions run between two chances for the other tasks of the event loop
+SLICE_SIZE = 10_000
+LIVE_LIMIT = 10**15
+READ_SIZE = 1 << 12
+
+
+class ChunkSink(BufferSink):
+	"""Output port handed out in chunks: take() returns the text written since the last call."""
+
+	def __init__(self):
+		super().__init__()
+		self.decoder = codecs.getincrementaldecoder("utf-8")("surrogatepass")
+
+	def take(self) -> str:
+		text = self.decoder.decode(bytes(self.buffer))
+		self.buffer.clear()
+		return text
+
+
+class LiveSession:
+	"""A control unit run as a cooperative task, with input that arrives while it runs.
+
+	Every token from the input source is scheduled as an interrupt at the tick the
+	machine has reached. The machine runs in slices of SLICE_SIZE instructions and
+	yields to the event loop between them; in an idle loop with no pending input it
+	sleeps until the next token instead of spinning. Output of the default port is
+	published after every slice through output().
+	"""
+
+	def __init__(
+		self,
+		code: list | ObjectImage,
+		memory: list | None,
+		mode: RunMode = RunMode.BLOCK,
+		config: MachineConfig | None = None,
+		limit: int = LIVE_LIMIT,
+		end_of_input: str | None = END_OF_INPUT,
+	):
+		self.sink = ChunkSink()
+		# any number of tokens may arrive, so proven stack bounds must hold for all of them
+		self.control_unit = boot(
+			code, memory, [], mode, Tracer(TraceLevel.OFF, []), config, DeviceBus(output=self.sink), sys.maxsize
+		)
+		self.limit = limit
+		# delivered once the source is exhausted, so programs like cat can stop
+		self.end_of_input = end_of_input
+		step = self.control_unit.fetch_single_command
+		if mode is RunMode.BLOCK:
+			step = BlockEngine(self.control_unit, limit).step
+		self.fast_forward = FastForward(self.control_unit, step, limit, live=True)
+		self.input_ready = asyncio.Event()
+		self.input_closed = False
+		self.chunks: asyncio.Queue[str | None] = asyncio.Queue()
+
+	def deliver(self, char: str) -> None:
+		control_unit = self.control_unit
+		control_unit.interrupts.schedule(control_unit.tick_number, char)
+		self.input_ready.set()
+
+	async def feed(self, tokens: typing.AsyncIterable[str]) -> None:
+		try:
+			async for token in tokens:
+				for char in token:
+					self.deliver(char)
+			if self.end_of_input is not None:
+				self.deliver(self.end_of_input)
+		finally:
+			self.input_closed = True
+			self.input_ready.set()
+
+	def running(self) -> bool:
+		control_unit = self.control_unit
+		return not control_unit.halted and control_unit.instruction_number < self.limit
+
+	def run_slice(self) -> None:
+		step = self.fast_forward.step
+		# stdout may carry the program output (serve_pipe), so the HALT message goes to stderr
+		with contextlib.redirect_stdout(sys.stderr):
+			for _ in range(SLICE_SIZE):
+				if not self.running():
+					return
+				try:
+					step()
+				except StopIteration:
+					return
+				if self.fast_forward.waiting:
+					return
+
+	async def run(self, tokens: typing.AsyncIterable[str]) -> ControlUnit:
+		feeder = asyncio.create_task(self.feed(tokens))
+		try:
+			while self.running():
+				self.input_ready.clear()
+				self.run_slice()
+				self.publish()
+				if not self.fast_forward.waiting:
+					await asyncio.sleep(0)
+				elif self.input_closed and not self.control_unit.interrupts:
+					# idle with nothing left to arrive: the program would spin forever
+					break
+				else:
+					await self.input_ready.wait()
+		finally:
+			feeder.cancel()
+			self.publish()
+			self.chunks.put_nowait(None)
+		return self.control_unit
+
+	def publish(self) -> None:
+		text = self.sink.take()
+		if text:
+			self.chunks.put_nowait(text)
+
+	async def output(self) -> typing.AsyncIterator[str]:
+		while (chunk := await self.chunks.get()) is not None:
+			yield chunk
+
+
+async def stream_tokens(reader: asyncio.StreamReader) -> typing.AsyncIterator[str]:
+	# UTF-8 text from a pipe or socket, as it arrives
+	decoder = codecs.getincrementaldecoder("utf-8")("replace")
+	while data := await reader.read(READ_SIZE):
+		if text := decoder.decode(data):
+			yield text
+	if text := decoder.decode(b"", final=True):
+		yield text
+
+
+async def open_pipe(pipe: typing.IO) -> asyncio.StreamReader:
+	loop = asyncio.get_running_loop()
+	reader = asyncio.StreamReader()
+	await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+	return reader
+
+
+async def run_session(session: LiveSession, tokens: typing.AsyncIterable[str], write: typing.Callable) -> ControlUnit:
+	async def forward() -> None:
+		async for chunk in session.output():
+			await write(chunk)
+
+	forwarder = asyncio.create_task(forward())
+	control_unit = await session.run(tokens)
+	await forwarder
+	return control_unit
+
+
+async def serve_pipe(code: list | ObjectImage, memory: list | None, pipe: typing.IO, **options) -> ControlUnit:
+	async def write(chunk: str) -> None:
+		sys.stdout.write(chunk)
+		sys.stdout.flush()
+
+	return await run_session(LiveSession(code, memory, **options), stream_tokens(await open_pipe(pipe)), write)
+
+
+async def serve_unix(code: list | ObjectImage, memory: list | None, path: str, **options) -> None:
+	# one session per connection, all of them on this event loop
+	async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		async def write(chunk: str) -> None:
+			writer.write(chunk.encode("utf-8", "surrogatepass"))
+			await writer.drain()
+
+		try:
+			await run_session(LiveSession(code, memory, **options), stream_tokens(reader), write)
+		finally:
+			writer.close()
+
+	server = await asyncio.start_unix_server(handle, path)
+	async with server:
+		await server.serve_forever()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run the processor model on live input")
+	parser.add_argument("code_file")
+	parser.add_argument("memory_file", nargs="?", default=None, help="omitted for object files")
+	parser.add_argument("--socket", default=None, help="serve sessions on a UNIX socket instead of stdin/stdout")
+	parser.add_argument("--mode", type=RunMode, choices=[RunMode.INSTRUCTION, RunMode.BLOCK], default=RunMode.BLOCK)
+	parser.add_argument("--limit", type=int, default=LIVE_LIMIT, help="instruction limit per session")
+	args = parser.parse_args()
+	if is_object(args.code_file):
+		code, memory = ObjectImage(args.code_file), None
+	elif args.memory_file is None:
+		parser.error("memory_file is required for a JSON program")
+	else:
+		code, memory = read_code(args.code_file), read_code(args.memory_file)
+	options = {"mode": args.mode, "limit": args.limit}
+	if args.socket is None:
+		asyncio.run(serve_pipe(code, memory, sys.stdin, **options))
+	else:
+		Path(args.socket).unlink(missing_ok=True)
+		asyncio.run(serve_unix(code, memory, args.socket, **options))
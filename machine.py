@@ -1,62 +1,263 @@
 from __future__ import annotations
 
+import argparse
 import json
-import logging
-import sys
 import typing
+from array import array
+from enum import Enum
 from functools import partial
 
-from alu import opcode_to_alu_opcode
-from datapath import DataPath, Selector
-from isa import OpcodeType, read_code
-
-logger = logging.getLogger("machine_logger")
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(message)s")
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+from alu import alu_immediate_opcode_mapping, alu_opcode_mapping
+from block_compiler import BlockEngine
+from datapath import DataPath, Selector, Storage
+from devices import BufferSink, DeviceBus, InputLatch, StreamSink
+from fast_forward import FastForward
+from interrupts import InterruptScheduler
+from isa import ObjectImage, OpcodeType, code_opcodes, is_object, opcode_codes, read_code
+from journal import FileSink, ListSink, LoggerSink, RingBufferSink, State, TraceFormat, TraceLevel, Tracer
+from microcode import schedule, signal_key
+from profiler import Profiler, load_source_map
+from snapshot import read_snapshot, write_snapshot
+from stack_analysis import attached_bounds
 
 irq_request = "IRQ_R"
 irq_on = "IRQ_ON"
 
 
-class ControlUnit:
-	out_buffer = ""
-	journal = []
-	IO = "h"
+class RunMode(str, Enum):
+	TICK = "tick"
+	INSTRUCTION = "instruction"
+	BLOCK = "block"
+
+	def __str__(self) -> str:
+		return str(self.value)
+
+
+class MachineConfig:
+	def __init__(
+		self,
+		memory_size: int | None = None,
+		data_stack_size: int = 1024,
+		return_stack_size: int = 1024,
+		program_memory_size: int = 1024,
+		storage: Storage = Storage.LIST,
+		fast_forward: bool = True,
+		stack_checks: bool = False,
+		parallel_signals: bool = False,
+	):
+		# memory_size None means "as large as the memory image"
+		self.memory_size = memory_size
+		self.data_stack_size = data_stack_size
+		self.return_stack_size = return_stack_size
+		self.program_memory_size = program_memory_size
+		# lists keep exact integers; array and paged cells are int64 and reject wider values
+		self.storage = storage
+		self.fast_forward = fast_forward
+		# keep stack pointer checks even when the program carries proven stack bounds
+		self.stack_checks = stack_checks
+		# tick mode issues independent signals of an instruction in the same tick
+		self.parallel_signals = parallel_signals
 
-	already_fetched: list[bool] = []
-	tokens: list[tuple] = []
 
+class ControlUnit:
 	tick_number = 0
 	instruction_number = 0
-
-	def __init__(self, data_path: DataPath, program_memory_size: int, input_tokens: list[tuple]):
+	# ticks spent entering interrupt handlers, kept apart from the interrupted instruction
+	interrupt_ticks = 0
+
+	def __init__(
+		self,
+		data_path: DataPath,
+		program_memory_size: int,
+		input_tokens: list[tuple],
+		mode: RunMode = RunMode.TICK,
+		tracer: Tracer | None = None,
+		bus: DeviceBus | None = None,
+		checked: bool = True,
+		parallel: bool = False,
+	):
 		self.data_path = data_path
-		self.tokens = input_tokens
-		self.already_fetched = [False for _ in input_tokens]
+		self.mode = mode
+		self.parallel = parallel
+		# unchecked fast handlers trust stack bounds proven at translation time
+		self.checked = checked or mode is RunMode.TICK
+		self.bus = DeviceBus() if bus is None else bus
+		self.tracer = Tracer(TraceLevel.OFF, []) if tracer is None else tracer
+		assert not (mode is not RunMode.TICK and self.tracer.level is TraceLevel.TICK), (
+			"Tick-level trace needs tick run mode"
+		)
+		assert not (parallel and mode is not RunMode.TICK), "Parallel signals need tick run mode"
+		self.trace_ticks = self.tracer.per_tick
+		self.trace_instructions = self.tracer.per_instruction
+		self.interrupts = InterruptScheduler(input_tokens)
 		self.program_memory_size = program_memory_size
-		self.program_memory = [{"index": x, "command": 0, "arg": 0} for x in range(self.program_memory_size)]
+		self.opcodes = array("B", [opcode_codes[OpcodeType.NOP]] * program_memory_size)
+		self.args = array("q", [0] * program_memory_size)
+		if mode is not RunMode.TICK:
+			self.handlers = self.build_fast_dispatch_table()
+			self.enter_interrupt = self.exec_interrupt_entry
+			if not self.checked:
+				self.pop_data_stack = self.pop_data_stack_unchecked
+				self.push_data_stack = self.push_data_stack_unchecked
+				self.push_return_stack = self.push_return_stack_unchecked
+		else:
+			self.handlers = self.build_dispatch_table()
+			self.enter_interrupt = self.handle_interrupt_entry
+		if parallel:
+			# the microcode issues its signals, they are applied when the instruction retires
+			self.pending: list[partial] = []
+			self.tick = self.pending.append
+			self.handlers = [self.retiring(handler) for handler in self.handlers]
+			self.enter_interrupt = self.retiring(self.enter_interrupt)
 		self.ps = {irq_request: False, irq_on: True}
+		self.halted = False
+
+	def build_dispatch_table(self) -> list[typing.Callable]:
+		handlers = {
+			OpcodeType.NOP: self.handle_nop,
+			OpcodeType.PUSH: self.handle_push,
+			OpcodeType.OMIT: self.handle_omit,
+			OpcodeType.READ: self.handle_read,
+			OpcodeType.SWAP: self.handle_swap,
+			OpcodeType.DUP: self.handle_dup,
+			OpcodeType.DROP: self.handle_drop,
+			OpcodeType.OVER: self.handle_over,
+			OpcodeType.ROT: self.handle_rot,
+			OpcodeType.LOAD: self.handle_load,
+			OpcodeType.STORE: self.handle_store,
+			OpcodeType.ZJMP: self.handle_zjmp,
+			OpcodeType.NZJMP: self.handle_nzjmp,
+			OpcodeType.JMP: self.handle_jmp,
+			OpcodeType.CALL: self.handle_call,
+			OpcodeType.DI: self.handle_di,
+			OpcodeType.EI: self.handle_ei,
+			OpcodeType.RET: self.handle_ret,
+			OpcodeType.HALT: self.handle_halt,
+		}
+		for opcode_type, alu_opcode in alu_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.handle_alu, alu_opcode)
+		for opcode_type, alu_opcode in alu_immediate_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.handle_alu_immediate, alu_opcode)
+		return [handlers.get(opcode_type, self.handle_nop) for opcode_type in code_opcodes]
+
+	def build_fast_dispatch_table(self) -> list[typing.Callable]:
+		handlers = {
+			OpcodeType.NOP: self.handle_nop,
+			OpcodeType.PUSH: self.exec_push,
+			OpcodeType.OMIT: self.exec_omit,
+			OpcodeType.READ: self.exec_read,
+			OpcodeType.SWAP: self.exec_swap,
+			OpcodeType.DUP: self.exec_dup,
+			OpcodeType.DROP: self.exec_drop,
+			OpcodeType.OVER: self.exec_over,
+			OpcodeType.ROT: self.exec_rot,
+			OpcodeType.LOAD: self.exec_load,
+			OpcodeType.STORE: self.exec_store,
+			OpcodeType.ZJMP: self.exec_zjmp,
+			OpcodeType.NZJMP: self.exec_nzjmp,
+			OpcodeType.JMP: self.exec_jmp,
+			OpcodeType.CALL: self.exec_call,
+			OpcodeType.DI: self.exec_di,
+			OpcodeType.EI: self.exec_ei,
+			OpcodeType.RET: self.exec_ret,
+			OpcodeType.HALT: self.handle_halt,
+		}
+		for opcode_type, alu_opcode in alu_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.exec_alu, alu_opcode)
+		for opcode_type, alu_opcode in alu_immediate_opcode_mapping.items():
+			handlers[opcode_type] = partial(self.exec_alu_immediate, alu_opcode)
+		return [handlers.get(opcode_type, self.handle_nop) for opcode_type in code_opcodes]
 
 	def tick(self, operation: typing.Callable) -> None:
 		self.tick_number += 1
 		operation()
-		self.__print__()
+		if self.trace_ticks:
+			self.__print__()
+
+	def retiring(self, handler: typing.Callable) -> typing.Callable:
+		def issue_and_retire(*args) -> None:
+			handler(*args)
+			self.retire()
+
+		return issue_and_retire
+
+	def retire(self) -> None:
+		operations = self.pending[:]
+		self.pending.clear()
+		for group in schedule(tuple(signal_key(operation) for operation in operations)):
+			self.tick_number += 1
+			for position in group:
+				operations[position]()
+			if self.trace_ticks:
+				self.__print__()
+
+	@property
+	def out_buffer(self) -> str:
+		return self.bus.output.text()
 
 	def fetch_single_command(self):
 		self.instruction_number += 1
 		self.decode_instruction()
 		self.handle_irq()
 		self.signal_latch_pc(Selector.PC_INC)
+		if self.trace_instructions:
+			self.__print__()
 
 	def init_instructions(self, opcodes: list) -> None:
+		# predecode JSON program into opcode and argument arrays
 		for opcode in opcodes:
 			mem_cell = int(opcode["index"])
 			assert 0 <= mem_cell < self.program_memory_size, "Program index out of memory size"
-			self.program_memory[mem_cell] = opcode
+			self.opcodes[mem_cell] = opcode_codes[OpcodeType(opcode["command"].lower())]
+			self.args[mem_cell] = int(opcode.get("arg", 0))
+
+	def init_predecoded(self, opcodes: typing.Sequence[int], args: typing.Sequence[int]) -> None:
+		# use opcode and argument columns as they are, e.g. views into a mapped object file
+		assert len(opcodes) == len(args) <= self.program_memory_size, "Program out of memory size"
+		self.opcodes = opcodes
+		self.args = args
+
+	def snapshot(self) -> dict:
+		state = {
+			"data_path": self.data_path.snapshot(),
+			"program_memory_size": self.program_memory_size,
+			"opcodes": [code_opcodes[code].value for code in self.opcodes],
+			"args": list(self.args),
+			"counters": [self.tick_number, self.instruction_number, self.interrupt_ticks],
+			"ps": [self.ps[irq_request], self.ps[irq_on]],
+			"io": self.bus.latch.value,
+			"interrupts": self.interrupts.snapshot(),
+			"halted": self.halted,
+		}
+		sink = self.bus.output
+		if isinstance(sink, StreamSink):
+			# output streamed to a file stays there, the snapshot keeps where it ends
+			state["output_file"] = {"path": str(sink.path), "offset": sink.offset()}
+		else:
+			state["out_buffer"] = self.out_buffer
+		return state
+
+	@classmethod
+	def from_snapshot(
+		cls, state: dict, mode: RunMode = RunMode.TICK, tracer: Tracer | None = None, parallel: bool = False
+	) -> ControlUnit:
+		data_path = DataPath.from_snapshot(state["data_path"])
+		control_unit = cls(data_path, state["program_memory_size"], [], mode, tracer, parallel=parallel)
+		control_unit.opcodes = array("B", [opcode_codes[OpcodeType(name)] for name in state["opcodes"]])
+		control_unit.args = array("q", state["args"])
+		# snapshots without the interrupt entry ticks count them from the resume
+		control_unit.tick_number, control_unit.instruction_number, *interrupt_ticks = state["counters"]
+		control_unit.interrupt_ticks = sum(interrupt_ticks)
+		control_unit.ps[irq_request], control_unit.ps[irq_on] = state["ps"]
+		# only the default devices are kept in a snapshot
+		if "output_file" in state:
+			output = StreamSink(state["output_file"]["path"], offset=state["output_file"]["offset"])
+		else:
+			output = BufferSink(state["out_buffer"])
+		control_unit.bus = DeviceBus(output=output, latch=InputLatch(state["io"]))
+		control_unit.interrupts = InterruptScheduler.from_snapshot(state["interrupts"])
+		control_unit.halted = state["halted"]
+		return control_unit
 
 	def signal_latch_pc(self, selector: Selector, immediate=0) -> None:
 		match selector:
@@ -72,32 +273,49 @@ class ControlUnit:
 		self.ps[irq_request] = self.handle_irq()
 
 	def handle_irq(self) -> bool:
-		if self.ps[irq_on]:
-			for index, interrupt in enumerate(self.tokens):
-				if not self.already_fetched[index] and interrupt[0] <= self.tick_number:
-					self.ps[irq_request] = True
-					self.ps[irq_on] = False
-					self.already_fetched[index] = True
-					self.IO = interrupt[1]
-					self.tick(partial(self.data_path.signal_ret_wr, Selector.RET_STACK_PC))
-					self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, 1))
-					self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_INC))
-					break
+		if self.ps[irq_on] and self.interrupts.is_due(self.tick_number):
+			self.ps[irq_request] = True
+			self.ps[irq_on] = False
+			self.bus.latch.deliver(self.interrupts.pop_due(self.tick_number))
+			entry_tick = self.tick_number
+			self.enter_interrupt()
+			self.interrupt_ticks += self.tick_number - entry_tick
 		return False
 
-	def handle_push(self, memory_cell):
+	def interrupt_possible(self, until_tick: int) -> bool:
+		return self.ps[irq_on] and self.interrupts.is_due(until_tick)
+
+	def handle_interrupt_entry(self) -> None:
+		self.tick(partial(self.data_path.signal_ret_wr, Selector.RET_STACK_PC))
+		self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, 1))
+		self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_INC))
+
+	def handle_nop(self, _arg: int) -> None:
+		pass
+
+	def handle_alu(self, operation, _arg: int) -> None:
+		self.tick(partial(self.data_path.signal_alu_operation, operation))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_ALU))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
+
+	def handle_alu_immediate(self, operation, arg: int) -> None:
+		self.tick(partial(self.data_path.signal_alu_operation, operation, arg))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_ALU))
+
+	def handle_push(self, arg: int) -> None:
 		self.tick(partial(self.data_path.signal_data_wr))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TOP))
-		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_IMMEDIATE, memory_cell["arg"]))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_IMMEDIATE, arg))
 
-	def handle_drop(self):
+	def handle_drop(self, _arg: int = 0) -> None:
 		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
 
-	def handle_omit(self):
-		self.out_buffer += chr(self.data_path.next)
+	def handle_omit(self, _arg: int) -> None:
+		self.bus.write(self.data_path.top, self.data_path.next)
 		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
@@ -105,15 +323,16 @@ class ControlUnit:
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
 
-	def handle_read(self):
+	def handle_read(self, _arg: int) -> None:
+		port = self.data_path.top
 		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_data_wr))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TOP))
-		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_IMMEDIATE, ord(self.IO)))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_IMMEDIATE, self.bus.read(port)))
 
-	def handle_rpop(self):
+	def handle_rpop(self, _arg: int = 0) -> None:
 		self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_DEC))
 		self.tick(partial(self.data_path.signal_latch_temp, Selector.TEMP_RETURN))
 		self.tick(partial(self.data_path.signal_data_wr))
@@ -121,7 +340,7 @@ class ControlUnit:
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
 		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_TEMP))
 
-	def handle_store(self):
+	def handle_store(self, _arg: int) -> None:
 		self.tick(partial(self.data_path.signal_mem_write))
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
@@ -129,138 +348,585 @@ class ControlUnit:
 		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
 
-	def handle_swap(self):
+	def handle_swap(self, _arg: int) -> None:
 		self.tick(partial(self.data_path.signal_latch_temp, Selector.TEMP_TOP))
 		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
 		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TEMP))
 
+	def handle_dup(self, _arg: int) -> None:
+		self.tick(partial(self.data_path.signal_data_wr))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TOP))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
+
+	def handle_over(self, _arg: int) -> None:
+		self.tick(partial(self.data_path.signal_data_wr))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
+		self.tick(partial(self.data_path.signal_latch_temp, Selector.TEMP_TOP))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TEMP))
+
+	def handle_rot(self, _arg: int) -> None:
+		# the third cell goes through temp, the second is written back in its place
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
+		self.tick(partial(self.data_path.signal_latch_temp, Selector.TEMP_MEM))
+		self.tick(partial(self.data_path.signal_data_wr))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TOP))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_TEMP))
+
+	def handle_load(self, _arg: int) -> None:
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_MEM))
+
+	def handle_zjmp(self, arg: int) -> None:
+		if self.data_path.top == 0:
+			self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, arg))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
+
+	def handle_nzjmp(self, arg: int) -> None:
+		if self.data_path.top != 0:
+			self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, arg))
+		self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
+		self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
+		self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
+
+	def handle_jmp(self, arg: int) -> None:
+		self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, arg))
+
+	def handle_call(self, arg: int) -> None:
+		self.tick(partial(self.data_path.signal_ret_wr, Selector.RET_STACK_PC))
+		self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_INC))
+		self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, arg))
+
+	def handle_di(self, _arg: int) -> None:
+		self.tick(partial(self.signal_latch_ps, False))
+
+	def handle_ei(self, _arg: int) -> None:
+		self.tick(partial(self.signal_latch_ps, True))
+
+	def handle_ret(self, _arg: int) -> None:
+		self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_DEC))
+		self.tick(partial(self.signal_latch_pc, Selector.PC_RET))
+
+	def handle_halt(self, _arg: int) -> None:
+		self.halted = True
+		print("end")
+		raise StopIteration
+
 	def decode_instruction(self) -> None:
-		memory_cell = self.program_memory[self.data_path.pc]
-		command = memory_cell["command"].lower()
-		arithmetic_operation = opcode_to_alu_opcode(command)
-
-		if arithmetic_operation:
-			self.tick(partial(self.data_path.signal_alu_operation, arithmetic_operation))
-			self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_ALU))
-			self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
-			self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
-		else:
-			match command:
-				case OpcodeType.PUSH:
-					self.handle_push(memory_cell)
-				case OpcodeType.OMIT:
-					self.handle_omit()
-				case OpcodeType.READ:
-					self.handle_read()
-				case OpcodeType.SWAP:
-					self.handle_swap()
-				case OpcodeType.DUP:
-					self.tick(partial(self.data_path.signal_data_wr))
-					self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_TOP))
-					self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_INC))
-				case OpcodeType.LOAD:
-					self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_MEM))
-				case OpcodeType.STORE:
-					self.handle_store()
-				case OpcodeType.ZJMP:
-					match self.data_path.top:
-						case 0:
-							self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, memory_cell["arg"]))
-							self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
-							self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
-							self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
-						case _:
-							self.tick(partial(self.data_path.signal_latch_top, Selector.TOP_NEXT))
-							self.tick(partial(self.data_path.signal_latch_sp, Selector.SP_DEC))
-							self.tick(partial(self.data_path.signal_latch_next, Selector.NEXT_MEM))
-				case OpcodeType.JMP:
-					self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, memory_cell["arg"]))
-				case OpcodeType.CALL:
-					self.tick(partial(self.data_path.signal_ret_wr, Selector.RET_STACK_PC))
-					self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_INC))
-					self.tick(partial(self.signal_latch_pc, Selector.PC_IMMEDIATE, memory_cell["arg"]))
-				case OpcodeType.DI:
-					self.tick(partial(self.signal_latch_ps, False))
-				case OpcodeType.EI:
-					self.tick(partial(self.signal_latch_ps, True))
-				case OpcodeType.RET:
-					self.tick(partial(self.data_path.signal_latch_rsp, Selector.RSP_DEC))
-					self.tick(partial(self.signal_latch_pc, Selector.PC_RET))
-				case OpcodeType.HALT:
-					print("end")
-					raise StopIteration
+		pc = self.data_path.pc
+		self.handlers[self.opcodes[pc]](self.args[pc])
+
+	# Instruction-accurate handlers: each applies the net effect of the microcode
+	# above in one step and adds its tick cost, so tick_number stays exact.
+
+	def pop_data_stack(self) -> None:
+		data_path = self.data_path
+		data_path.sp -= 1
+		assert 0 <= data_path.sp < data_path.data_stack_size, "Address out of bounds"
+		data_path.next = data_path.data_stack[data_path.sp]
+
+	def push_data_stack(self) -> None:
+		data_path = self.data_path
+		assert 0 <= data_path.sp < data_path.data_stack_size, "Data stack overflow"
+		data_path.data_stack[data_path.sp] = data_path.next
+		data_path.sp += 1
+
+	def push_return_stack(self) -> None:
+		data_path = self.data_path
+		assert 0 <= data_path.rsp < data_path.return_stack_size, "Return stack overflow"
+		data_path.return_stack[data_path.rsp] = data_path.pc
+		data_path.rsp += 1
+
+	def pop_data_stack_unchecked(self) -> None:
+		data_path = self.data_path
+		data_path.sp -= 1
+		data_path.next = data_path.data_stack[data_path.sp]
+
+	def push_data_stack_unchecked(self) -> None:
+		data_path = self.data_path
+		data_path.data_stack[data_path.sp] = data_path.next
+		data_path.sp += 1
+
+	def push_return_stack_unchecked(self) -> None:
+		data_path = self.data_path
+		data_path.return_stack[data_path.rsp] = data_path.pc
+		data_path.rsp += 1
+
+	def exec_interrupt_entry(self) -> None:
+		self.push_return_stack()
+		self.data_path.pc = 0
+		self.tick_number += 3
+
+	def exec_alu(self, operation, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.signal_alu_operation(operation)
+		data_path.top = data_path.alu.result
+		self.pop_data_stack()
+		self.tick_number += 4
+
+	def exec_alu_immediate(self, operation, arg: int) -> None:
+		data_path = self.data_path
+		data_path.signal_alu_operation(operation, arg)
+		data_path.top = data_path.alu.result
+		self.tick_number += 2
+
+	def exec_push(self, arg: int) -> None:
+		data_path = self.data_path
+		self.push_data_stack()
+		data_path.next = data_path.top
+		data_path.top = arg
+		self.tick_number += 4
+
+	def exec_omit(self, _arg: int) -> None:
+		data_path = self.data_path
+		self.bus.write(data_path.top, data_path.next)
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		self.tick_number += 6
+
+	def exec_read(self, _arg: int) -> None:
+		data_path = self.data_path
+		port = data_path.top
+		data_path.top = data_path.next
+		data_path.sp -= 1
+		self.push_data_stack()
+		data_path.next = data_path.top
+		data_path.top = self.bus.read(port)
+		self.tick_number += 6
+
+	def exec_store(self, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.signal_mem_write()
+		self.pop_data_stack()
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		self.tick_number += 6
+
+	def exec_swap(self, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.temp = data_path.top
+		data_path.top, data_path.next = data_path.next, data_path.temp
+		self.tick_number += 3
+
+	def exec_dup(self, _arg: int) -> None:
+		data_path = self.data_path
+		self.push_data_stack()
+		data_path.next = data_path.top
+		self.tick_number += 3
+
+	def exec_drop(self, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		self.tick_number += 3
+
+	def exec_over(self, _arg: int) -> None:
+		data_path = self.data_path
+		self.push_data_stack()
+		data_path.temp = data_path.top
+		data_path.top, data_path.next = data_path.next, data_path.temp
+		self.tick_number += 5
+
+	def exec_rot(self, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.temp = data_path.next
+		self.pop_data_stack()
+		data_path.temp, data_path.next = data_path.next, data_path.temp
+		self.push_data_stack()
+		data_path.next = data_path.top
+		data_path.top = data_path.temp
+		self.tick_number += 6
+
+	def exec_load(self, _arg: int) -> None:
+		self.data_path.signal_latch_top(Selector.TOP_MEM)
+		self.tick_number += 1
+
+	def exec_zjmp(self, arg: int) -> None:
+		data_path = self.data_path
+		if data_path.top == 0:
+			data_path.pc = arg - 1
+			self.tick_number += 1
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		self.tick_number += 3
+
+	def exec_nzjmp(self, arg: int) -> None:
+		data_path = self.data_path
+		if data_path.top != 0:
+			data_path.pc = arg - 1
+			self.tick_number += 1
+		data_path.top = data_path.next
+		self.pop_data_stack()
+		self.tick_number += 3
+
+	def exec_jmp(self, arg: int) -> None:
+		self.data_path.pc = arg - 1
+		self.tick_number += 1
+
+	def exec_call(self, arg: int) -> None:
+		self.push_return_stack()
+		self.data_path.pc = arg - 1
+		self.tick_number += 3
+
+	def exec_di(self, _arg: int) -> None:
+		self.tick_number += 1
+		self.signal_latch_ps(False)
+
+	def exec_ei(self, _arg: int) -> None:
+		self.tick_number += 1
+		self.signal_latch_ps(True)
+
+	def exec_ret(self, _arg: int) -> None:
+		data_path = self.data_path
+		data_path.rsp -= 1
+		data_path.pc = data_path.return_stack[data_path.rsp]
+		self.tick_number += 2
 
 	def __print__(self) -> None:
-		tos_memory = self.data_path.data_stack[self.data_path.sp - 1 : self.data_path.sp - 2 : -1]
-		tos = [self.data_path.top, self.data_path.next, *tos_memory]
-		ret_tos = self.data_path.return_stack[self.data_path.rsp - 1 : self.data_path.rsp - 4 : -1]
-		state_repr = (
-			"TICK: {:4} | PC: {:4} | SP: {:3} | RSP: {:3} | IRQ_R {:2} | IRQ_ON: {:3} | "
-			"S_HEAD : {} | RS_HEAD : {} | DATA_HEAD {:3}"
-		).format(
-			self.tick_number,
-			self.data_path.pc,
-			self.data_path.sp,
-			self.data_path.rsp,
-			self.ps[irq_request],
-			self.ps[irq_on],
-			str(tos),
-			str(ret_tos),
-			self.data_path.memory[self.data_path.top] if self.data_path.top < self.data_path.memory_size else "?",
+		data_path = self.data_path
+		tos_memory = data_path.data_stack[data_path.sp - 1 : data_path.sp - 2 : -1]
+		self.tracer.record(
+			State(
+				self.tick_number,
+				data_path.pc,
+				data_path.sp,
+				data_path.rsp,
+				self.ps[irq_request],
+				self.ps[irq_on],
+				[data_path.top, data_path.next, *tos_memory],
+				list(data_path.return_stack[data_path.rsp - 1 : data_path.rsp - 4 : -1]),
+				data_path.memory[data_path.top] if data_path.top < data_path.memory_size else None,
+			)
 		)
-		self.journal.append(state_repr)
-		logger.info(state_repr)
-
-
-def run(code: list, memory: list, limit: int, input_tokens: list[tuple]):
-	mem_limit = 1024
-	data_path = DataPath(mem_limit, memory, mem_limit, mem_limit)
-	control_unit = ControlUnit(data_path, mem_limit, input_tokens)
-
-	control_unit.init_instructions(code)
-	control_unit.journal = []
-
-	# main cycle
-	while control_unit.instruction_number < limit:
-		try:
-			control_unit.fetch_single_command()
-		except StopIteration:
-			break
-
-	return [control_unit.out_buffer, control_unit.tick_number, control_unit.journal]
-
-
-def emulate(instructions: str, memory_path: str, tokens: str | None):
-	input_tokens = []
-	if tokens is not None:
-		with open(tokens, encoding="utf-8") as file:
-			input_text = file.read()
-			input_tokens = eval(input_text)
-	code = read_code(instructions)
-	memory = read_code(memory_path)
-	output, ticks, journal = run(
-		code,
+
+
+def simulate(
+	control_unit: ControlUnit,
+	limit: int,
+	tick_limit: int | None = None,
+	profiler: Profiler | None = None,
+	fast_forward: bool = True,
+) -> None:
+	# stops at the first instruction boundary at or after tick_limit
+	step = control_unit.fetch_single_command
+	if profiler is not None:
+		# profiling needs every instruction boundary, so blocks are not used
+		step = partial(profiler.step, control_unit, control_unit.fetch_single_command)
+	elif control_unit.mode is RunMode.BLOCK and not control_unit.trace_instructions:
+		step = BlockEngine(control_unit, limit, tick_limit).step
+	traced = control_unit.trace_ticks or control_unit.trace_instructions
+	# skipped iterations leave no journal entries, so traced runs execute every one;
+	# the idle loop costs are those of the serial microcode
+	if fast_forward and profiler is None and not traced and not control_unit.parallel:
+		step = FastForward(control_unit, step, limit, tick_limit).step
+	try:
+		while not control_unit.halted and control_unit.instruction_number < limit:
+			if tick_limit is not None and control_unit.tick_number >= tick_limit:
+				break
+			try:
+				step()
+			except StopIteration:
+				break
+	finally:
+		control_unit.tracer.close()
+
+
+def finish(control_unit: ControlUnit, snapshot_path: str | None) -> list:
+	if snapshot_path is not None:
+		write_snapshot(snapshot_path, control_unit.snapshot())
+	sink = control_unit.bus.output
+	# a file-backed output is not read back, the result refers to the file
+	output = f"<{sink.path}>" if isinstance(sink, StreamSink) else control_unit.out_buffer
+	control_unit.bus.close()
+	return [output, control_unit.tick_number, control_unit.tracer.journal]
+
+
+def default_tracer(mode: RunMode) -> Tracer:
+	return Tracer(TraceLevel.TICK if mode is RunMode.TICK else TraceLevel.OFF)
+
+
+def boot(
+	code: list | ObjectImage,
+	memory: list | None,
+	input_tokens: list[tuple],
+	mode: RunMode = RunMode.TICK,
+	tracer: Tracer | None = None,
+	config: MachineConfig | None = None,
+	bus: DeviceBus | None = None,
+	interrupts: int | None = None,
+) -> ControlUnit:
+	# interrupts bounds how many tokens can arrive, the scheduled ones by default
+	if tracer is None:
+		tracer = default_tracer(mode)
+	if config is None:
+		config = MachineConfig()
+	if isinstance(code, ObjectImage):
+		memory = code.memory
+	data_path = DataPath(
+		config.memory_size or len(memory),
 		memory,
-		limit=1000,
-		input_tokens=input_tokens,
+		config.data_stack_size,
+		config.return_stack_size,
+		config.storage,
 	)
+	bounds = attached_bounds(code)
+	checked = (
+		config.stack_checks
+		or bounds is None
+		or not bounds.fits(
+			config.data_stack_size,
+			config.return_stack_size,
+			len(input_tokens) if interrupts is None else interrupts,
+		)
+	)
+	control_unit = ControlUnit(
+		data_path, config.program_memory_size, input_tokens, mode, tracer, bus, checked, config.parallel_signals
+	)
+	if isinstance(code, ObjectImage):
+		control_unit.init_predecoded(code.opcodes, code.args)
+	else:
+		control_unit.init_instructions(code)
+	return control_unit
+
+
+def run(
+	code: list | ObjectImage,
+	memory: list | None,
+	limit: int,
+	input_tokens: list[tuple],
+	mode: RunMode = RunMode.TICK,
+	tracer: Tracer | None = None,
+	tick_limit: int | None = None,
+	snapshot_path: str | None = None,
+	config: MachineConfig | None = None,
+	profiler: Profiler | None = None,
+	bus: DeviceBus | None = None,
+):
+	control_unit = boot(code, memory, input_tokens, mode, tracer, config, bus)
+	simulate(control_unit, limit, tick_limit, profiler, config is None or config.fast_forward)
+	return finish(control_unit, snapshot_path)
+
+
+def resume(
+	snapshot: str,
+	limit: int,
+	mode: RunMode = RunMode.TICK,
+	tracer: Tracer | None = None,
+	tick_limit: int | None = None,
+	snapshot_path: str | None = None,
+	profiler: Profiler | None = None,
+	fast_forward: bool = True,
+	parallel: bool = False,
+):
+	if tracer is None:
+		tracer = default_tracer(mode)
+	control_unit = ControlUnit.from_snapshot(read_snapshot(snapshot), mode, tracer, parallel)
+	simulate(control_unit, limit, tick_limit, profiler, fast_forward)
+	return finish(control_unit, snapshot_path)
+
+
+def microcode_report() -> list[tuple[str, int, int]]:
+	# serial and parallel ticks per opcode; conditional jumps are listed taken and not taken
+	control_unit = ControlUnit(DataPath(1, [], 1, 1), 1, [], parallel=True)
+	handlers = control_unit.build_dispatch_table()
+	rows = []
+	for opcode_type in code_opcodes:
+		if opcode_type is OpcodeType.HALT:
+			continue
+		variants = {}
+		for top in [0, 1]:
+			control_unit.data_path.top = top
+			handlers[opcode_codes[opcode_type]](0)
+			keys = tuple(signal_key(operation) for operation in control_unit.pending)
+			control_unit.pending.clear()
+			variants.setdefault(keys, top)
+		for keys, top in sorted(variants.items(), key=lambda variant: -len(variant[0])):
+			name = str(opcode_type)
+			if len(variants) > 1:
+				name += " taken" if Selector.PC_IMMEDIATE in keys else " not taken"
+			if keys:
+				rows.append((name, len(keys), len(schedule(keys))))
+	return rows
+
+
+def format_microcode_report(rows: list[tuple[str, int, int]]) -> str:
+	lines = [f"{'opcode':<16}{'serial':>8}{'parallel':>10}{'saved':>8}"]
+	lines += [f"{name:<16}{serial:>8}{parallel:>10}{serial - parallel:>8}" for name, serial, parallel in rows]
+	return "\n".join(lines)
+
+
+def read_tokens(tokens: str | None) -> list[tuple]:
+	if tokens is None:
+		return []
+	with open(tokens, encoding="utf-8") as file:
+		return eval(file.read())
+
+
+def emulate(
+	instructions: str | None,
+	memory_path: str | None,
+	tokens: str | None,
+	mode: RunMode = RunMode.TICK,
+	tracer: Tracer | None = None,
+	limit: int = 1000,
+	tick_limit: int | None = None,
+	snapshot_path: str | None = None,
+	resume_path: str | None = None,
+	config: MachineConfig | None = None,
+	profiler: Profiler | None = None,
+	output_file: str | None = None,
+):
+	if resume_path is not None:
+		fast_forward = config is None or config.fast_forward
+		parallel = config is not None and config.parallel_signals
+		output, ticks, journal = resume(
+			resume_path, limit, mode, tracer, tick_limit, snapshot_path, profiler, fast_forward, parallel
+		)
+	else:
+		input_tokens = read_tokens(tokens)
+		if is_object(instructions):
+			code, memory = ObjectImage(instructions), None
+			if profiler is not None and not profiler.source_map:
+				profiler.source_map = load_source_map(None, code) or []
+		else:
+			code, memory = read_code(instructions), read_code(memory_path)
+		output, ticks, journal = run(
+			code,
+			memory,
+			limit=limit,
+			input_tokens=input_tokens,
+			mode=mode,
+			tracer=tracer,
+			tick_limit=tick_limit,
+			snapshot_path=snapshot_path,
+			config=config,
+			profiler=profiler,
+			bus=None if output_file is None else DeviceBus(output=StreamSink(output_file)),
+		)
 	journal.insert(0, f"Output buffer: {output}")
 	journal.insert(0, f"Number of ticks: {ticks - 1}")
 
 	return journal
 
 
-def main(code_path: str, memory_path: str, token_path: str | None) -> None:
-	journal = emulate(code_path, memory_path, token_path)
-	with open("ress", "w", encoding="utf-8") as file:
+def build_tracer(
+	level: TraceLevel,
+	trace_file: str | None,
+	trace_format: TraceFormat,
+	ring_buffer: int,
+	log: bool,
+) -> tuple[Tracer, RingBufferSink | None]:
+	sinks = []
+	if trace_file is None:
+		sinks.append(ListSink())
+	else:
+		sinks.append(FileSink(trace_file, trace_format))
+	if log:
+		sinks.append(LoggerSink())
+	ring = RingBufferSink(ring_buffer) if ring_buffer else None
+	if ring is not None:
+		sinks.append(ring)
+	return Tracer(level, sinks), ring
+
+
+def main(
+	code_path: str | None,
+	memory_path: str | None,
+	token_path: str | None,
+	mode: RunMode = RunMode.TICK,
+	tracer: Tracer | None = None,
+	output_path: str = "ress",
+	**options,
+) -> None:
+	journal = emulate(code_path, memory_path, token_path, mode, tracer, **options)
+	with open(output_path, "w", encoding="utf-8") as file:
 		file.write(json.dumps(journal))
 
 
 if __name__ == "__main__":
-	assert 3 <= len(sys.argv) <= 4, "Wrong arguments: machine.py <code_file> <memory_file> [<input_file>]"
-	if len(sys.argv) == 4:
-		_, code_file, machine_mem, input_file = sys.argv
-	else:
-		_, code_file, machine_mem = sys.argv
-		input_file = None
-	main(code_file, machine_mem, input_file)
+	parser = argparse.ArgumentParser(description="Stack processor model")
+	parser.add_argument("code_file", nargs="?", default=None)
+	parser.add_argument("memory_file", nargs="?", default=None)
+	parser.add_argument("input_file", nargs="?", default=None)
+	parser.add_argument("--mode", type=RunMode, choices=list(RunMode), default=RunMode.TICK)
+	parser.add_argument("--trace-level", type=TraceLevel, choices=list(TraceLevel), default=None)
+	parser.add_argument("--trace-file", default=None, help="stream trace to file instead of the ress journal")
+	parser.add_argument("--trace-format", type=TraceFormat, choices=list(TraceFormat), default=TraceFormat.JSONL)
+	parser.add_argument("--ring-buffer", type=int, default=0, help="keep last N states for post-mortem")
+	parser.add_argument("--log", action="store_true", help="echo trace to stderr")
+	parser.add_argument("--output", default="ress", help="journal file")
+	parser.add_argument("--limit", type=int, default=1000, help="instruction limit, counted from reset")
+	parser.add_argument("--stop-at-tick", type=int, default=None, help="pause at first instruction boundary after tick")
+	parser.add_argument("--save-snapshot", default=None, help="write machine state to file when stopped")
+	parser.add_argument("--resume", default=None, help="continue from a snapshot instead of code/memory files")
+	parser.add_argument("--memory-size", type=int, default=None, help="data memory cells (default: image size)")
+	parser.add_argument("--stack-size", type=int, default=1024)
+	parser.add_argument("--return-stack-size", type=int, default=1024)
+	parser.add_argument("--program-size", type=int, default=1024)
+	parser.add_argument("--storage", type=Storage, choices=list(Storage), default=Storage.LIST)
+	parser.add_argument(
+		"--no-fast-forward", action="store_true", help="run idle loops iteration by iteration until an interrupt"
+	)
+	parser.add_argument("--output-file", default=None, help="stream the default output port to a file")
+	parser.add_argument("--profile", action="store_true", help="print a hot-spot report after the run")
+	parser.add_argument("--flamegraph", default=None, help="write folded call stacks weighted by ticks")
+	parser.add_argument("--source-map", default=None, help="translator source map for per-word attribution")
+	parser.add_argument(
+		"--parallel-signals", action="store_true", help="issue independent signals of an instruction in one tick"
+	)
+	parser.add_argument("--microcode-report", action="store_true", help="print serial and parallel ticks per opcode")
+	args = parser.parse_args()
+	if args.microcode_report:
+		print(format_microcode_report(microcode_report()))
+		parser.exit()
+	if args.code_file is not None and is_object(args.code_file):
+		# an object file carries its data segment: the next argument is the input
+		args.input_file, args.memory_file = args.memory_file, None
+	elif args.resume is None and (args.code_file is None or args.memory_file is None):
+		parser.error("code_file and memory_file are required unless --resume is given")
+	if args.parallel_signals and args.mode is not RunMode.TICK:
+		parser.error("--parallel-signals needs tick mode: the fast modes add the serial microcode ticks")
+	if args.resume is not None and args.output_file is not None:
+		parser.error("--output-file needs a fresh run: a resumed run appends to the output of its snapshot")
+	trace_level = args.trace_level
+	if trace_level is None:
+		trace_level = TraceLevel.TICK if args.mode is RunMode.TICK else TraceLevel.OFF
+	tracer, ring = build_tracer(trace_level, args.trace_file, args.trace_format, args.ring_buffer, args.log)
+	profiler = None
+	if args.profile or args.flamegraph is not None:
+		profiler = Profiler(load_source_map(args.source_map))
+	try:
+		main(
+			args.code_file,
+			args.memory_file,
+			args.input_file,
+			args.mode,
+			tracer,
+			output_path=args.output,
+			limit=args.limit,
+			tick_limit=args.stop_at_tick,
+			snapshot_path=args.save_snapshot,
+			resume_path=args.resume,
+			config=MachineConfig(
+				args.memory_size,
+				args.stack_size,
+				args.return_stack_size,
+				args.program_size,
+				args.storage,
+				not args.no_fast_forward,
+				parallel_signals=args.parallel_signals,
+			),
+			profiler=profiler,
+			output_file=args.output_file,
+		)
+	finally:
+		if ring is not None:
+			print("\n".join(ring.lines()))
+	if profiler is not None and args.profile:
+		print(profiler.report())
+	if profiler is not None and args.flamegraph is not None:
+		profiler.write_collapsed(args.flamegraph)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import functools
+import typing
+
+from datapath import Selector
+
+# registers and storages a signal reads or latches
+PC, SP, RSP, TOP, NEXT, TEMP, ALU_RESULT, PS = "pc", "sp", "rsp", "top", "next", "temp", "alu", "ps"
+DATA_STACK, RETURN_STACK, MEMORY = "data_stack", "return_stack", "memory"
+everything = frozenset({PC, SP, RSP, TOP, NEXT, TEMP, ALU_RESULT, PS, DATA_STACK, RETURN_STACK, MEMORY})
+
+
+class Effect(typing.NamedTuple):
+	reads: frozenset[str]
+	writes: frozenset[str]
+
+
+def effect(reads: set[str], writes: set[str]) -> Effect:
+	return Effect(frozenset(reads), frozenset(writes))
+
+
+# signals without a selector are keyed by the name of the datapath method
+signal_effects: dict[Selector | str, Effect] = {
+	Selector.SP_INC: effect({SP}, {SP}),
+	Selector.SP_DEC: effect({SP}, {SP}),
+	Selector.PC_INC: effect({PC}, {PC}),
+	Selector.RSP_INC: effect({RSP}, {RSP}),
+	Selector.RSP_DEC: effect({RSP}, {RSP}),
+	Selector.NEXT_TOP: effect({TOP}, {NEXT}),
+	Selector.NEXT_TEMP: effect({TEMP}, {NEXT}),
+	Selector.NEXT_MEM: effect({SP, DATA_STACK}, {NEXT}),
+	Selector.TEMP_NEXT: effect({NEXT}, {TEMP}),
+	Selector.TEMP_TOP: effect({TOP}, {TEMP}),
+	Selector.TEMP_RETURN: effect({RSP, RETURN_STACK}, {TEMP}),
+	Selector.TEMP_MEM: effect({SP, DATA_STACK}, {TEMP}),
+	Selector.TOP_TEMP: effect({TEMP}, {TOP}),
+	Selector.TOP_NEXT: effect({NEXT}, {TOP}),
+	Selector.TOP_ALU: effect({ALU_RESULT}, {TOP}),
+	Selector.TOP_MEM: effect({TOP, MEMORY}, {TOP}),
+	Selector.TOP_IMMEDIATE: effect(set(), {TOP}),
+	Selector.TOP_INPUT: effect(set(), {TOP}),
+	Selector.RET_STACK_PC: effect({PC, RSP}, {RETURN_STACK}),
+	Selector.PC_RET: effect({RSP, RETURN_STACK}, {PC}),
+	Selector.PC_IMMEDIATE: effect(set(), {PC}),
+	"signal_alu_operation": effect({TOP, NEXT}, {ALU_RESULT}),
+	"signal_data_wr": effect({SP, NEXT}, {DATA_STACK}),
+	"signal_mem_write": effect({TOP, NEXT}, {MEMORY}),
+	# may enter an interrupt handler, so nothing moves across it
+	"signal_latch_ps": Effect(everything, everything),
+}
+
+
+def signal_key(operation: functools.partial) -> Selector | str:
+	selector = operation.args[0] if operation.args else None
+	return selector if isinstance(selector, Selector) else operation.func.__name__
+
+
+@functools.cache
+def schedule(keys: tuple[Selector | str, ...]) -> tuple[tuple[int, ...], ...]:
+	"""Packs the signals of one instruction into ticks, by position in the issue order.
+
+	All latches of a tick read the values from before it. A signal goes after every
+	earlier one it reads the result of or latches the same place as, and not before
+	an earlier one reading what it latches. Within a tick signals keep their order, so
+	applying them one by one gives the same state as the serial microcode.
+
+	>>> alu = ("signal_alu_operation", Selector.TOP_ALU, Selector.SP_DEC, Selector.NEXT_MEM)
+	>>> schedule(alu)
+	((0, 2), (1, 3))
+	>>> len(schedule((Selector.RSP_DEC, Selector.PC_RET)))
+	2
+	"""
+	ticks: list[int] = []
+	for position, key in enumerate(keys):
+		reads, writes = signal_effects[key]
+		tick = 0
+		for earlier, earlier_tick in zip(keys[:position], ticks):
+			earlier_reads, earlier_writes = signal_effects[earlier]
+			if earlier_writes & (reads | writes):
+				tick = max(tick, earlier_tick + 1)
+			elif writes & earlier_reads:
+				tick = max(tick, earlier_tick)
+		ticks.append(tick)
+	return tuple(
+		tuple(position for position, tick in enumerate(ticks) if tick == number)
+		for number in range(max(ticks, default=-1) + 1)
+	)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from isa import Opcode, OpcodeParam, OpcodeParamType, OpcodeType
+
+# (term index, opcode) pairs; the term index keeps ADDR fixups resolvable after rewriting
+Entry = tuple[int, Opcode]
+
+
+def constant(opcode: Opcode) -> int | None:
+	if opcode.opcode_type not in (OpcodeType.PUSH, OpcodeType.ADDI, OpcodeType.EQI):
+		return None
+	value = opcode.params[0].value
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+
+def with_constant(opcode_type: OpcodeType, value: int) -> Opcode:
+	return Opcode(opcode_type, [OpcodeParam(OpcodeParamType.CONST, value)])
+
+
+def is_type(opcode: Opcode, *opcode_types: OpcodeType) -> bool:
+	return opcode.opcode_type in opcode_types
+
+
+def fold_triple(first: Opcode, second: Opcode, third: Opcode) -> list[Opcode] | None:
+	a, b = constant(first), constant(second)
+	if a is None or b is None or not is_type(first, OpcodeType.PUSH) or not is_type(second, OpcodeType.PUSH):
+		return None
+	if is_type(third, OpcodeType.ADD):
+		return [with_constant(OpcodeType.PUSH, a + b)]
+	if is_type(third, OpcodeType.EQ):
+		return [with_constant(OpcodeType.PUSH, int(a == b))]
+	if is_type(third, OpcodeType.MUL):
+		return [with_constant(OpcodeType.PUSH, a * b)]
+	return None
+
+
+def fold_pair(first: Opcode, second: Opcode) -> list[Opcode] | None:
+	a, b = constant(first), constant(second)
+	if is_type(first, OpcodeType.SWAP) and is_type(second, OpcodeType.SWAP):
+		return []
+	if a is None:
+		return None
+	if is_type(first, OpcodeType.PUSH):
+		if b is not None and is_type(second, OpcodeType.ADDI):
+			return [with_constant(OpcodeType.PUSH, a + b)]
+		if b is not None and is_type(second, OpcodeType.EQI):
+			return [with_constant(OpcodeType.PUSH, int(a == b))]
+		if is_type(second, OpcodeType.ADD):
+			return [with_constant(OpcodeType.ADDI, a)]
+		if is_type(second, OpcodeType.EQ):
+			return [with_constant(OpcodeType.EQI, a)]
+		if is_type(second, OpcodeType.ZJMP):
+			# constant condition: either always jumps or never does, stack is unchanged
+			return [Opcode(OpcodeType.JMP, second.params)] if a == 0 else []
+	if is_type(first, OpcodeType.ADDI) and b is not None and is_type(second, OpcodeType.ADDI):
+		return [with_constant(OpcodeType.ADDI, a + b)]
+	if is_type(first, OpcodeType.EQI) and a == 0 and is_type(second, OpcodeType.ZJMP):
+		return [Opcode(OpcodeType.NZJMP, second.params)]
+	return None
+
+
+def fold_single(opcode: Opcode) -> list[Opcode] | None:
+	if is_type(opcode, OpcodeType.ADDI) and constant(opcode) == 0:
+		return []
+	return None
+
+
+class PeepholeOptimizer:
+	"""Rewrites the per-term opcode lists before addresses are assigned.
+
+	Jump targets are term indices, so a window never extends over the start of a term
+	that is jumped to; fused opcodes stay in the term of the window's first opcode.
+	Terms with ADDR_REL parameters (inline string printing) are left untouched.
+	"""
+
+	def __init__(self, term_opcodes: list[list[Opcode]]):
+		self.term_opcodes = term_opcodes
+		self.targets = set()
+		self.frozen = set()
+		for term_index, opcodes in enumerate(term_opcodes):
+			for opcode in opcodes:
+				for param in opcode.params:
+					if param.param_type is OpcodeParamType.ADDR:
+						self.targets.add(param.value)
+					if param.param_type is OpcodeParamType.ADDR_REL:
+						self.frozen.add(term_index)
+
+	def joinable(self, window: list[Entry]) -> bool:
+		# every opcode after the first must not be a landing point for a jump
+		last_term = window[0][0]
+		for term, _ in window[1:]:
+			if any(target in self.targets for target in range(last_term + 1, term + 1)):
+				return False
+			last_term = term
+		return all(term not in self.frozen for term, _ in window)
+
+	def rewrite_tail(self, stream: list[Entry]) -> bool:
+		for size, fold in ((3, fold_triple), (2, fold_pair), (1, fold_single)):
+			if len(stream) < size:
+				continue
+			window = stream[-size:]
+			if not self.joinable(window):
+				continue
+			replacement = fold(*(opcode for _, opcode in window))
+			if replacement is None:
+				continue
+			term = window[0][0]
+			del stream[-size:]
+			stream.extend((term, opcode) for opcode in replacement)
+			return True
+		return False
+
+	def optimize(self) -> list[list[Opcode]]:
+		stream = []
+		for term_index, opcodes in enumerate(self.term_opcodes):
+			for opcode in opcodes:
+				stream.append((term_index, opcode))
+				while self.rewrite_tail(stream):
+					pass
+		result = [[] for _ in self.term_opcodes]
+		for term_index, opcode in stream:
+			result[term_index].append(opcode)
+		return result
+
+
+def optimize(term_opcodes: list[list[Opcode]]) -> list[list[Opcode]]:
+	return PeepholeOptimizer(term_opcodes).optimize()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+import typing
+from collections import Counter
+
+from datapath import STACK_PTR_OFFSET
+from isa import SOURCE_MAP_SECTION, ObjectImage, code_opcodes, read_source_map
+
+INTERRUPT_FRAME = "<interrupt>"
+
+
+def load_source_map(path: str | None, code: ObjectImage | None = None) -> list[dict] | None:
+	# an explicit map wins over the one embedded in an object file
+	if path is not None:
+		return read_source_map(path)
+	if isinstance(code, ObjectImage) and SOURCE_MAP_SECTION in code.sections:
+		return json.loads(bytes(code.sections[SOURCE_MAP_SECTION]))
+	return None
+
+
+class Profiler:
+	"""Attributes ticks and executed instructions to program addresses.
+
+	Counts are kept per pc, per opcode and per source definition (when a translator
+	source map is given). Each instruction also charges its ticks to the call stack
+	read from the return stack, which gives folded stacks for flamegraph tools.
+	Ticks spent entering interrupt handlers are counted on their own.
+	"""
+
+	def __init__(self, source_map: list[dict] | None = None):
+		self.source_map = source_map or []
+		self.pc_ticks = Counter()
+		self.pc_counts = Counter()
+		self.stacks = Counter()
+		self.opcodes: dict[int, str] = {}
+		self.interrupt_ticks = 0
+		self.interrupts = 0
+
+	def definition(self, pc: int) -> str:
+		if 0 <= pc < len(self.source_map):
+			return self.source_map[pc]["definition"]
+		return f"pc{pc}"
+
+	def call_stack(self, control_unit) -> tuple[str, ...]:
+		data_path = control_unit.data_path
+		callers = data_path.return_stack[STACK_PTR_OFFSET : data_path.rsp]
+		return (*(self.definition(pc) for pc in callers), self.definition(data_path.pc))
+
+	def step(self, control_unit, step: typing.Callable) -> None:
+		pc = control_unit.data_path.pc
+		stack = self.call_stack(control_unit)
+		tick = control_unit.tick_number
+		interrupt_ticks = control_unit.interrupt_ticks
+		try:
+			step()
+		finally:
+			entry_ticks = control_unit.interrupt_ticks - interrupt_ticks
+			ticks = control_unit.tick_number - tick - entry_ticks
+			self.pc_counts[pc] += 1
+			if pc not in self.opcodes:
+				self.opcodes[pc] = code_opcodes[control_unit.opcodes[pc]].name
+			self.pc_ticks[pc] += ticks
+			self.stacks[stack] += ticks
+			if entry_ticks:
+				self.interrupts += 1
+				self.interrupt_ticks += entry_ticks
+				self.stacks[(*stack, INTERRUPT_FRAME)] += entry_ticks
+
+	@property
+	def total_ticks(self) -> int:
+		return sum(self.pc_ticks.values()) + self.interrupt_ticks
+
+	def by_opcode(self) -> tuple[Counter, Counter]:
+		ticks, counts = Counter(), Counter()
+		for pc, count in self.pc_counts.items():
+			name = self.opcodes[pc]
+			ticks[name] += self.pc_ticks[pc]
+			counts[name] += count
+		return ticks, counts
+
+	def by_definition(self) -> tuple[Counter, Counter]:
+		ticks, counts = Counter(), Counter()
+		for pc, count in self.pc_counts.items():
+			ticks[self.definition(pc)] += self.pc_ticks[pc]
+			counts[self.definition(pc)] += count
+		return ticks, counts
+
+	def word(self, pc: int) -> str:
+		if 0 <= pc < len(self.source_map):
+			entry = self.source_map[pc]
+			if entry.get("line") is not None:
+				return f"{entry['word']} ({entry['line']}:{entry['column']})"
+			if entry["word_number"] is not None:
+				return f"{entry['word']} (word {entry['word_number']})"
+		return ""
+
+	def report(self, top: int = 15) -> str:
+		total = self.total_ticks or 1
+		lines = [f"Total ticks: {self.total_ticks}, instructions: {sum(self.pc_counts.values())}"]
+		lines.append(f"Interrupt entries: {self.interrupts}, {self.interrupt_ticks} ticks")
+
+		def table(title: str, ticks: Counter, counts: Counter) -> None:
+			lines.append("")
+			lines.append(f"{title:<24} {'ticks':>10} {'%':>6} {'count':>10}")
+			for key, value in ticks.most_common(top):
+				lines.append(f"{key!s:<24} {value:>10} {100 * value / total:>6.1f} {counts[key]:>10}")
+
+		if self.source_map:
+			table("definition", *self.by_definition())
+		table("opcode", *self.by_opcode())
+
+		lines.append("")
+		lines.append(f"{'pc':>6} {'opcode':<8} {'ticks':>10} {'%':>6} {'count':>10}  source")
+		for pc, value in self.pc_ticks.most_common(top):
+			count = self.pc_counts[pc]
+			lines.append(
+				f"{pc:>6} {self.opcodes[pc]:<8} {value:>10} {100 * value / total:>6.1f} {count:>10}  {self.word(pc)}"
+			)
+		return "\n".join(lines)
+
+	def collapsed(self) -> list[str]:
+		# folded stack format: "main;callee;... ticks", as read by flamegraph.pl and speedscope
+		return [";".join(stack) + f" {ticks}" for stack, ticks in sorted(self.stacks.items()) if ticks]
+
+	def write_collapsed(self, path: str) -> None:
+		with open(path, "w", encoding="utf-8") as file:
+			file.write("\n".join(self.collapsed()) + "\n")
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import typing
+
+from isa import Opcode, OpcodeParam, OpcodeParamType, OpcodeType
+
+
+def print_cstr() -> list[Opcode]:
+	# ( addr -- addr_end ) emits the C string at addr to port 0, terminator included
+	return [
+		Opcode(OpcodeType.DUP, []),
+		Opcode(OpcodeType.LOAD, []),
+		Opcode(OpcodeType.DUP, []),
+		Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]),
+		Opcode(OpcodeType.OMIT, []),
+		Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 0)]),
+		Opcode(OpcodeType.EQ, []),
+		Opcode(OpcodeType.SWAP, []),
+		Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, 1)]),
+		Opcode(OpcodeType.ADD, []),
+		Opcode(OpcodeType.SWAP, []),
+		Opcode(OpcodeType.ZJMP, [OpcodeParam(OpcodeParamType.ADDR_REL, -11)]),
+		Opcode(OpcodeType.RET, []),
+	]
+
+
+routines: dict[str, typing.Callable[[], list[Opcode]]] = {
+	"print_cstr": print_cstr,
+}
+
+
+def routine_call(name: str) -> Opcode:
+	assert name in routines, f"Unknown runtime routine {name}"
+	return Opcode(OpcodeType.CALL, [OpcodeParam(OpcodeParamType.ROUTINE, name)])
+
+
+def referenced_routines(opcodes: list[Opcode]) -> list[str]:
+	return [param.value for opcode in opcodes for param in opcode.params if param.param_type is OpcodeParamType.ROUTINE]
+
+
+def link_runtime(opcodes: list[Opcode]) -> tuple[list[Opcode], dict[str, int]]:
+	# appends each referenced routine once (unused ones are never emitted) and resolves calls to them
+	result = list(opcodes)
+	addresses = {}
+	pending = referenced_routines(result)
+	while pending:
+		name = pending.pop(0)
+		if name in addresses:
+			continue
+		addresses[name] = len(result)
+		body = routines[name]()
+		for opcode in body:
+			for param in opcode.params:
+				if param.param_type is OpcodeParamType.ADDR_REL:
+					param.value += len(result)
+					param.param_type = OpcodeParamType.CONST
+			result.append(opcode)
+		pending += referenced_routines(body)
+
+	for opcode in result:
+		for param in opcode.params:
+			if param.param_type is OpcodeParamType.ROUTINE:
+				param.value = addresses[param.value]
+				param.param_type = OpcodeParamType.CONST
+	return result, addresses
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import json
+import zlib
+
+SNAPSHOT_MAGIC = b"SNP1"
+
+
+def write_snapshot(filename: str, state: dict) -> None:
+	with open(filename, "wb") as file:
+		file.write(SNAPSHOT_MAGIC)
+		file.write(zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8")))
+
+
+def read_snapshot(filename: str) -> dict:
+	with open(filename, "rb") as file:
+		assert file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC, "Not a machine snapshot"
+		return json.loads(zlib.decompress(file.read()).decode("utf-8"))
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+import typing
+
+from alu import alu_immediate_opcode_mapping, alu_opcode_mapping
+from datapath import STACK_PTR_OFFSET
+from isa import STACK_BOUNDS_SECTION, ObjectImage, OpcodeType
+
+# the control unit enters interrupts at pc 0 and increments it before the next fetch
+INTERRUPT_VECTOR = 1
+DEFAULT_STACK_SIZE = 1024
+
+# (cells popped, cells pushed) of the data stack; READ replaces the port number in place
+# but moves the stack pointer down and up again, so it counts as a pop and a push
+stack_effects = {
+	OpcodeType.NOP: (0, 0),
+	OpcodeType.PUSH: (0, 1),
+	OpcodeType.DUP: (0, 1),
+	OpcodeType.DROP: (1, 0),
+	OpcodeType.OVER: (0, 1),
+	# ROT reads and rewrites the third cell, moving the stack pointer down and back
+	OpcodeType.ROT: (1, 1),
+	OpcodeType.SWAP: (0, 0),
+	OpcodeType.LOAD: (0, 0),
+	OpcodeType.STORE: (2, 0),
+	OpcodeType.OMIT: (2, 0),
+	OpcodeType.READ: (1, 1),
+	OpcodeType.ZJMP: (1, 0),
+	OpcodeType.NZJMP: (1, 0),
+	OpcodeType.JMP: (0, 0),
+	OpcodeType.CALL: (0, 0),
+	OpcodeType.RET: (0, 0),
+	OpcodeType.EI: (0, 0),
+	OpcodeType.DI: (0, 0),
+	OpcodeType.HALT: (0, 0),
+	**{opcode_type: (1, 0) for opcode_type in alu_opcode_mapping},
+	**{opcode_type: (0, 0) for opcode_type in alu_immediate_opcode_mapping},
+}
+
+
+class UnboundedStackError(Exception):
+	"""Depths cannot be bounded statically: merging paths disagree, recursion, a wild jump."""
+
+
+class Frame(typing.NamedTuple):
+	# data stack depths relative to the entry of a word, pops inside an instruction included
+	data_min: int
+	data_max: int
+	# return stack cells the word and its callees use
+	return_max: int
+	# data depth change from entry to RET; None if the word never returns
+	data_net: int | None
+	enables_interrupts: bool
+
+
+class StackBounds(typing.NamedTuple):
+	"""Proven stack pointer bounds of a program, checked against the machine it runs on.
+
+	Main program bounds are absolute; each interrupt handler level that can be active
+	at the same time adds its own relative bounds. A handler that executes EI can be
+	interrupted again, so then every input token may add a level.
+
+	>>> bounds = StackBounds(2, 7, 5, -1, 3, 0, True)
+	>>> bounds.fits(16, 16, interrupts=2), bounds.fits(16, 16, interrupts=3)
+	(True, False)
+	"""
+
+	data_min: int
+	data_max: int
+	return_max: int
+	handler_data_min: int
+	handler_data_max: int
+	handler_return_max: int
+	reentrant: bool
+
+	def levels(self, interrupts: int) -> int:
+		return interrupts if self.reentrant else min(interrupts, 1)
+
+	def fits(self, data_stack_size: int, return_stack_size: int, interrupts: int) -> bool:
+		# push checks sp < size before writing, pop checks sp >= 0 after moving
+		levels = self.levels(interrupts)
+		return (
+			self.data_min + levels * self.handler_data_min >= 0
+			and self.data_max + levels * self.handler_data_max <= data_stack_size
+			and self.return_max + levels * (1 + self.handler_return_max) <= return_stack_size
+		)
+
+
+class StackAnalyzer:
+	"""Computes data and return stack depth bounds of every word of a linked program.
+
+	Each word (the main program from address 0, the interrupt handler at address 1 and
+	every CALL target) is walked once along all paths; a call is accounted for by the
+	summary of its target. Every address must be reached at one data depth.
+	"""
+
+	def __init__(self, opcode_types: typing.Sequence[OpcodeType], args: typing.Sequence[int]):
+		self.opcode_types = opcode_types
+		self.args = args
+		self.frames: dict[int, Frame] = {}
+		self.active: set[int] = set()
+
+	def successors(self, pc: int, depth: int) -> list[tuple[int, int]]:
+		opcode_type = self.opcode_types[pc]
+		match opcode_type:
+			case OpcodeType.HALT | OpcodeType.RET:
+				return []
+			case OpcodeType.JMP:
+				return [(self.args[pc], depth)]
+			case OpcodeType.ZJMP | OpcodeType.NZJMP:
+				return [(self.args[pc], depth), (pc + 1, depth)]
+		return [(pc + 1, depth)]
+
+	def walk(self, entry: int) -> Frame:
+		if entry in self.frames:
+			return self.frames[entry]
+		if entry in self.active:
+			raise UnboundedStackError
+		self.active.add(entry)
+		depths = {entry: 0}
+		pending = [entry]
+		data_min = data_max = return_max = 0
+		data_net = None
+		enables_interrupts = False
+		while pending:
+			pc = pending.pop()
+			if not 0 <= pc < len(self.opcode_types):
+				raise UnboundedStackError
+			depth = depths[pc]
+			opcode_type = self.opcode_types[pc]
+			pops, pushes = stack_effects[opcode_type]
+			data_min = min(data_min, depth - pops)
+			depth += pushes - pops
+			data_max = max(data_max, depth)
+			successors = self.successors(pc, depth)
+			match opcode_type:
+				case OpcodeType.CALL:
+					callee = self.walk(self.args[pc])
+					data_min = min(data_min, depth + callee.data_min)
+					data_max = max(data_max, depth + callee.data_max)
+					return_max = max(return_max, 1 + callee.return_max)
+					enables_interrupts |= callee.enables_interrupts
+					successors = [] if callee.data_net is None else [(pc + 1, depth + callee.data_net)]
+				case OpcodeType.RET:
+					if data_net is not None and data_net != depth:
+						raise UnboundedStackError
+					data_net = depth
+				case OpcodeType.EI:
+					enables_interrupts = True
+			for successor, successor_depth in successors:
+				if successor not in depths:
+					depths[successor] = successor_depth
+					pending.append(successor)
+				elif depths[successor] != successor_depth:
+					raise UnboundedStackError
+		self.active.discard(entry)
+		frame = Frame(data_min, data_max, return_max, data_net, enables_interrupts)
+		self.frames[entry] = frame
+		return frame
+
+	def analyze(self) -> StackBounds | None:
+		try:
+			main = self.walk(0)
+			handler = self.walk(INTERRUPT_VECTOR) if len(self.opcode_types) > INTERRUPT_VECTOR else None
+		except UnboundedStackError:
+			return None
+		if handler is None:
+			handler = Frame(0, 0, 0, 0, False)
+		return StackBounds(
+			STACK_PTR_OFFSET + main.data_min,
+			STACK_PTR_OFFSET + main.data_max,
+			STACK_PTR_OFFSET + main.return_max,
+			handler.data_min,
+			handler.data_max,
+			handler.return_max,
+			handler.enables_interrupts,
+		)
+
+
+def analyze_stack(commands: list[dict]) -> StackBounds | None:
+	"""Stack bounds of a translated program, None if they cannot be proven.
+
+	Raises AssertionError if the program underflows or overflows a default-sized
+	stack before any interrupt.
+
+	>>> bounds = analyze_stack([{"index": 0, "command": "PUSH", "arg": 1}, {"index": 1, "command": "HALT"}])
+	>>> bounds.data_min, bounds.data_max, bounds.reentrant
+	(4, 5, False)
+	"""
+	size = max((int(command["index"]) + 1 for command in commands), default=0)
+	opcode_types = [OpcodeType.NOP] * size
+	args = [0] * size
+	for command in commands:
+		opcode_types[int(command["index"])] = OpcodeType(command["command"].lower())
+		args[int(command["index"])] = int(command.get("arg", 0))
+	bounds = StackAnalyzer(opcode_types, args).analyze()
+	if bounds is not None:
+		assert bounds.data_min >= 0, f"Data stack underflow: {bounds.data_min - STACK_PTR_OFFSET} cells"
+		assert bounds.data_max <= DEFAULT_STACK_SIZE, f"Data stack overflow: {bounds.data_max} cells"
+		assert bounds.return_max <= DEFAULT_STACK_SIZE, f"Return stack overflow: {bounds.return_max} cells"
+	return bounds
+
+
+def attached_bounds(code: list | ObjectImage) -> StackBounds | None:
+	# the translator stores proven bounds on the entry instruction or in an object section
+	if isinstance(code, ObjectImage):
+		payload = code.sections.get(STACK_BOUNDS_SECTION)
+		return None if payload is None else StackBounds(*json.loads(bytes(payload)))
+	if code and "stack" in code[0]:
+		return StackBounds(*code[0]["stack"])
+	return None
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import codecs
+import re
+import shlex
+import typing
+
+CHUNK_SIZE = 1 << 16
+# the whitespace set of shlex, which the translator used before
+WHITESPACE = " \t\r\n"
+
+# a word is a run of plain characters, escapes and quoted parts, as shlex in posix mode reads it;
+# the double-quoted part is an unrolled loop, a per-character alternation keeps a backtracking
+# frame for every character of a literal
+WORD = r"""(?:[^ \t\r\n"'\\]+|\\.|"[^"\\]*(?:\\.[^"\\]*)*"|'[^']*')+"""
+# groups: leading whitespace, plain word, word with quotes or escapes, unclosed quote or escape
+TOKEN = re.compile(
+	rf"""([ \t\r\n]*)(?:([^ \t\r\n"'\\]+)(?![^ \t\r\n])|({WORD})(?![^ \t\r\n])|([^ \t\r\n]))""", re.DOTALL
+)
+QUOTED_PART = re.compile(r"""[^"']+|"([^"]*)"|'([^']*)'""")
+
+
+class Token(typing.NamedTuple):
+	word: str
+	line: int
+	column: int
+
+
+def unquote(word: str) -> str:
+	# quotes are dropped as shlex does; escapes are left to shlex itself, newlines in a literal read as spaces
+	word = word.replace("\n", " ")
+	if "\\" in word:
+		return "".join(shlex.split(word, posix=True))
+	return "".join(part.group(part.lastindex or 0) for part in QUOTED_PART.finditer(word))
+
+
+def read_chunks(source: str | typing.IO | bytes | memoryview, chunk_size: int = CHUNK_SIZE) -> typing.Iterator[str]:
+	# accepts source text, a text or binary file, a mmap (it has read()) or a bytes-like buffer
+	if isinstance(source, str):
+		yield source
+		return
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	if not hasattr(source, "read"):
+		view = memoryview(source)
+		for start in range(0, len(view), chunk_size):
+			yield decoder.decode(view[start : start + chunk_size])
+		yield decoder.decode(b"", final=True)
+		return
+	while chunk := source.read(chunk_size):
+		yield chunk if isinstance(chunk, str) else decoder.decode(chunk)
+	yield decoder.decode(b"", final=True)
+
+
+def tokenize(source: str | typing.IO | bytes | memoryview, chunk_size: int = CHUNK_SIZE) -> typing.Iterator[Token]:
+	"""Splits Forth source into words with their 1-based line and column.
+
+	Input is read in chunks; a word cut by a chunk boundary waits for the next chunk.
+
+	>>> [tuple(token) for token in tokenize('1717 ." Hi there"\\n  dup')]
+	[('1717', 1, 1), ('. Hi there', 1, 6), ('dup', 2, 3)]
+	>>> import io
+	>>> [token.word for token in tokenize(io.BytesIO(b'a ." b c" d'), chunk_size=3)]
+	['a', '. b c', 'd']
+	>>> [token.word for token in tokenize(r'." say \\"hi\\"" x')]
+	['. say "hi"', 'x']
+	"""
+	chunks = read_chunks(source, chunk_size)
+	buffer, eof = "", False
+	line, line_start = 1, 0
+	while not eof:
+		chunk = next(chunks, None)
+		eof = chunk is None
+		buffer += chunk or ""
+		# only text up to the last whitespace is scanned: a word there cannot continue in the next chunk
+		end = len(buffer) if eof else max(buffer.rfind(char) for char in WHITESPACE)
+		pos = 0
+		for match in TOKEN.finditer(buffer, 0, max(end, 0)):
+			space, plain, quoted, bad = match.groups()
+			if "\n" in space:
+				line += space.count("\n")
+				line_start = match.start() + space.rfind("\n") + 1
+			if bad is not None:
+				pos = match.start(4)
+				assert not eof, f"No closing quotation at {line}:{pos - line_start + 1}"
+				break
+			start = match.end(1)
+			if plain is not None:
+				yield Token(plain, line, start - line_start + 1)
+			else:
+				yield Token(unquote(quoted), line, start - line_start + 1)
+				if "\n" in quoted:
+					line += quoted.count("\n")
+					line_start = start + quoted.rfind("\n") + 1
+			pos = match.end()
+		buffer = buffer[pos:]
+		line_start -= pos
@@ -1,16 +1,41 @@
 from __future__ import annotations
 
-import shlex
-import sys
-
-from codegen_utils import Terminal, codegen_opcodes
-from isa import Opcode, OpcodeParamType, OpcodeType, TermType, term_opcode_mapping, write_code, write_memory
-
-variables = {}
-functions = {}
-current_address = 0
-data_memory = [0] * 1024
-string_current_address = 0
+import argparse
+import json
+import typing
+
+from codegen_utils import Terminal, codegen_opcodes, codegen_string, store_string
+from compile_cache import DEFAULT_CACHE_SIZE, CompileCache
+from inliner import inline_words
+from isa import (
+	SOURCE_MAP_SECTION,
+	STACK_BOUNDS_SECTION,
+	Opcode,
+	OpcodeParam,
+	OpcodeParamType,
+	OpcodeType,
+	TermType,
+	encode_source_map,
+	term_opcode_mapping,
+	write_code,
+	write_link_map,
+	write_memory,
+	write_object,
+	write_source_map,
+)
+from optimizer import optimize
+from runtime_library import link_runtime
+from stack_analysis import analyze_stack
+from tokenizer import tokenize
+
+MAIN_DEFINITION = "<main>"
+
+# term streams: interrupt handlers are placed right after the entry jump, the rest follows
+HANDLER_STREAM = 0
+MAIN_STREAM = 1
+
+# (stream, index of the term in the stream)
+Label = tuple[int, int]
 
 
 def get_term(word: str) -> Terminal | None:
@@ -20,46 +45,11 @@ def get_term(word: str) -> Terminal | None:
 	return term_opcode_mapping[word]
 
 
-def create_bindings(terms: list[Terminal]):
-	for term in terms:
-		if term.term_type is None and not term.converted:
-			if term.word in variables:
-				term.word = str(variables[term.word])
-
-	for term in terms:
-		if term.term_type is None and not term.converted:
-			if term.word in functions.keys():
-				term.operand = functions[term.word]
-				term.term_type = TermType.CALL
-				term.word = "call"
-
-
-def fetch_ret_addresses(terms: list[Terminal]):
-	global functions
-	func_indexes = []
-
-	for term_index, term in enumerate(terms):
-		if term.term_type is TermType.DEF or term.term_type is TermType.DEF_INTR:
-			func_indexes.append(term.word_number)
-			func_name = terms[term_index + 1].word
-			functions[func_name] = term.word_number + 1
-			terms[term_index + 1].converted = True
-
-		if term.term_type == TermType.RET:
-			assert len(func_indexes) >= 1
-			function_term = terms[func_indexes.pop()]
-			function_term.operand = term.word_number + 1
-
-	assert len(func_indexes) == 0
-
+def stream_to_terms(source: str | typing.IO) -> typing.Iterator[Terminal]:
+	# parse words to terminals
+	tokens = (token for token in tokenize(source) if token.word)
 
-def stream_to_terms(source_code: str) -> list[Terminal]:
-	# split and parse to terminals
-	code_words = shlex.split(source_code.replace("\n", " "), posix=True)
-	code_words = list(filter(lambda x: len(x) > 0, code_words))
-	terms = [Terminal(0, TermType.ENTRYPOINT, "")]
-
-	for word_number, word in enumerate(code_words):
+	for word_number, (word, line, column) in enumerate(tokens):
 		# from mapping
 		term_type = get_term(word)
 
@@ -68,23 +58,7 @@ def stream_to_terms(source_code: str) -> list[Terminal]:
 			word = f'."{word[2:]}"'
 			term_type = TermType.STRING
 
-		terms.append(Terminal(word_number + 1, term_type, word))
-
-	return terms
-
-
-def validate_loops(terms: list[Terminal], begin: TermType, end: TermType, msg: str):
-	nested = []
-
-	for term in terms:
-		if term.term_type is begin:
-			nested.append(term.word_number)
-		if term.term_type == end:
-			assert len(nested) > 0, msg
-			term.operand = nested.pop()
-
-	# should have gone all down to zero
-	assert len(nested) == 0, msg
+		yield Terminal(word_number + 1, term_type, word, line, column)
 
 
 def fetch_opcode_addresses(term_opcodes: list[list[Opcode]]) -> list[Opcode]:
@@ -110,131 +84,400 @@ def fetch_opcode_addresses(term_opcodes: list[list[Opcode]]) -> list[Opcode]:
 	return result_opcodes
 
 
-def fetch_vars(terms: list[Terminal]):
-	global current_address
-
-	for term_index, term in enumerate(terms):
-		if term.term_type is TermType.VARIABLE:
-			variables[terms[term_index + 1].word] = current_address
-			current_address += 1
-			terms[term_index + 1].converted = True
-			if term_index + 3 < len(terms) and terms[term_index + 3].term_type is TermType.ALLOT:
-				fetch_allocates(terms, term_index + 3)
-
-
-def fetch_allocates(terms: list[Terminal], term_index: int):
-	global current_address
-	assert term_index + 3 < len(terms)
-
-	term = terms[term_index]
-
-	if term.term_type is TermType.ALLOT:
-		assert term_index - 3 >= 0
-		terms[term_index - 1].converted = True
-		allot_size = int(terms[term_index - 1].word)
-		current_address += allot_size
-
-
-def fetch_if_statement(terms: list[Terminal]):
-	nested_ifs = []
-
-	for term in terms:
-		if term.term_type is TermType.IF:
-			nested_ifs.append(term)
-		elif term.term_type is TermType.ELSE:
-			nested_ifs.append(term)
-		elif term.term_type is TermType.THEN:
-			last_if = nested_ifs.pop()
-
-			if last_if.term_type is TermType.ELSE:
-				last_else = last_if
-				last_if = nested_ifs.pop()
-				last_else.operand = term.word_number + 1
-				last_if.operand = last_else.word_number + 1
-			else:
-				last_if.operand = term.word_number + 1
-
-
-def handle_interruption_vectors(terms: list[Terminal]) -> list[Terminal]:
-	is_interrupt = False
-	interrupt_ret = 1
-	terms_interrupt_proc = []
-	terms_not_interrupt_proc = []
-
-	for term in terms[1:]:
-		if term.term_type is TermType.DEF_INTR:
-			is_interrupt = True
+def unmapped_entry(definition: str) -> dict:
+	# code with no source word: the final HALT and runtime library routines
+	return {"word_number": None, "line": None, "column": None, "word": "", "definition": definition}
+
+
+def build_source_map(terms: list[Terminal], term_opcodes: list[list[Opcode]]) -> list[dict]:
+	source_map = []
+	definition = MAIN_DEFINITION
+	for term_index, (term, opcodes) in enumerate(zip(terms, term_opcodes)):
+		if term_index > 0 and terms[term_index - 1].term_type in (TermType.DEF, TermType.DEF_INTR):
+			definition = term.word
+		for _ in opcodes:
+			source_map.append(
+				{
+					"word_number": term.word_number,
+					"line": term.line,
+					"column": term.column,
+					"word": term.word,
+					"definition": definition,
+				}
+			)
 		if term.term_type is TermType.RET:
-			if is_interrupt:
-				terms_interrupt_proc.append(term)
-				interrupt_ret = len(terms_interrupt_proc) + 1
-			else:
-				terms_not_interrupt_proc.append(term)
-			is_interrupt = False
-
-		if is_interrupt:
-			terms_interrupt_proc.append(term)
-		elif not is_interrupt and term.term_type is not TermType.RET:
-			terms_not_interrupt_proc.append(term)
-
-	# add jump to code
-	terms[0].operand = interrupt_ret
-
-	return [*[terms[0]], *terms_interrupt_proc, *terms_not_interrupt_proc]
-
-
-def terms_to_opcodes(terms: list[Terminal]) -> list[Opcode]:
-	global current_address
-	terms = handle_interruption_vectors(terms)
-	opcodes = []
-	for i in range(len(terms)):
-		opcode, current_address = codegen_opcodes(terms[i], string_current_address, data_memory)
-		opcodes.append(opcode)
-	opcodes = fetch_opcode_addresses(opcodes)
-	return [*opcodes, Opcode(OpcodeType.HALT, [])]
-
-
-def validate_terms(terms: list[Terminal]):
-	validate_loops(terms, TermType.WHILE, TermType.ENDWHILE, "Didnt close begin")
-
-	fetch_ret_addresses(terms)
-	fetch_vars(terms)
-	create_bindings(terms)
-	fetch_if_statement(terms)
-
-
-def translate(source_code: str) -> (list[dict], list):
-	global data_memory, current_address
-	current_address = 0
-	data_memory = [0] * 1024
-	terms = stream_to_terms(source_code)
-	validate_terms(terms)
-	opcodes = terms_to_opcodes(terms)
-	commands = []
-	for index, opcode in enumerate(opcodes):
-		command = {
-			"index": index,
-			"command": opcode.opcode_type.name,
+			definition = MAIN_DEFINITION
+	return source_map
+
+
+class Translator:
+	"""Single-pass translator; every instance owns its state, so translations can run in parallel.
+
+	Each word is code-generated as it is read. Whatever is not known yet is recorded and
+	backpatched once the source ends: branch targets and calls become (stream, index) labels
+	resolved to term indices, words are bound to variables (first) or procedures, and
+	string literals get their addresses after all variables.
+	"""
+
+	def __init__(
+		self,
+		optimized: bool = False,
+		memory_size: int = 1024,
+		shared_print: bool = False,
+		verify_stack: bool = False,
+	):
+		self.optimized = optimized
+		self.memory_size = memory_size
+		self.shared_print = shared_print
+		self.verify_stack = verify_stack
+		self.reset()
+
+	def reset(self) -> None:
+		self.variables: dict[str, int] = {}
+		# data cells of each variable, allot included
+		self.cells: dict[str, int] = {}
+		# (string literal, address, cells) in data memory order
+		self.string_symbols: list[tuple[str, int, int]] = []
+		self.functions: dict[str, Label] = {}
+		self.current_address = 0
+		self.data_memory = [0] * self.memory_size
+		self.terms: tuple[list[Terminal], list[Terminal]] = ([], [])
+		self.term_opcodes: tuple[list[list[Opcode]], list[list[Opcode]]] = ([], [])
+		self.stream = MAIN_STREAM
+		self.fixups: list[tuple[OpcodeParam, int, int]] = []
+		self.references: list[tuple[Terminal, Opcode]] = []
+		self.strings: tuple[list, list] = ([], [])
+		self.definitions: list[tuple[OpcodeParam | None, int]] = []
+		self.branches: list[OpcodeParam] = []
+		self.loops: list[Label] = []
+		self.naming: TermType | None = None
+
+	def here(self) -> Label:
+		return self.stream, len(self.terms[self.stream])
+
+	def emit(self, term: Terminal, opcodes: list[Opcode]) -> Label:
+		label = self.here()
+		self.terms[self.stream].append(term)
+		self.term_opcodes[self.stream].append(opcodes)
+		return label
+
+	def fixup(self, param: OpcodeParam, label: Label) -> None:
+		self.fixups.append((param, *label))
+
+	def feed(self, term: Terminal) -> None:
+		if self.naming is not None:
+			self.feed_name(term)
+			return
+		if term.term_type is TermType.DEF_INTR:
+			self.definitions.append((None, self.stream))
+			self.stream = HANDLER_STREAM
+			self.emit(term, [])
+			self.naming = TermType.DEF_INTR
+			return
+		if term.term_type is TermType.STRING:
+			opcodes = codegen_string(None, self.shared_print)
+			self.strings[self.stream].append((term, opcodes[0].params[0]))
+			self.emit(term, opcodes)
+			return
+		if term.term_type is None:
+			opcode = Opcode(OpcodeType.PUSH, [OpcodeParam(OpcodeParamType.CONST, term.word)])
+			self.references.append((term, opcode))
+			self.emit(term, [opcode])
+			return
+
+		opcodes = codegen_opcodes(term)
+		stream, index = self.emit(term, opcodes)
+		match term.term_type:
+			case TermType.DEF:
+				self.definitions.append((opcodes[0].params[0], stream))
+				self.naming = TermType.DEF
+			case TermType.VARIABLE:
+				self.naming = TermType.VARIABLE
+			case TermType.ALLOT:
+				self.feed_allot()
+			case TermType.RET:
+				assert self.definitions, f"Unbalanced ; at {term.line}:{term.column}"
+				param, self.stream = self.definitions.pop()
+				if param is not None:
+					# the jump over a procedure body lands right after its ;
+					self.fixup(param, (stream, index + 1))
+			case TermType.IF:
+				self.branches.append(opcodes[0].params[0])
+			case TermType.ELSE:
+				assert self.branches, f"Unbalanced else at {term.line}:{term.column}"
+				self.fixup(self.branches.pop(), (stream, index + 1))
+				self.branches.append(opcodes[0].params[0])
+			case TermType.THEN:
+				assert self.branches, f"Unbalanced then at {term.line}:{term.column}"
+				self.fixup(self.branches.pop(), (stream, index + 1))
+			case TermType.WHILE:
+				self.loops.append((stream, index))
+			case TermType.ENDWHILE:
+				assert self.loops, f"Didnt close begin at {term.line}:{term.column}"
+				self.fixup(opcodes[0].params[0], self.loops.pop())
+
+	def feed_name(self, term: Terminal) -> None:
+		# the word after ":", "interrupt" or "variable" names it and emits nothing
+		term.converted = True
+		label = self.emit(term, [])
+		if self.naming is TermType.VARIABLE:
+			self.variables[term.word] = self.current_address
+			self.cells[term.word] = 1
+			self.current_address += 1
+		else:
+			self.functions[term.word] = label
+		self.naming = None
+
+	def feed_allot(self) -> None:
+		# "variable name N allot" reserves N more cells after the variable
+		terms = self.terms[self.stream]
+		if len(terms) < 4 or terms[-4].term_type is not TermType.VARIABLE:
+			return
+		size = terms[-2]
+		size.converted = True
+		self.term_opcodes[self.stream][-2] = []
+		self.current_address += int(size.word)
+		self.cells[terms[-3].word] += int(size.word)
+
+	def bind_references(self) -> None:
+		for term, opcode in self.references:
+			if term.converted:
+				continue
+			if term.word in self.variables:
+				opcode.params[0].value = self.variables[term.word]
+			elif term.word in self.functions:
+				opcode.opcode_type = OpcodeType.CALL
+				opcode.params[0] = OpcodeParam(OpcodeParamType.UNDEFINED, None)
+				self.fixup(opcode.params[0], self.functions[term.word])
+
+	def place_strings(self) -> None:
+		# string literals are placed after variables, in program order
+		for stream in (HANDLER_STREAM, MAIN_STREAM):
+			for term, param in self.strings[stream]:
+				param.value = self.current_address
+				self.current_address = store_string(term, self.current_address, self.data_memory)
+				self.string_symbols.append((term.word, param.value, self.current_address - param.value))
+
+	def link(self) -> tuple[list[Terminal], list[list[Opcode]]]:
+		assert not self.definitions, "Unbalanced :"
+		assert not self.branches, "Didnt close if"
+		assert not self.loops, "Didnt close begin"
+		assert self.naming is None, "Missing name"
+		entry = Terminal(0, TermType.ENTRYPOINT, "")
+		entry_opcodes = codegen_opcodes(entry)
+		self.fixup(entry_opcodes[0].params[0], (MAIN_STREAM, 0))
+		self.bind_references()
+		self.place_strings()
+
+		offsets = (1, 1 + len(self.terms[HANDLER_STREAM]))
+		for param, stream, index in self.fixups:
+			param.param_type = OpcodeParamType.ADDR
+			param.value = offsets[stream] + index
+		terms = [entry, *self.terms[HANDLER_STREAM], *self.terms[MAIN_STREAM]]
+		term_opcodes = [entry_opcodes, *self.term_opcodes[HANDLER_STREAM], *self.term_opcodes[MAIN_STREAM]]
+		return terms, term_opcodes
+
+	def compact_data(self, terms: list[Terminal], term_opcodes: list[list[Opcode]]) -> None:
+		# variables no remaining code refers to lose their cells, strings of dropped code too;
+		# the rest is laid out again from address 0, variables first
+		used = {
+			term.word
+			for term, opcodes in zip(terms, term_opcodes)
+			if opcodes and term.term_type is None and term.word in self.variables
 		}
-		if len(opcode.params):
-			if isinstance(opcode.params[0].value, str) and opcode.params[0].value.isdigit():
-				command["arg"] = int(opcode.params[0].value)
+		self.variables = {name: address for name, address in self.variables.items() if name in used}
+		self.current_address = 0
+		for name in self.variables:
+			self.variables[name] = self.current_address
+			self.current_address += self.cells[name]
+		self.data_memory = [0] * self.memory_size
+		self.string_symbols = []
+		placed = {}
+		for term, opcodes in zip(terms, term_opcodes):
+			if opcodes and term.term_type is TermType.STRING:
+				# inlined copies share the term, and the literal
+				if id(term) not in placed:
+					placed[id(term)] = self.current_address
+					self.current_address = store_string(term, self.current_address, self.data_memory)
+					self.string_symbols.append((term.word, placed[id(term)], self.current_address - placed[id(term)]))
+				opcodes[0].params[0].value = placed[id(term)]
+			elif opcodes and term.term_type is None and term.word in self.variables:
+				opcodes[0].params[0].value = self.variables[term.word]
+
+	def link_map(self, source_map: list[dict]) -> list[dict]:
+		"""Final addresses and sizes: code runs by definition, then variables and strings."""
+		link_map = []
+		for entry in source_map:
+			if link_map and link_map[-1]["name"] == entry["definition"]:
+				link_map[-1]["size"] += 1
 			else:
-				command["arg"] = opcode.params[0].value
-		commands.append(command)
-	return commands, data_memory
-
-
-def main(source_file: str, target_file: str, mem_out: str) -> None:
-	global data_memory
-	with open(source_file, encoding="utf-8") as f:
-		source_code = f.read()
-	code, data_memory = translate(source_code)
+				link_map.append({"section": "code", "name": entry["definition"], "address": entry["index"], "size": 1})
+		symbols = [(name, address, self.cells[name]) for name, address in self.variables.items()]
+		for name, address, size in sorted([*symbols, *self.string_symbols], key=lambda symbol: symbol[1]):
+			link_map.append({"section": "data", "name": name, "address": address, "size": size})
+		return link_map
+
+	def translate_program(
+		self, source_code: str | typing.IO, mapped: bool = True
+	) -> (list[dict], list, list[dict] | None):
+		# the source map holds a record per opcode, so it is only built when asked for
+		self.reset()
+		for term in stream_to_terms(source_code):
+			self.feed(term)
+		terms, term_opcodes = self.link()
+		if self.optimized:
+			terms, term_opcodes = inline_words(terms, term_opcodes, 1 + len(self.terms[HANDLER_STREAM]))
+			self.compact_data(terms, term_opcodes)
+			term_opcodes = optimize(term_opcodes)
+		source_map = build_source_map(terms, term_opcodes) if mapped else None
+		opcodes = fetch_opcode_addresses(term_opcodes)
+		opcodes, routines = link_runtime([*opcodes, Opcode(OpcodeType.HALT, [])])
+		if mapped:
+			source_map.append(unmapped_entry(MAIN_DEFINITION))
+			# runtime routines are appended back to back after HALT
+			starts = sorted(routines.items(), key=lambda item: item[1])
+			for (name, address), end in zip(starts, [address for _, address in starts[1:]] + [len(opcodes)]):
+				definition = f"<runtime:{name}>"
+				source_map += [unmapped_entry(definition) for _ in range(address, end)]
+			for index, entry in enumerate(source_map):
+				entry["index"] = index
+
+		commands = []
+		for index, opcode in enumerate(opcodes):
+			command = {
+				"index": index,
+				"command": opcode.opcode_type.name,
+			}
+			if len(opcode.params):
+				if isinstance(opcode.params[0].value, str) and opcode.params[0].value.isdigit():
+					command["arg"] = int(opcode.params[0].value)
+				else:
+					command["arg"] = opcode.params[0].value
+			commands.append(command)
+		if self.verify_stack:
+			# rejects provable underflow; proven bounds let the machine drop its stack checks
+			bounds = analyze_stack(commands)
+			if bounds is not None:
+				commands[0]["stack"] = list(bounds)
+		return commands, self.data_memory, source_map
+
+	def translate(self, source_code: str | typing.IO) -> (list[dict], list):
+		commands, memory, _ = self.translate_program(source_code, mapped=False)
+		return commands, memory
+
+
+def translate(
+	source_code: str | typing.IO,
+	optimized: bool = False,
+	memory_size: int = 1024,
+	shared_print: bool = False,
+	verify_stack: bool = False,
+) -> (list[dict], list):
+	return Translator(optimized, memory_size, shared_print, verify_stack).translate(source_code)
+
+
+def translate_program(
+	source_code: str | typing.IO,
+	optimized: bool = False,
+	memory_size: int = 1024,
+	shared_print: bool = False,
+	verify_stack: bool = False,
+) -> (list[dict], list, list[dict]):
+	return Translator(optimized, memory_size, shared_print, verify_stack).translate_program(source_code)
+
+
+def translate_cached(
+	source: bytes,
+	cache: CompileCache,
+	optimized: bool = False,
+	memory_size: int = 1024,
+	shared_print: bool = False,
+	verify_stack: bool = False,
+) -> (list[dict], list, list[dict]):
+	# a hit skips tokenization and codegen
+	options = {"optimized": optimized, "memory_size": memory_size, "shared_print": shared_print}
+	if verify_stack:
+		# only set when used, so keys of plain translations stay as they were
+		options["verify_stack"] = True
+	key = cache.key(source, options)
+	result = cache.get(key)
+	if result is None:
+		result = translate_program(source.decode("utf-8"), optimized, memory_size, shared_print, verify_stack)
+		cache.put(key, *result)
+	return result
+
+
+def main(
+	source_file: str,
+	target_file: str,
+	mem_out: str,
+	optimized: bool = False,
+	object_file: str | None = None,
+	memory_size: int = 1024,
+	shared_print: bool = False,
+	source_map_file: str | None = None,
+	cache_dir: str | None = None,
+	cache_size: int = DEFAULT_CACHE_SIZE,
+	verify_stack: bool = False,
+	link_map_file: str | None = None,
+) -> None:
+	translator = Translator(optimized, memory_size, shared_print, verify_stack)
+	# the cache keeps no symbol table, so a link map needs a fresh translation
+	if cache_dir is not None and link_map_file is None:
+		with open(source_file, "rb") as f:
+			source = f.read()
+		cache = CompileCache(cache_dir, cache_size)
+		code, data_memory, source_map = translate_cached(
+			source, cache, optimized, memory_size, shared_print, verify_stack
+		)
+	else:
+		with open(source_file, encoding="utf-8") as f:
+			code, data_memory, source_map = translator.translate_program(f)
 	write_code(target_file, code)
 	write_memory(mem_out, data_memory)
+	if object_file is not None:
+		sections = {SOURCE_MAP_SECTION: encode_source_map(source_map)}
+		if "stack" in code[0]:
+			sections[STACK_BOUNDS_SECTION] = json.dumps(code[0]["stack"]).encode("ascii")
+		write_object(object_file, code, data_memory, sections)
+	if source_map_file is not None:
+		write_source_map(source_map_file, source_map)
+	if link_map_file is not None:
+		write_link_map(link_map_file, translator.link_map(source_map))
 
 
 if __name__ == "__main__":
-	assert len(sys.argv) == 4, "Wrong arguments: translator.py <input_file> <target_file> <mem_out>"
-	_, source, target, mem_out = sys.argv
-	main(source, target, mem_out)
+	parser = argparse.ArgumentParser(description="Forth to stack machine translator")
+	parser.add_argument("input_file")
+	parser.add_argument("target_file")
+	parser.add_argument("mem_out")
+	parser.add_argument(
+		"-O",
+		"--optimize",
+		action="store_true",
+		help="inline words, turn tail calls into jumps, drop unreachable words and unused variables, "
+		"re-lay out data memory (string and variable addresses change), then peephole and superinstructions",
+	)
+	parser.add_argument("--object", default=None, help="also write a binary program object")
+	parser.add_argument("--memory-size", type=int, default=1024, help="data memory image size in cells")
+	parser.add_argument("--runtime-library", action="store_true", help="print strings through a shared routine")
+	parser.add_argument("--source-map", default=None, help="write the pc -> source word map for the profiler")
+	parser.add_argument("--cache", default=None, help="directory of the compile cache")
+	parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="compile cache limit in bytes")
+	parser.add_argument("--verify-stack", action="store_true", help="prove stack bounds, reject underflow")
+	parser.add_argument("--link-map", default=None, help="write final code and data addresses and sizes")
+	args = parser.parse_args()
+	main(
+		args.input_file,
+		args.target_file,
+		args.mem_out,
+		args.optimize,
+		args.object,
+		args.memory_size,
+		args.runtime_library,
+		args.source_map,
+		args.cache,
+		args.cache_size,
+		args.verify_stack,
+		args.link_map,
+	)